@@ -0,0 +1,418 @@
+"""Mät simulatorns heta vägar och spara resultatet som JSON.
+
+    python benchmarks/hotpaths.py --out v1.6.json
+    python benchmarks/hotpaths.py --compare v1.6.json --max-slowdown 1.25
+    xvfb-run python benchmarks/hotpaths.py --filter update_plot
+
+Kärnfallen (Process.step, PID.step, OnOffController.step, motorn,
+simuleringstrådens block och exporten) körs utan tkinter. Graffallen
+(PlotView.update med blitting och med omritning, draw_full och markören
+Crosshair vid 10^3/10^4/10^5 sampel) ritar på en Agg-canvas och kräver
+ingen display, så de kan köras i CI. GUI-fallen (en hämtning från
+simuleringstråden, update_plot, musrörelse med tooltip samt export_data)
+bygger hela PIDSimulatorApp och kräver en display, t.ex. Xvfb; finns ingen
+markeras de som överhoppade i resultatet.
+
+Varje fall mäts med timeit: antalet anrop per mätning väljs så att en
+mätning tar minst --min-time sekunder, och median och minimum av --repeat
+mätningar rapporteras per anrop. Med --compare jämförs medianerna med en
+tidigare resultatfil och slutkoden blir 1 om något fall blivit mer än
+--max-slowdown gånger långsammare.
+"""
+import argparse
+import datetime
+import itertools
+import json
+import os
+import platform
+import re
+import statistics
+import subprocess
+import sys
+import tempfile
+import timeit
+
+ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+sys.path.insert(0, ROOT)
+
+import matplotlib
+import numpy as np
+
+from export import export_columns
+from history import History
+from simulation import OnOffController, PID, Process, SimulationEngine
+from worker import SimulationWorker
+
+PLOT_SIZES = (10 ** 3, 10 ** 4, 10 ** 5)
+EXPORT_ROWS = 10 ** 5
+
+
+def make_engine(**process):
+    """Samma krets som GUI:ts standardläge (PID, K=2, T=15, dötid 3)"""
+    settings = dict(K=2.0, T=15.0, dead_time=3.0, normalvarde=23.0, matområde_min=-10.0, matområde_max=120.0)
+    settings.update(process)
+    return SimulationEngine(Process(**settings), PID(Kp=2.0, Ti=10.0, Td=1.0), setpoint=50.0)
+
+
+def simulated_rows(n):
+    """n sampel (rader i History.fields-ordning) från en körning med brus"""
+    engine = make_engine()
+    engine.noise_std = 0.3
+    result = engine.run(n - 1)
+    return np.column_stack([getattr(result, name) for name in History.fields])
+
+
+# --- Fall: namn -> (förberedelse, steg per anrop). Förberedelsen returnerar funktionen som mäts ---
+
+def core_cases():
+    cases = {}
+    processes = {
+        'självreglerande': dict(),
+        'integrerande': dict(integrerande=True, K=0.05, Fout=1.0),
+        'enhetslös K': dict(enhetslös_K=True),
+        'lång dötid': dict(dead_time=500.0),
+        'ZOH': dict(discretization='zoh'),
+    }
+    for name, settings in processes.items():
+        def process_step(settings=settings):
+            process = make_engine(**settings).process
+            return lambda: process.step(40.0, 1.0)
+        cases[f'Process.step[{name}]'] = (process_step, 1)
+
+    for antiwindup in (True, False):
+        def pid_step(antiwindup=antiwindup):
+            pid = PID(Kp=2.0, Ti=10.0, Td=1.0)
+            # Växlande fel så att utsignalen både mättas och ligger inom gränserna
+            pvs = itertools.cycle([45.0, 110.0, 30.0, 53.0])
+            return lambda: pid.step(50.0, next(pvs), 0.0, 100.0, antiwindup=antiwindup)
+        cases[f"PID.step[{'antiwindup' if antiwindup else 'utan antiwindup'}]"] = (pid_step, 1)
+
+    def onoff_step():
+        onoff = OnOffController()
+        pvs = itertools.cycle([45.0, 49.0, 51.0, 55.0])
+        return lambda: onoff.step(50.0, next(pvs))
+    cases['OnOffController.step'] = (onoff_step, 1)
+
+    cases['SimulationEngine.step'] = (lambda: make_engine().step, 1)
+
+    def python_run():
+        engine = make_engine()
+        engine.use_kernel = False
+        return lambda: engine.run(10 ** 4)
+    cases['SimulationEngine.run[python, 10^4]'] = (python_run, 10 ** 4)
+    from kernels import NUMBA
+    if NUMBA:
+        def compiled_run():
+            engine = make_engine()
+            engine.use_kernel = True
+            engine.run(10)  # Kompilera (eller läs cachen) före mätningen
+            return lambda: engine.run(10 ** 6)
+        cases['SimulationEngine.run[numba, 10^6]'] = (compiled_run, 10 ** 6)
+
+    def worker_block():
+        worker = SimulationWorker(make_engine())
+
+        def block():
+            worker._step_block(1000)  # Tråden väntar på kommandon - blocket räknas i mättråden
+            worker.batches.clear()
+        return block
+    cases['SimulationWorker block[1000]'] = (worker_block, 1000)
+
+    for ext in ('.csv', '.npz'):
+        def export(ext=ext):
+            rows = simulated_rows(EXPORT_ROWS)
+            columns = {name: rows[:, k] for k, name in enumerate(History.fields)}
+            path = os.path.join(tempfile.mkdtemp(prefix='pid-bench-'), 'export' + ext)
+            return lambda: export_columns(path, columns, decimals=(1, 2, 2, 2, 2, 2, 2))
+        cases[f'export_columns[{ext}, 10^5]'] = (export, None)
+    return cases
+
+
+def plot_data(n):
+    """Plotdata för n sampel som PIDSimulatorApp.collect_plot_data i PID-läge (Kp=2, Ti=10, Td=1)"""
+    rows = simulated_rows(n)
+    t, y, u, e, i, d, sp = rows.T
+    kp, ti, td = 2.0, 10.0, 1.0
+    p_vals, i_vals, d_vals = kp * e, kp / ti * i, -kp * td * d
+    sum_vals = p_vals + i_vals + d_vals
+    contributions = np.concatenate([p_vals, i_vals, d_vals])
+    return {
+        't': t, 'y': y, 'sp': sp, 'u': u, 'x_window': None,
+        'y_limits': (-10.0, 120.0), 'y_label': 'Processvärde (°C)', 'sp_label': 'Börvärde (°C)',
+        'hyst_upper': None, 'hyst_lower': None,
+        'mode': 'pid', 'u_label': 'PID-ut (begränsad)', 'u_ylabel': 'Styrsignal (%)',
+        'sum': sum_vals, 'p': p_vals, 'i': i_vals, 'd': d_vals,
+        'v_range': (np.min(contributions), np.max(contributions)), 'v_ylabel': 'PID-bidrag (°C)',
+        'u_range': (np.nanmin(np.concatenate([u, sum_vals])), np.nanmax(np.concatenate([u, sum_vals]))),
+    }
+
+
+def agg_figure():
+    """Figur med GUI:ts tre grafer på en Agg-canvas (ingen display behövs)"""
+    from matplotlib.backends.backend_agg import FigureCanvasAgg
+    from matplotlib.figure import Figure
+    fig = Figure(figsize=(7, 6))
+    axs = fig.subplots(3, 1, sharex=True)
+    return fig, axs, FigureCanvasAgg(fig)
+
+
+def plot_cases():
+    """Grafritningens heta vägar på en Agg-canvas (samma kod som GUI:t, utan tkinter-fönster)"""
+    from plotting import Crosshair, PlotView, nearest_index
+    from profiler import NO_PROFILER
+    cases = {}
+    for n in PLOT_SIZES:
+        size = f"10^{len(str(n)) - 1}"
+
+        def blit(n=n):
+            view = PlotView(*agg_figure())
+            data = plot_data(n)
+            view.update(data)  # Första anropet ritar axlarna; därefter bara kurvorna
+            return lambda: view.update(data)
+        cases[f'PlotView.update[blit, {size}]'] = (blit, None)
+
+        def redraw(n=n):
+            view = PlotView(*agg_figure())
+            data = plot_data(n)
+
+            def update():
+                view.invalidate()
+                view.update(data)
+            return update
+        cases[f'PlotView.update[omritning, {size}]'] = (redraw, None)
+
+        def full(n=n):
+            import types
+            import main
+            fig, axs, canvas = agg_figure()
+            # draw_full använder bara figuren, axlarna, canvas och profileraren
+            holder = types.SimpleNamespace(fig=fig, axs=axs, canvas=canvas, profiler=NO_PROFILER)
+            data = plot_data(n)
+            return lambda: main.PIDSimulatorApp.draw_full(holder, data)
+        cases[f'draw_full[{size}]'] = (full, None)
+
+    def crosshair():
+        fig, axs, canvas = agg_figure()
+        view = PlotView(fig, axs, canvas)
+        data = plot_data(10 ** 4)
+        view.update(data)
+        marker = Crosshair(fig, axs, canvas)
+        t = data['t']
+        positions = itertools.cycle(np.linspace(t[0], t[-1], 64))
+
+        def move():
+            # Som update_hover: närmaste sampel och markören flyttad med blitting
+            marker.show(t[nearest_index(t, next(positions))])
+        return move
+    cases['Crosshair.show[10^4]'] = (crosshair, None)
+    return cases
+
+
+def fill_history(app, n):
+    """Lägg n simulerade sampel i appens historik och rita om från början"""
+    rows = simulated_rows(n)
+    app.history.set_max_length(None)
+    app.history.clear()
+    app.history.extend(rows)
+    app.rebuild_metrics()
+    app.current_step = n - 1
+    if app.plot_view is not None:
+        app.plot_view.invalidate()
+
+
+def gui_cases(app):
+    """Fallen som kräver PIDSimulatorApp (app används först när ett fall förbereds)"""
+    cases = {}
+    for n in (1, 5000):
+        def drain(n=n):
+            from worker import Batch
+            fill_history(app, 1)
+            app.history.set_max_length(20000)  # Historiken rullar så att minnet inte växer under mätningen
+            rows = simulated_rows(n + 1)[1:]
+            last = tuple(rows[-1, 1:6])
+
+            def tick():
+                worker = app.worker
+                worker.batches.append(Batch(worker.generation, worker.requested, rows, app.current_step + n, last))
+                app.drain_worker()
+            return tick
+        cases[f'drain_worker[{n} sampel]'] = (drain, n)
+
+    for n in PLOT_SIZES:
+        for fast in (True, False):
+            def plot(n=n, fast=fast):
+                app.fast_plot_var.set(fast)
+                fill_history(app, n)
+                app.update_plot()
+
+                def redraw():
+                    if app.plot_view is not None:
+                        app.plot_view.invalidate()
+                    app.update_plot()
+                return redraw
+            cases[f"update_plot[{'snabb' if fast else 'full'}, 10^{len(str(n)) - 1}]"] = (plot, None)
+
+    def mouse():
+        from matplotlib.backend_bases import MouseEvent
+        app.fast_plot_var.set(True)
+        fill_history(app, 10 ** 4)
+        app.update_plot()
+        bbox = app.axs[0].bbox
+        positions = itertools.cycle([
+            MouseEvent('motion_notify_event', app.canvas, bbox.x0 + f * bbox.width, bbox.y0 + bbox.height / 2)
+            for f in np.linspace(0.05, 0.95, 64)])
+
+        def move():
+            app.on_mouse_move(next(positions))
+            # Det som timern annars kör högst en gång per hover_interval ms
+            app.root.after_cancel(app._hover_id)
+            app.update_hover()
+        return move
+    cases['on_mouse_move + update_hover[10^4]'] = (mouse, None)
+
+    def export():
+        import tkinter.filedialog
+        import tkinter.messagebox
+        fill_history(app, EXPORT_ROWS)
+        path = os.path.join(tempfile.mkdtemp(prefix='pid-bench-'), 'export.csv')
+        # Dialogerna ersätts under mätningen
+        tkinter.filedialog.asksaveasfilename = lambda **kwargs: path
+        tkinter.messagebox.showinfo = lambda *args, **kwargs: None
+        tkinter.messagebox.showerror = lambda title, message: print(message, file=sys.stderr)
+        return app.export_data
+    cases['export_data[.csv, 10^5]'] = (export, None)
+    return cases
+
+
+def build_app():
+    """Skapa PIDSimulatorApp i ett fönster. Returnerar (root, app) eller (None, orsak)"""
+    import tkinter as tk
+    try:
+        root = tk.Tk()
+    except tk.TclError as e:
+        return None, str(e)
+    import main
+    app = main.PIDSimulatorApp(root)
+    root.update()
+    return root, app
+
+
+# --- Mätning ---
+
+def measure(function, repeat, min_time):
+    """Tid per anrop (median och minimum av repeat mätningar)"""
+    timer = timeit.Timer(function)
+    number, elapsed = timer.autorange()
+    number = max(1, int(number * min_time / max(elapsed, 1e-9))) if elapsed < min_time else number
+    times = [t / number for t in timer.repeat(repeat=repeat, number=number)]
+    return {'median_s': statistics.median(times), 'min_s': min(times), 'number': number, 'repeat': repeat}
+
+
+def run_case(case, repeat, min_time):
+    prepare, steps = case
+    result = measure(prepare(), repeat, min_time)
+    if steps:
+        result['steps_per_s'] = steps / result['median_s']
+    return result
+
+
+def environment():
+    """Versioner och maskin, så att resultat från olika versioner kan jämföras"""
+    try:
+        commit = subprocess.run(['git', 'rev-parse', '--short', 'HEAD'], cwd=ROOT, capture_output=True,
+                                text=True).stdout.strip() or None
+    except OSError:
+        commit = None
+    try:
+        import numba
+        numba_version = numba.__version__
+    except ImportError:
+        numba_version = None
+    return {
+        'date': datetime.datetime.now().isoformat(timespec='seconds'),
+        'commit': commit,
+        'python': platform.python_version(),
+        'numpy': np.__version__,
+        'matplotlib': matplotlib.__version__,
+        'numba': numba_version,
+        'platform': platform.platform(),
+        'processor': platform.processor() or platform.machine(),
+        'cpu_count': os.cpu_count(),
+    }
+
+
+def format_time(seconds):
+    for unit, scale in (('s', 1.0), ('ms', 1e-3), ('µs', 1e-6)):
+        if seconds >= scale:
+            return f"{seconds / scale:.3g} {unit}"
+    return f"{seconds / 1e-9:.3g} ns"
+
+
+def compare(results, baseline, max_slowdown):
+    """Skriv kvoten mot baslinjen per fall. Returnerar namnen på fall som blivit för långsamma"""
+    slower = []
+    for name, result in results.items():
+        old = baseline.get('results', {}).get(name)
+        if not old or 'median_s' not in result or 'median_s' not in old:
+            continue
+        ratio = result['median_s'] / old['median_s']
+        flag = '  <- långsammare' if ratio > max_slowdown else ''
+        print(f"{name:45s} {format_time(old['median_s']):>10s} -> {format_time(result['median_s']):>10s}"
+              f"  x{ratio:.2f}{flag}", file=sys.stderr)
+        if ratio > max_slowdown:
+            slower.append(name)
+    return slower
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description='Mätningar av PID-simulatorns heta vägar')
+    parser.add_argument('--repeat', type=int, default=5, help='Antal mätningar per fall (median rapporteras)')
+    parser.add_argument('--min-time', type=float, default=0.2, help='Minsta tid per mätning (s)')
+    parser.add_argument('--filter', help='Kör bara fall vars namn matchar detta reguljära uttryck')
+    parser.add_argument('--no-gui', action='store_true', help='Hoppa över fallen som kräver en display')
+    parser.add_argument('--out', help='Skriv resultatet som JSON till denna fil')
+    parser.add_argument('--compare', help='Jämför med en tidigare resultatfil')
+    parser.add_argument('--max-slowdown', type=float, default=1.25,
+                        help='Slutkod 1 om något fall är mer än så många gånger långsammare än --compare')
+    args = parser.parse_args(argv)
+    selected = re.compile(args.filter) if args.filter else None
+
+    cases = core_cases()
+    cases.update(plot_cases())
+    skipped = '--no-gui' if args.no_gui else None
+    root = app = None
+    if not args.no_gui:
+        root, app = build_app()
+        if root is None:
+            skipped = f"ingen display ({app})"
+    cases.update(gui_cases(app))
+    results = {}
+    for name, case in cases.items():
+        if selected and not selected.search(name):
+            continue
+        if skipped and name in gui_cases(None):
+            results[name] = {'skipped': skipped}
+            continue
+        print(f"{name} ...", file=sys.stderr)
+        results[name] = run_case(case, max(1, args.repeat), args.min_time)
+    if root is not None:
+        app.worker.stop()
+        root.destroy()
+
+    summary = {'environment': environment(), 'results': results}
+    print(json.dumps(summary, indent=2, ensure_ascii=False))
+    if args.out:
+        with open(args.out, 'w', encoding='utf-8') as f:
+            json.dump(summary, f, indent=2, ensure_ascii=False)
+    if args.compare:
+        with open(args.compare, encoding='utf-8') as f:
+            baseline = json.load(f)
+        slower = compare(results, baseline, args.max_slowdown)
+        if slower:
+            print(f"Regression: {', '.join(slower)}", file=sys.stderr)
+            return 1
+    return 0
+
+
+if __name__ == '__main__':
+    sys.exit(main())
@@ -0,0 +1,78 @@
+"""Mät starttiden för GUI:t (tid till första ritade bild).
+
+Varje mätning körs i en ny Python-process så att importerna är kalla:
+
+    python benchmarks/startup.py --repeat 5 --max-seconds 3
+
+Skriver medianvärden som JSON (import, konstruktion av PIDSimulatorApp,
+första bild och total tid inklusive interpreterstart). Med --max-seconds
+blir slutkoden 1 om tiden till första bild överskrider gränsen, så att
+regressioner fångas i CI. Kräver en display (t.ex. Xvfb på Linux).
+"""
+import argparse
+import json
+import os
+import statistics
+import subprocess
+import sys
+import time
+
+ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+
+# Körs i barnprocessen: tider räknas från att interpretern kör första raden
+CHILD = r"""
+import json, sys, time
+t0 = time.perf_counter()
+sys.path.insert(0, sys.argv[1])
+import main
+t_import = time.perf_counter()
+root = main.tk.Tk()
+app = main.PIDSimulatorApp(root)
+t_init = time.perf_counter()
+root.update()  # Fönstret mappas och första bilden ritas
+t_frame = time.perf_counter()
+root.destroy()
+print(json.dumps({'import_s': t_import - t0, 'init_s': t_init - t_import, 'first_frame_s': t_frame - t0}))
+"""
+
+
+def measure_once():
+    """En mätning i en ny process. Returnerar dict med tider i sekunder"""
+    start = time.perf_counter()
+    proc = subprocess.run([sys.executable, '-c', CHILD, ROOT], cwd=ROOT,
+                          capture_output=True, text=True)
+    total = time.perf_counter() - start
+    if proc.returncode != 0:
+        raise RuntimeError(proc.stderr.strip().splitlines()[-1] if proc.stderr.strip() else 'okänt fel')
+    result = json.loads(proc.stdout.strip().splitlines()[-1])
+    result['total_s'] = total
+    return result
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description='Starttid för PID-simulatorn (tid till första bild)')
+    parser.add_argument('--repeat', type=int, default=5, help='Antal mätningar (median rapporteras)')
+    parser.add_argument('--max-seconds', type=float, help='Gräns för tid till första bild')
+    parser.add_argument('--out', help='Skriv resultatet som JSON till denna fil')
+    args = parser.parse_args(argv)
+
+    try:
+        runs = [measure_once() for _ in range(max(1, args.repeat))]
+    except RuntimeError as e:
+        print(f"Fel: kunde inte starta GUI:t ({e})", file=sys.stderr)
+        return 2
+    summary = {key: statistics.median(run[key] for run in runs) for key in runs[0]}
+    summary['repeat'] = len(runs)
+    print(json.dumps(summary, indent=2))
+    if args.out:
+        with open(args.out, 'w', encoding='utf-8') as f:
+            json.dump(summary, f, indent=2)
+    if args.max_seconds is not None and summary['first_frame_s'] > args.max_seconds:
+        print(f"Regression: första bild efter {summary['first_frame_s']:.2f} s "
+              f"(gräns {args.max_seconds:.2f} s)", file=sys.stderr)
+        return 1
+    return 0
+
+
+if __name__ == '__main__':
+    sys.exit(main())
@@ -0,0 +1,225 @@
+"""Kommandoradsläge: kör simuleringen headless utan tkinter och matplotlib.
+
+    python main.py run --kp 2 --ti 10 --td 1 --K 2 --T 15 --dead 3 --steps 100000 --out run.parquet
+    python main.py montecarlo --kp 2 --ti 10 --noise 0.5 --runs 1000 --steps 2000 --out band.npz
+    python main.py tune --K 2 --T 15 --dead 3 --steps 500 --criterion itae --overshoot-max 10
+    python main.py serve --port 8765
+
+Resultatet skrivs till --out (format efter filändelse: .parquet, .feather,
+.npz eller .csv) och prestandamåtten skrivs som JSON till stdout (och till
+--kpi om angivet). Parquet och Feather kräver det valfria paketet pyarrow.
+"""
+import argparse
+import json
+import os
+import sys
+
+import numpy as np
+
+from simulation import JIT_VARIABLE, Process, PID, SimulationEngine
+from metrics import step_metrics
+from export import write_table
+
+OUTPUT_FORMATS = ('.parquet', '.feather', '.npz', '.csv')
+
+
+def build_parser():
+    parser = argparse.ArgumentParser(prog='main.py', description='PID-simulator')
+    commands = parser.add_subparsers(dest='command', required=True)
+
+    run = commands.add_parser('run', help='Kör en simulering headless och skriv resultat och prestandamått')
+    add_loop_arguments(run)
+    run.set_defaults(func=cmd_run)
+
+    mc = commands.add_parser('montecarlo', help='Kör många realiseringar med olika brusfrön')
+    add_loop_arguments(mc)
+    mc.add_argument('--runs', type=int, default=100, help='Antal realiseringar')
+    mc.add_argument('--workers', type=int, default=None, help='Antal arbetsprocesser (standard: alla kärnor)')
+    mc.add_argument('--pulse', type=float, nargs=3, metavar=('START', 'STORLEK', 'STEG'),
+                    help='Pulsstörning på PV från steg START')
+    mc.set_defaults(func=cmd_montecarlo)
+
+    tune = commands.add_parser('tune', help='Sök Kp/Ti/Td som minimerar en kostnad (Nelder-Mead)')
+    add_loop_arguments(tune)
+    tune.add_argument('--tune', nargs='+', choices=('Kp', 'Ti', 'Td'), default=['Kp', 'Ti', 'Td'],
+                      help='Parametrar att trimma (övriga hålls fasta)')
+    tune.add_argument('--criterion', choices=('itae', 'iae', 'ise'), default='itae', help='Felkriterium')
+    tune.add_argument('--overshoot-max', type=float, default=None, help='Högsta tillåtna översläng (%%)')
+    tune.add_argument('--overshoot-penalty', type=float, default=1.0, help='Straff per procentenhet över gränsen')
+    tune.add_argument('--effort-weight', type=float, default=0.0, help='Vikt för styrinsats (total variation i u)')
+    tune.add_argument('--max-evals', type=int, default=400, help='Högsta antal kostnadsberäkningar')
+    tune.set_defaults(func=cmd_tune)
+
+    serve = commands.add_parser('serve', help='Starta en lokal HTTP/JSON-server för headless sessioner')
+    serve.add_argument('--host', default='127.0.0.1', help='Adress att lyssna på')
+    serve.add_argument('--port', type=int, default=8765, help='Port att lyssna på')
+    serve.add_argument('--workers', type=int, default=None, help='Antal trådar för stegningen (standard: alla kärnor)')
+    add_jit_argument(serve)
+    serve.set_defaults(func=cmd_serve)
+    return parser
+
+
+def add_loop_arguments(parser):
+    """Gemensamma argument för reglerkretsen (process, regulator, körning och utdata)"""
+    parser.add_argument('--kp', type=float, default=1.0, help='Förstärkning Kp')
+    parser.add_argument('--ti', type=float, default=10.0, help='Integraltid Ti (0 = ingen I-verkan)')
+    parser.add_argument('--td', type=float, default=0.0, help='Derivatatid Td')
+    parser.add_argument('--K', type=float, default=1.0, help='Processförstärkning K')
+    parser.add_argument('--T', type=float, default=10.0, help='Tidskonstant T')
+    parser.add_argument('--dead', type=float, default=2.0, help='Dötid')
+    parser.add_argument('--steps', type=int, default=1000, help='Antal simuleringssteg')
+    parser.add_argument('--dt', type=float, default=1.0, help='Tidssteg')
+    parser.add_argument('--sp', type=float, default=50.0, help='Börvärde i fysiska enheter')
+    parser.add_argument('--nv', type=float, default=0.0, help='Normalvärde (startvärde för PV)')
+    parser.add_argument('--umin', type=float, default=0.0, help='Minsta utsignal (%%)')
+    parser.add_argument('--umax', type=float, default=100.0, help='Största utsignal (%%)')
+    parser.add_argument('--integrerande', action='store_true', help='Integrerande process (nivå)')
+    parser.add_argument('--fout', type=float, default=0.0, help='Utflöde för integrerande process')
+    parser.add_argument('--zoh', action='store_true', help='Exakt (ZOH) diskretisering istället för Euler')
+    parser.add_argument('--no-antiwindup', dest='antiwindup', action='store_false', help='Stäng av anti-windup')
+    parser.add_argument('--noise', type=float, default=0.0, help='Standardavvikelse för mätbrus')
+    parser.add_argument('--seed', type=int, default=None, help='Slumpfrö för bruset')
+    parser.add_argument('--out', help='Resultatfil (.parquet, .feather, .npz eller .csv)')
+    parser.add_argument('--kpi', help='Skriv prestandamåtten som JSON till denna fil')
+    add_jit_argument(parser)
+
+
+def add_jit_argument(parser):
+    parser.add_argument('--jit', action='store_true',
+                        help=f'Kompilerad stegloop med numba (lönar sig för långa körningar; även {JIT_VARIABLE}=1)')
+
+
+def enable_jit():
+    """Slå på den kompilerade stegloopen, även i arbetsprocesserna (de ärver miljön)"""
+    from kernels import NUMBA
+    if not NUMBA:
+        print("Varning: --jit kräver paketet numba (pip install numba) - kör utan", file=sys.stderr)
+        return
+    os.environ[JIT_VARIABLE] = '1'
+    SimulationEngine.use_kernel = True
+
+
+def build_engine(args):
+    """Bygg process, regulator och simuleringsmotor från argumenten"""
+    process = Process(K=args.K, T=args.T, dead_time=args.dead, integrerande=args.integrerande,
+                      Fout=args.fout, normalvarde=args.nv,
+                      discretization='zoh' if args.zoh else 'euler')
+    pid = PID(Kp=args.kp, Ti=args.ti, Td=args.td, dt=args.dt)
+    return SimulationEngine(process, pid, setpoint=args.sp, dt=args.dt, umin=args.umin,
+                            umax=args.umax, antiwindup=args.antiwindup, noise_std=args.noise,
+                            seed=args.seed)
+
+
+def kpi_dict(result):
+    """Prestandamått som JSON-vänligt dict (NaN blir null)"""
+    return json_metrics(step_metrics(result.t, result.y, result.sp))
+
+
+def json_metrics(metrics):
+    return {k: (float(v) if np.isfinite(v) else None) for k, v in metrics.items()}
+
+
+def write_columns(path, columns, kpis):
+    """Skriv kolumnerna (namn -> array) och prestandamåtten där formatet tillåter till path"""
+    ext = os.path.splitext(path)[1].lower()
+    if ext == '.csv':
+        data = np.column_stack(list(columns.values()))
+        np.savetxt(path, data, delimiter=',', header=','.join(columns), comments='', fmt='%.10g')
+    elif ext in OUTPUT_FORMATS:
+        write_table(path, columns, metadata={'kpi': kpis})
+    else:
+        raise RuntimeError(f"Okänt filformat '{ext}' - använd {', '.join(OUTPUT_FORMATS)}")
+
+
+def check_loop_arguments(args):
+    if args.steps < 0:
+        raise RuntimeError("--steps måste vara minst 0")
+    if args.dt <= 0:
+        raise RuntimeError("--dt måste vara större än 0")
+
+
+def report(args, kpis):
+    """Skriv prestandamåtten till --kpi och som JSON till stdout"""
+    if args.kpi:
+        with open(args.kpi, 'w', encoding='utf-8') as f:
+            json.dump(kpis, f, indent=2)
+    json.dump(kpis, sys.stdout)
+    sys.stdout.write('\n')
+
+
+def cmd_run(args):
+    check_loop_arguments(args)
+    result = build_engine(args).run(args.steps)
+    kpis = kpi_dict(result)
+    if args.out:
+        write_columns(args.out, result.as_dict(), kpis)
+    report(args, kpis)
+    return 0
+
+
+def cmd_montecarlo(args):
+    from montecarlo import monte_carlo
+    check_loop_arguments(args)
+    if args.runs < 1:
+        raise RuntimeError("--runs måste vara minst 1")
+    result = monte_carlo(build_engine(args), n_runs=args.runs, n_steps=args.steps, seed=args.seed,
+                         pulse=args.pulse, workers=args.workers)
+    # Percentiler per prestandamått (NaN blir null)
+    kpis = {name: {str(q): (v if np.isfinite(v) else None) for q, v in values.items()}
+            for name, values in result.kpi_summary().items()}
+    if args.out:
+        columns = {'t': result.t}
+        for signal in ('y', 'u'):
+            for q in result.percentiles:
+                columns[f'{signal}_p{q}'] = result.band(signal, q)
+        write_columns(args.out, columns, kpis)
+    report(args, kpis)
+    return 0
+
+
+def cmd_tune(args):
+    from tuning import Tuner, TuningCost
+    check_loop_arguments(args)
+    cost = TuningCost(args.criterion, overshoot_limit=args.overshoot_max,
+                      overshoot_penalty=args.overshoot_penalty, effort_weight=args.effort_weight)
+    try:
+        result = Tuner(build_engine(args), n_steps=args.steps, cost=cost, tune=args.tune).tune(
+            max_evaluations=args.max_evals)
+    except ImportError:
+        raise RuntimeError("Autotrimning kräver paketet scipy (pip install scipy)")
+    summary = result.as_dict()
+    summary['metrics'] = json_metrics(result.metrics)
+    summary['cost'] = result.cost if np.isfinite(result.cost) else None
+    if args.out:
+        args.kp, args.ti, args.td = (result.params[name] for name in ('Kp', 'Ti', 'Td'))
+        best = build_engine(args).run(args.steps)
+        write_columns(args.out, best.as_dict(), summary['metrics'])
+    report(args, summary)
+    return 0
+
+
+def cmd_serve(args):
+    import asyncio
+    from server import serve
+    print(f"Simuleringsservern lyssnar på http://{args.host}:{args.port} (Ctrl+C avslutar)", file=sys.stderr)
+    try:
+        asyncio.run(serve(args.host, args.port, workers=args.workers))
+    except KeyboardInterrupt:
+        pass
+    return 0
+
+
+def main(argv=None):
+    """Kör ett kommando. Returnerar processens slutkod"""
+    args = build_parser().parse_args(argv)
+    if args.jit:
+        enable_jit()
+    try:
+        return args.func(args)
+    except (RuntimeError, OSError) as e:
+        print(f"Fel: {e}", file=sys.stderr)
+        return 1
+
+
+if __name__ == '__main__':
+    sys.exit(main())
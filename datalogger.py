@@ -0,0 +1,109 @@
+"""Löpande loggning av simuleringen till en binär fil med konstant minne.
+
+DataLogger samlar sampel (en rad per tidssteg med kolumnerna i
+History.fields, saknade I/D-värden som NaN) i en liten buffert och lägger
+till dem i slutet av filen när bufferten är full eller efter flush_interval
+sekunder. Filen växer bara i slutet, så en avbruten session förlorar som
+mest det som låg i bufferten.
+
+Filformat (.pidlog): en textrad med MAGIC, en JSON-rad med kolumnnamn och
+metadata (utfylld med blanksteg till en multipel av 8 byte), därefter rader
+av float64 i maskinens byteordning. open_log() minnesmappar datat utan att
+läsa in det.
+
+    logger = DataLogger('session.pidlog', metadata={'dt': 1.0})
+    logger.append_history(history, start, end)
+    logger.close()
+    header, data = open_log('session.pidlog')   # data har formen (n, len(fields))
+"""
+import json
+import os
+import sys
+import time
+
+import numpy as np
+
+from history import History
+
+MAGIC = b'PIDLOG1\n'
+
+
+class DataLogger:
+    """Append-only logg med begränsad buffert (buffer_rows rader)"""
+    def __init__(self, path, fields=History.fields, metadata=None, buffer_rows=4096, flush_interval=1.0):
+        self.path = path
+        self.fields = tuple(fields)
+        self.buffer = np.empty((max(1, int(buffer_rows)), len(self.fields)))
+        self.n_buffered = 0
+        self.rows_written = 0
+        self.flush_interval = flush_interval
+        self.last_flush = time.monotonic()
+        header = json.dumps({'fields': self.fields, 'byteorder': sys.byteorder,
+                             'metadata': metadata or {}}, ensure_ascii=False).encode('utf-8')
+        # Fyll ut så att datat börjar på en multipel av 8 byte
+        padding = -(len(MAGIC) + len(header) + 1) % 8
+        self.file = open(path, 'wb')
+        self.file.write(MAGIC + header + b' ' * padding + b'\n')
+        self.file.flush()
+
+    @property
+    def closed(self):
+        return self.file is None
+
+    def append_rows(self, rows):
+        """Lägg till rader (array med formen (n, len(fields)))"""
+        rows = np.asarray(rows, dtype=float)
+        while len(rows):
+            n = min(len(rows), len(self.buffer) - self.n_buffered)
+            self.buffer[self.n_buffered:self.n_buffered + n] = rows[:n]
+            self.n_buffered += n
+            rows = rows[n:]
+            if self.n_buffered == len(self.buffer):
+                self.flush()
+        if self.n_buffered and time.monotonic() - self.last_flush >= self.flush_interval:
+            self.flush()
+
+    def append_history(self, history, start, end):
+        """Lägg till samplen start:end ur en History (saknade I/D-värden blir NaN)"""
+        if end > start:
+            self.append_rows(np.column_stack([history.column(name, start, end) for name in self.fields]))
+
+    def flush(self):
+        """Skriv bufferten till filen"""
+        if self.n_buffered:
+            self.file.write(self.buffer[:self.n_buffered].tobytes())
+            self.rows_written += self.n_buffered
+            self.n_buffered = 0
+        self.file.flush()
+        self.last_flush = time.monotonic()
+
+    def close(self):
+        if self.file is None:
+            return
+        self.flush()
+        self.file.close()
+        self.file = None
+
+
+def read_header(f):
+    """Läs huvudet från en öppen loggfil. Returnerar (huvud, byteposition för datat)"""
+    if f.readline() != MAGIC:
+        raise ValueError("Filen är ingen PID-logg")
+    header = json.loads(f.readline().decode('utf-8'))
+    return header, f.tell()
+
+
+def open_log(path):
+    """
+    Minnesmappa en loggfil (skrivskyddat). Returnerar (huvud, data) där data
+    har formen (antal rader, antal kolumner); en ofullständig sista rad
+    (t.ex. efter ett avbrott) ignoreras.
+    """
+    with open(path, 'rb') as f:
+        header, offset = read_header(f)
+    dtype = np.dtype('<f8' if header.get('byteorder', 'little') == 'little' else '>f8')
+    n_columns = len(header['fields'])
+    n_rows = (os.path.getsize(path) - offset) // (n_columns * dtype.itemsize)
+    if n_rows == 0:
+        return header, np.empty((0, n_columns), dtype=dtype)
+    return header, np.memmap(path, dtype=dtype, mode='r', offset=offset, shape=(n_rows, n_columns))
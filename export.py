@@ -0,0 +1,181 @@
+"""Export av simuleringsdata till fil.
+
+Svensk CSV (semikolon och decimalkomma, UTF-8 med BOM för Excel) formateras
+kolumnvis med NumPy direkt till bytes och skrivs i block om CHUNK_ROWS
+rader, så att även miljontals sampel exporteras på under en sekund utan
+att hela filen byggs upp i minnet. Binära format (Parquet, Feather och
+NPZ) skrivs direkt från kolumnerna; Parquet och Feather kräver det valfria
+paketet pyarrow.
+
+    columns = {'Tid': t, 'Processvärde': y, 'Styrsignal': u}
+    export_columns('run.csv', columns, decimals=(1, 2, 2))
+    export_columns('run.parquet', columns)
+"""
+import json
+import os
+
+import numpy as np
+
+# Filändelse -> beskrivning (i samma ordning som i sparadialogen)
+FORMATS = {
+    '.csv': 'CSV-filer',
+    '.parquet': 'Parquet-filer',
+    '.feather': 'Feather-filer',
+    '.npz': 'NumPy-arkiv',
+}
+CHUNK_ROWS = 65536  # Rader per skrivblock i CSV-exporten
+MAX_SCALED = 2.0 ** 62  # Större värden (efter skalning med 10^decimaler) ryms inte i int64 - skrivs med format()
+POWERS = 10 ** np.arange(1, 19, dtype=np.int64)  # För att räkna antal siffror
+
+
+def split_column(values, n_decimals):
+    """
+    Dela upp en kolumn för formatering: heltal med alla siffror
+    (värdet · 10^decimaler, avrundat som Pythons format()), minustecken,
+    antal siffror (0 för saknade värden, NaN eller oändliga) och om värdet
+    är för stort för int64 efter skalningen (skrivs då med format() och
+    har också 0 siffror). Som i format() blir små negativa värden "-0,00".
+    Högst 11 decimaler.
+    """
+    values = np.asarray(values, dtype=float)
+    scale = 10.0 ** n_decimals
+    with np.errstate(invalid='ignore', over='ignore'):
+        magnitude = np.abs(values)
+        scaled = magnitude * scale
+        missing = ~np.isfinite(values)
+        large = ~missing & (scaled >= MAX_SCALED)
+        skip = missing | large
+        scaled[skip] = 0
+        digits = np.round(scaled)
+    # Skalningen avrundas binärt: blir produkten exakt k,5 avgör det exakta värdet åt vilket håll
+    # den ska avrundas (som i format()). Med värdet delat i två halvor om 26 bitar är båda
+    # delprodukterna exakta eftersom 10^decimaler har högst 26 signifikanta bitar
+    halves = np.flatnonzero(scaled - np.floor(scaled) == 0.5)
+    if len(halves):
+        a = magnitude[halves]
+        c = 134217729.0 * a  # 2^27 + 1
+        high = c - (c - a)
+        excess = (high * scale - scaled[halves]) + (a - high) * scale  # Exakt a·10^n minus produkten
+        digits[halves] = np.where(excess > 0, np.ceil(scaled[halves]),
+                                  np.where(excess < 0, np.floor(scaled[halves]), digits[halves]))
+    largest = digits.max() if len(digits) else 0
+    # int32 räcker oftast och är betydligt snabbare att dividera
+    digits = digits.astype(np.int32 if largest < 2 ** 31 else np.int64)
+    negative = np.signbit(values) & ~skip
+    # Antal siffror, minst en före decimaltecknet
+    n_digits = np.full(len(digits), n_decimals + 1, dtype=np.int64)
+    for power in POWERS[n_decimals:]:
+        if power > largest:
+            break
+        n_digits += digits >= power
+    n_digits[skip] = 0
+    return digits, negative, n_digits, large
+
+
+def format_block(columns, decimals, separator=b';', decimal_mark=b',', newline=b'\r\n'):
+    """
+    Formatera lika långa kolumner till CSV-rader (bytes) utan Python-loop
+    per värde, med ett fast antal decimaler per kolumn. Ändliga värden
+    skrivs som f"{värde:.{decimaler}f}" med decimalkomma, NaN och oändliga
+    värden blir tomma fält.
+
+    Radlängderna räknas först, och sedan skrivs varje siffra, decimaltecken
+    och avgränsare för alla rader på en gång direkt på sin plats i
+    utdatabufferten. Siffror som ett fält saknar (kortare värden och tomma
+    fält) skrivs på avgränsarens plats, som skrivs över efteråt.
+    """
+    n_rows = len(columns[0])
+    ends = [separator] * (len(columns) - 1) + [newline]
+    fields = []
+    row_length = np.full(n_rows, sum(len(end) for end in ends), dtype=np.int64)
+    for values, n_decimals in zip(columns, decimals):
+        digits, negative, n_digits, large = split_column(values, n_decimals)
+        texts = {row: f"{values[row]:.{n_decimals}f}".replace('.', decimal_mark.decode()).encode()
+                 for row in np.flatnonzero(large)}
+        width = n_digits + negative
+        if n_decimals:
+            width += len(decimal_mark) * (n_digits > 0)
+        for row, text in texts.items():
+            width[row] = len(text)
+        row_length += width
+        fields.append((digits, negative, n_digits, texts, width, n_decimals))
+    out = np.empty(int(row_length.sum()), dtype=np.uint8)
+
+    position = np.cumsum(row_length) - row_length  # Första tecknet i nästa fält, per rad
+    for (digits, negative, n_digits, texts, width, n_decimals), end in zip(fields, ends):
+        after = position + width  # Avgränsarens plats
+        last = after - 1  # Fältets sista siffra
+        shortest = int(n_digits.min()) if n_rows else 0
+        offset = 0
+        for k in range(int(n_digits.max()) if n_rows else 0):
+            if n_decimals and k == n_decimals:
+                for byte in reversed(decimal_mark):
+                    out[last - offset if k < shortest else np.where(n_digits > k, last - offset, after)] = byte
+                    offset += 1
+            rest = digits // 10
+            digit = (digits - rest * 10 + ord('0')).astype(np.uint8)
+            digits = rest
+            out[last - offset if k < shortest else np.where(n_digits > k, last - offset, after)] = digit
+            offset += 1
+        rows = np.flatnonzero(negative)
+        if len(rows):
+            out[position[rows]] = ord('-')
+        for row, text in texts.items():
+            out[position[row]:position[row] + len(text)] = np.frombuffer(text, dtype=np.uint8)
+        for byte in end:
+            out[after] = byte
+            after += 1
+        position = after
+    return out.tobytes()
+
+
+def write_swedish_csv(stream, headers, columns, decimals, chunk_rows=CHUNK_ROWS):
+    """Skriv rubrikrad och kolumner som svensk CSV till en binär ström, block för block"""
+    stream.write((';'.join(headers) + '\r\n').encode('utf-8'))
+    n_rows = len(columns[0]) if columns else 0
+    for start in range(0, n_rows, chunk_rows):
+        stream.write(format_block([c[start:start + chunk_rows] for c in columns], decimals))
+
+
+def write_table(path, columns, metadata=None):
+    """
+    Skriv kolumnerna (namn -> array) i ett binärt format efter filändelsen.
+    metadata (namn -> JSON-vänligt värde) sparas som JSON-strängar: som
+    extra arrayer i NPZ och i schemat i Parquet/Feather.
+    """
+    ext = os.path.splitext(path)[1].lower()
+    extra = {key: json.dumps(value) for key, value in (metadata or {}).items()}
+    if ext == '.npz':
+        np.savez(path, **extra, **columns)
+        return
+    if ext not in ('.parquet', '.feather'):
+        raise RuntimeError(f"Okänt filformat '{ext}' - använd {', '.join(FORMATS)}")
+    try:
+        import pyarrow as pa
+    except ImportError:
+        raise RuntimeError(f"{ext[1:].capitalize()} kräver paketet pyarrow (pip install pyarrow)")
+    table = pa.table({name: np.asarray(values) for name, values in columns.items()})
+    if extra:
+        table = table.replace_schema_metadata(extra)
+    if ext == '.parquet':
+        import pyarrow.parquet as pq
+        pq.write_table(table, path)
+    else:
+        import pyarrow.feather as feather
+        feather.write_feather(table, path)
+
+
+def export_columns(path, columns, decimals=None, metadata=None):
+    """
+    Exportera kolumnerna (rubrik -> array) till path. Formatet väljs efter
+    filändelsen; .csv blir svensk CSV med decimals decimaler per kolumn
+    (standard 2), metadata sparas bara i de binära formaten.
+    """
+    if os.path.splitext(path)[1].lower() != '.csv':
+        write_table(path, columns, metadata)
+        return
+    if decimals is None:
+        decimals = (2,) * len(columns)
+    with open(path, 'wb') as f:
+        f.write(b'\xef\xbb\xbf')  # BOM så att Excel läser filen som UTF-8
+        write_swedish_csv(f, list(columns), list(columns.values()), decimals)
@@ -0,0 +1,174 @@
+"""Förallokerad, kolumnvis historik för simuleringssignalerna.
+
+Ersätter de tidigare Python-listorna (t, y, u, e, i, d, sp). Varje signal
+lagras som en rad i en 2D-array av float64 så att varje kolumn ligger
+sammanhängande i minnet och kan returneras som vy utan kopiering. I- och
+D-värden som saknas (komponenten inaktiv) markeras i en valid-mask istället
+för med None.
+"""
+import numpy as np
+
+
+class History:
+    """
+    Kolumnvis historik med valid-mask för de valfria I- och D-kolumnerna.
+
+    Med max_length behålls bara de senaste max_length samplen (rullande
+    historik för körningar utan slut). Samplen ligger då i ett fönster
+    start:start+n i en buffert med plats för 2·max_length, som flyttas till
+    början när det når slutet - i genomsnitt O(1) per sampel och kolumnerna
+    är fortfarande sammanhängande vyer. Index räknas från det äldsta sampel
+    som finns kvar; dropped är antalet borttagna sampel.
+    """
+    fields = ('t', 'y', 'u', 'e', 'i', 'd', 'sp')
+    optional = ('i', 'd')  # Kolumner som kan sakna värde
+
+    def __init__(self, capacity=2048, max_length=None):
+        self.index = {name: k for k, name in enumerate(self.fields)}
+        self.data = np.empty((len(self.fields), max(1, int(capacity))))
+        self.mask = np.zeros((len(self.optional), self.data.shape[1]), dtype=bool)
+        self.start = 0
+        self.n = 0
+        self.dropped = 0
+        self.max_length = None
+        self.set_max_length(max_length)
+
+    def __len__(self):
+        return self.n
+
+    @property
+    def capacity(self):
+        return self.data.shape[1]
+
+    @property
+    def total(self):
+        """Antal sampel som lagts till sedan clear(), inklusive borttagna"""
+        return self.dropped + self.n
+
+    def clear(self):
+        """Töm historiken utan att frigöra minnet"""
+        self.start = 0
+        self.n = 0
+        self.dropped = 0
+
+    def set_max_length(self, max_length):
+        """Behåll högst max_length sampel (None = obegränsat). Äldre sampel tas bort direkt"""
+        self.max_length = None if max_length is None else max(1, int(max_length))
+        if self.max_length is not None and self.n > self.max_length:
+            excess = self.n - self.max_length
+            self.start += excess
+            self.n -= excess
+            self.dropped += excess
+
+    def compact(self):
+        """Flytta samplen till början av bufferten"""
+        if self.start:
+            live = slice(self.start, self.start + self.n)
+            self.data[:, :self.n] = self.data[:, live]
+            self.mask[:, :self.n] = self.mask[:, live]
+            self.start = 0
+
+    def reserve(self, capacity):
+        """Se till att minst `capacity` sampel får plats (växer genom omallokering)"""
+        if capacity <= self.capacity:
+            return
+        live = slice(self.start, self.start + self.n)
+        data = np.empty((self.data.shape[0], capacity))
+        data[:, :self.n] = self.data[:, live]
+        mask = np.zeros((self.mask.shape[0], capacity), dtype=bool)
+        mask[:, :self.n] = self.mask[:, live]
+        self.data = data
+        self.mask = mask
+        self.start = 0
+
+    def append(self, t, y, u, e, i, d, sp):
+        """Lägg till ett sampel. i och d kan vara None (komponenten inaktiv)"""
+        if self.n == self.max_length:
+            # Rullande historik: det äldsta samplet tas bort
+            self.start += 1
+            self.n -= 1
+            self.dropped += 1
+        k = self.start + self.n
+        if k == self.capacity:
+            if self.max_length is not None and self.capacity >= 2 * self.max_length:
+                self.compact()
+            else:
+                capacity = 2 * self.capacity
+                self.reserve(capacity if self.max_length is None else min(capacity, 2 * self.max_length))
+            k = self.start + self.n
+        column = self.data[:, k]
+        column[0] = t
+        column[1] = y
+        column[2] = u
+        column[3] = e
+        column[4] = i if i is not None else np.nan
+        column[5] = d if d is not None else np.nan
+        column[6] = sp
+        self.mask[0, k] = i is not None
+        self.mask[1, k] = d is not None
+        self.n += 1
+
+    def extend(self, rows):
+        """Lägg till flera sampel: array med formen (n, len(fields)), saknade I/D-värden som NaN"""
+        rows = np.asarray(rows, dtype=float)
+        if self.max_length is not None:
+            if len(rows) > self.max_length:
+                # Bara de senaste max_length samplen får plats
+                self.dropped += len(rows) - self.max_length
+                rows = rows[len(rows) - self.max_length:]
+            excess = self.n + len(rows) - self.max_length
+            if excess > 0:
+                self.start += excess
+                self.n -= excess
+                self.dropped += excess
+        needed = self.n + len(rows)
+        if self.start + needed > self.capacity:
+            if self.max_length is not None and self.capacity >= 2 * self.max_length:
+                self.compact()
+            else:
+                capacity = max(needed, 2 * self.capacity)
+                if self.max_length is not None:
+                    capacity = max(needed, min(capacity, 2 * self.max_length))
+                self.reserve(capacity)
+        live = slice(self.start + self.n, self.start + needed)
+        self.data[:, live] = rows.T
+        self.mask[:, live] = np.isfinite(rows[:, [self.index[name] for name in self.optional]]).T
+        self.n = needed
+
+    def span(self, start, end):
+        """Buffertens slice för samplen start:end"""
+        end = self.n if end is None else min(end, self.n)
+        return slice(self.start + start, self.start + max(start, end))
+
+    def column(self, name, start=0, end=None):
+        """Vy (ingen kopia) över en signal för samplen start:end"""
+        return self.data[self.index[name], self.span(start, end)]
+
+    def valid(self, name, start=0, end=None):
+        """Valid-mask för en signal (alltid sann för kolumner som inte är valfria)"""
+        span = self.span(start, end)
+        if name not in self.optional:
+            return np.ones(span.stop - span.start, dtype=bool)
+        return self.mask[self.optional.index(name), span]
+
+    def last(self, name):
+        """Senaste värdet för en signal, eller None om värdet saknas"""
+        if self.n == 0:
+            return None
+        return self.value(name, self.n - 1)
+
+    def value(self, name, k):
+        """Värdet för sampel k, eller None om det saknas"""
+        k = self.start + (k if k >= 0 else self.n + k)
+        if name in self.optional and not self.mask[self.optional.index(name), k]:
+            return None
+        return float(self.data[self.index[name], k])
+
+    # Bekväma vyer över hela historiken: history.t, history.y, ...
+    t = property(lambda self: self.column('t'))
+    y = property(lambda self: self.column('y'))
+    u = property(lambda self: self.column('u'))
+    e = property(lambda self: self.column('e'))
+    i = property(lambda self: self.column('i'))
+    d = property(lambda self: self.column('d'))
+    sp = property(lambda self: self.column('sp'))
@@ -0,0 +1,218 @@
+"""JIT-kompilerad stegloop för SimulationEngine.run().
+
+run_engine() kör en hel bana för en SimulationEngine med PID,
+OnOffController eller manuell utsignal i en enda funktion utan
+attributuppslag, metodanrop eller tupler per steg. Allt som är konstant
+under körningen (regulatortyp, hysteres, processtyp, diskretisering,
+ZOH-faktorn och dötidens längd) bestäms en gång före loopen, och brus och
+pulsstörning dras i förväg med motorns slumpgenerator i samma ordning som
+step(). Resultatet och motorns tillstånd efteråt är identiska med
+stegvisa anrop av step().
+
+Med paketet numba kompileras loopen till maskinkod (tiotals miljoner steg
+per sekund, kompileringen cachas på disk); utan numba körs samma kod som
+vanlig Python och SimulationEngine.run() använder sin vanliga stegloop.
+
+    from kernels import NUMBA, run_engine
+    result = run_engine(engine, 10_000_000)   # samma som engine.run(10_000_000)
+"""
+import numpy as np
+
+from simulation import DelayLine, OnOffController, PID, Process, SimulationResult
+
+try:
+    from numba import njit
+    NUMBA = True
+except ImportError:
+    NUMBA = False
+
+    def njit(*args, **kwargs):
+        """Ersättning utan numba: funktionen körs som vanlig Python"""
+        return lambda function: function
+
+# Regulatorläge och hysterestyp i kärnan
+PID_MODE, ONOFF_MODE, MANUAL_MODE = 0, 1, 2
+HYSTERESIS_TYPES = {'both': 0, 'upper': 1, 'lower': 2}
+
+
+@njit(cache=True)
+def clamp(x, low, high):
+    """max(low, min(high, x)) med samma NaN-beteende som Pythons min/max"""
+    x = x if x < high else high
+    return x if x > low else low
+
+
+@njit(cache=True, nogil=True)  # Släpper GIL - flera banor kan räknas parallellt i trådar
+def trajectory(n, y_out, u_out, e_out, i_out, d_out, disturbance,
+               setpoint, dt, mode, umin, umax, antiwindup, manual_output,
+               kp, ti, td, pid_dt, integral, prev_error, prev_pv,
+               hysteresis_type, hysteresis_high, hysteresis_low, output,
+               buffer, pos, whole, frac,
+               K, T, Fout, nv, mat_min, mat_max, unitless, integrating, zoh, a, y, t):
+    """
+    Stega n gånger och skriv rad 1..n i utarrayerna. Beräkningarna följer
+    SimulationEngine.step, PID.step, OnOffController.step och Process.step
+    operation för operation. Returnerar tillståndet efteråt:
+    (y, t, pos, integral, prev_error, prev_pv, output).
+    """
+    size = len(buffer)
+    span = mat_max - mat_min
+    nv_pct = 0.0 if span == 0 else 100.0 * (nv - mat_min) / span
+    for k in range(1, n + 1):
+        pv = y
+        # --- Regulator ---
+        if mode == MANUAL_MODE:
+            ctrl = clamp(manual_output, 0.0, 100.0)
+            err, integ, deriv = setpoint - pv, 0.0, 0.0
+        elif mode == ONOFF_MODE:
+            if hysteresis_type == 1:
+                if pv < setpoint:
+                    output = umax
+                elif pv > setpoint + hysteresis_high:
+                    output = umin
+            elif hysteresis_type == 2:
+                if pv > setpoint:
+                    output = umin
+                elif pv < setpoint - hysteresis_low:
+                    output = umax
+            else:
+                if pv < setpoint - hysteresis_low:
+                    output = umax
+                elif pv > setpoint + hysteresis_high:
+                    output = umin
+            output = clamp(output, umin, umax)
+            ctrl = output
+            err, integ, deriv = setpoint - pv, 0.0, 0.0
+        elif pid_dt == 0:
+            ctrl, err, integ, deriv = 0.0, 0.0, 0.0, 0.0  # ZeroDivisionError i PID.step
+        else:
+            err = setpoint - pv
+            candidate = integral + err * pid_dt
+            deriv = (pv - prev_pv) / pid_dt
+            i_term = (1 / ti) * candidate if ti > 0.001 else 0.0
+            ctrl = clamp(kp * (err + i_term - td * deriv), umin, umax)
+            if not antiwindup or (ctrl == umin and err > 0) or (ctrl == umax and err < 0) or (umin < ctrl < umax):
+                integral = candidate
+            prev_error = err
+            prev_pv = pv
+            integ = integral
+        # --- Dötid (DelayLine.push) ---
+        buffer[pos] = ctrl
+        newest = pos
+        pos = pos + 1 if pos + 1 < size else 0
+        index = newest - whole
+        if index < 0:
+            index += size
+        u_delayed = buffer[index]
+        if frac:
+            index = newest - whole - 1
+            if index < 0:
+                index += size
+            u_delayed += frac * (buffer[index] - u_delayed)
+        # --- Process ---
+        if unitless:
+            y_pct = 0.0 if span == 0 else 100.0 * (y - mat_min) / span
+            if integrating:
+                dy_pct = (K * u_delayed - Fout) * dt / T
+            elif zoh:
+                dy_pct = (1 - a) * (nv_pct + K * u_delayed - y_pct)
+            else:
+                dy_pct = (-(y_pct - nv_pct) + K * u_delayed) * dt / T
+            y = mat_min + span * (y_pct + dy_pct) / 100.0
+        elif integrating:
+            y += (K * u_delayed - Fout) * dt / T
+        elif zoh:
+            y = a * y + (1 - a) * (nv + K * u_delayed)
+        else:
+            y += (-(y - nv) + K * u_delayed) * dt / T
+        t += dt
+        y += disturbance[k - 1]
+        y_out[k] = y
+        u_out[k] = ctrl
+        e_out[k] = err
+        i_out[k] = integ
+        d_out[k] = deriv
+    return y, t, pos, integral, prev_error, prev_pv, output
+
+
+def supports(engine):
+    """Om run_engine() kan köra motorn (standardklasserna, inte egna underklasser)"""
+    return (type(engine.process) is Process and type(engine.process.u_delay) is DelayLine
+            and type(engine.controller) in (PID, OnOffController))
+
+
+def draw_disturbance(engine, n):
+    """Brus och puls för n steg, dragna i samma ordning som SimulationEngine.disturbance()"""
+    if engine.noise_std > 0:
+        noise = engine.rng.normal(0, engine.noise_std, n)
+    else:
+        noise = np.zeros(n)
+    pulse = np.zeros(n)
+    if engine.pulse_steps_left > 0:
+        m = min(n, engine.pulse_steps_left)
+        pulse[:m] = engine.pulse_magnitude
+        engine.pulse_steps_left -= m
+    return noise + pulse
+
+
+def run_engine(engine, n_steps):
+    """Som engine.run(n_steps), men hela banan i kärnan. Uppdaterar motorns tillstånd likadant"""
+    n = int(n_steps)
+    process = engine.process
+    controller = engine.controller
+    t = np.empty(n + 1)
+    y = np.empty(n + 1)
+    u = np.empty(n + 1)
+    e = np.empty(n + 1)
+    i = np.empty(n + 1)
+    d = np.empty(n + 1)
+    sp = np.empty(n + 1)
+    t[0] = engine.current_step * engine.dt
+    y[0] = process.y
+    u[0], e[0], i[0], d[0] = engine.last
+    sp[:] = engine.setpoint
+
+    if n > 0:
+        # Det som Process.step kontrollerar varje steg men som inte ändras under körningen
+        delay = process.dead_time / engine.dt + 1
+        if delay != process.u_delay.delay:
+            process.u_delay.set_delay(delay)
+        if process.T <= 0:
+            process.T = 1e-6
+        zoh = process.discretization == 'zoh' and not process.integrerande
+        a = process.zoh_factor(engine.dt) if zoh else 0.0
+        disturbance = draw_disturbance(engine, n)
+
+        if engine.manual_output is not None:
+            mode = MANUAL_MODE
+        elif isinstance(controller, OnOffController):
+            mode = ONOFF_MODE
+        else:
+            mode = PID_MODE
+        pid = controller if isinstance(controller, PID) else PID()
+        onoff = controller if isinstance(controller, OnOffController) else OnOffController()
+        line = process.u_delay
+        buffer = np.array(line.buffer, dtype=float)
+        state = trajectory(
+            n, y, u, e, i, d, disturbance,
+            float(engine.setpoint), float(engine.dt), mode, float(engine.umin), float(engine.umax),
+            bool(engine.antiwindup), float(engine.manual_output or 0.0),
+            float(pid.Kp), float(pid.Ti), float(pid.Td), float(pid.dt),
+            float(pid.integral), float(pid.prev_error), float(pid.prev_pv),
+            HYSTERESIS_TYPES.get(onoff.hysteresis_type, 0), float(onoff.hysteresis_high),
+            float(onoff.hysteresis_low), float(onoff.output),
+            buffer, line.pos, line.whole, float(line.frac),
+            float(process.K), float(process.T), float(process.Fout), float(process.normalvarde),
+            float(process.matområde_min), float(process.matområde_max),
+            bool(process.enhetslös_K), bool(process.integrerande), zoh, a,
+            float(process.y), float(process.t))
+        process.y, process.t, line.pos, integral, prev_error, prev_pv, output = state
+        line.buffer = buffer.tolist()
+        if mode == PID_MODE:
+            pid.integral, pid.prev_error, pid.prev_pv = integral, prev_error, prev_pv
+        elif mode == ONOFF_MODE:
+            onoff.output = output
+        engine.current_step += n
+        engine.last = (float(u[n]), float(e[n]), float(i[n]), float(d[n]))
+    t[1:] = (np.arange(1, n + 1) + (engine.current_step - n)) * engine.dt
+    return SimulationResult(t, y, u, e, i, d, sp)
@@ -1,12 +1,24 @@
+import sys
+if __name__ == "__main__":
+    # Krävs för processpoolen (Monte Carlo) i PyInstaller-.exe
+    import multiprocessing
+    multiprocessing.freeze_support()
+    if len(sys.argv) > 1:
+        # Kommandoradsläge (t.ex. "python main.py run ...") - ladda inte tkinter/matplotlib
+        from cli import main as cli_main
+        sys.exit(cli_main(sys.argv[1:]))
+
 import tkinter as tk
 from tkinter import ttk
 import numpy as np
-import matplotlib
-matplotlib.use('TkAgg')
-from matplotlib.backends.backend_tkagg import FigureCanvasTkAgg
-import matplotlib.pyplot as plt
 import os
-import sys
+import time
+from simulation import Process, OnOffController, PID, SimulationEngine
+from plotting import Crosshair, PlotView, decimate, nearest_index
+from history import History
+from metrics import StepMetrics
+from worker import SimulationWorker
+from profiler import PhaseProfiler
 
 def resource_path(relative_path):
     """Får sökväg till resource, fungerar både för dev och PyInstaller .exe"""
@@ -119,195 +131,43 @@ HELP_TEXTS = {
     "export_data": "Exportera simuleringsdata som CSV-fil för vidare analys."
 }
 
-# --- Processmodeller ---
-class Process:
-    def __init__(self, K=1.0, T=10.0, dead_time=2.0, integrerande=False, Fout=0.0, normalvarde=0.0, 
-                 matområde_min=0.0, matområde_max=100.0, enhetslös_K=False):
-        self.K = K  # Processförstärkning - enhetslös om enhetslös_K=True, annars °C/%
-        self.T = T
-        self.dead_time = dead_time
-        self.integrerande = integrerande
-        self.Fout = Fout  # Utflöde (för nivåreglering)
-        self.normalvarde = normalvarde  # Normalvärde (NV) i ingenjörsenheter
-        self.matområde_min = matområde_min  # Mätområde minimum (°C)
-        self.matområde_max = matområde_max  # Mätområde maximum (°C)
-        self.enhetslös_K = enhetslös_K  # True = K är enhetslös (% till %), False = K är °C/%
-        self.y_hist = [normalvarde]*int(dead_time+1)  # Starta med normalvärdet
-        self.u_hist = [0.0]*int(dead_time+1)
-        self.y = normalvarde  # Starta på normalvärdet (ingenjörsenheter)
-        self.t = 0
-
-    def to_percent(self, value_eng):
-        """Konvertera från ingenjörsenheter till procent baserat på mätområdet"""
-        if self.matområde_max == self.matområde_min:
-            return 0.0
-        return 100.0 * (value_eng - self.matområde_min) / (self.matområde_max - self.matområde_min)
-    
-    def from_percent(self, value_pct):
-        """Konvertera från procent till ingenjörsenheter baserat på mätområdet"""
-        return self.matområde_min + (self.matområde_max - self.matområde_min) * value_pct / 100.0
-
-    def step(self, u, dt):
-        self.u_hist.append(u)
-        u_delayed = self.u_hist.pop(0)
-        
-        # Skydda mot division med noll
-        if self.T <= 0:
-            self.T = 1e-6  # Minimal tidskonstant
-        
-        if self.enhetslös_K:
-            # Enhetslös K: Konvertera y till %, beräkna i %, konvertera tillbaka
-            y_pct = self.to_percent(self.y)
-            nv_pct = self.to_percent(self.normalvarde)
-            
-            if self.integrerande:
-                # Nivåreglering: inflöde (styrsignal) minus utflöde
-                dy_pct = (self.K * u_delayed - self.Fout) * dt / self.T
-            else:
-                # Normalvärde: y går mot normalvarde om u=0
-                dy_pct = (-(y_pct - nv_pct) + self.K * u_delayed) * dt / self.T
-            
-            # Konvertera tillbaka till ingenjörsenheter
-            new_y_pct = y_pct + dy_pct
-            self.y = self.from_percent(new_y_pct)
-        else:
-            # Original metod: K i °C/%
-            if self.integrerande:
-                # Nivåreglering: inflöde (styrsignal) minus utflöde
-                self.y += (self.K * u_delayed - self.Fout) * dt / self.T
-            else:
-                # Normalvärde: y går mot normalvarde om u=0
-                self.y += (-(self.y - self.normalvarde) + self.K * u_delayed) * dt / self.T
-        
-        self.y_hist.append(self.y)
-        self.y_hist.pop(0)
-        self.t += dt
-        return self.y
-
-# --- On/Off-regulator ---
-class OnOffController:
-    def __init__(self, hysteresis_type="both", hysteresis_high=2.0, hysteresis_low=2.0):
-        self.hysteresis_type = hysteresis_type  # "upper", "lower", "both"
-        self.hysteresis_high = hysteresis_high  # Hysteresis över börvärdet
-        self.hysteresis_low = hysteresis_low    # Hysteresis under börvärdet
-        self.output = 0.0  # Aktuell utsignal (0 eller 100)
-        
-    def step(self, setpoint, pv, umin=0.0, umax=100.0):
-        """On/Off reglering med konfigurerbar hysteresis"""
-        if self.hysteresis_type == "upper":
-            # Endast hysteresis över börvärdet
-            if pv < setpoint:
-                self.output = umax  # Slå på
-            elif pv > setpoint + self.hysteresis_high:
-                self.output = umin  # Slå av
-        elif self.hysteresis_type == "lower":
-            # Endast hysteresis under börvärdet
-            if pv > setpoint:
-                self.output = umin  # Slå av
-            elif pv < setpoint - self.hysteresis_low:
-                self.output = umax  # Slå på
-        else:  # "both"
-            # Hysteresis både över och under börvärdet
-            if pv < setpoint - self.hysteresis_low:
-                self.output = umax  # Slå på
-            elif pv > setpoint + self.hysteresis_high:
-                self.output = umin  # Slå av
-        
-        # Begränsa utsignal
-        self.output = max(umin, min(umax, self.output))
-        return self.output
-
-# --- PID-regulator ---
-class PID:
-    def __init__(self, Kp=1.0, Ti=10.0, Td=0.0, dt=1.0):
-        self.Kp = Kp
-        self.Ti = Ti
-        self.Td = Td
-        self.dt = dt
-        self.integral = 0.0
-        self.prev_error = 0.0
-        self.prev_pv = 0.0
-
-    def step(self, setpoint, pv, umin=0.0, umax=100.0, antiwindup=False):
-        error = setpoint - pv
-        # Beräkna preliminär integral
-        integral_candidate = self.integral + error * self.dt
-        derivative = (pv - self.prev_pv) / self.dt
-        
-        # Hantera integral term - om Ti är 0 eller mycket liten, inaktivera I-verkan
-        if self.Ti > 0.001:  # Undvik division med noll
-            i_term = (1/self.Ti) * integral_candidate
-        else:
-            i_term = 0.0
-            
-        u_unclamped = self.Kp * (error + i_term - self.Td*derivative)
-        # Begränsa utsignal
-        u = max(umin, min(umax, u_unclamped))
-        # Anti-windup: endast integrera om utsignalen inte är mättad, eller om antiwindup är av
-        if antiwindup:
-            # Integrera bara om inte mättad, eller om felet "hjälper" att komma in i området
-            if (u == umin and error > 0) or (u == umax and error < 0) or (umin < u < umax):
-                self.integral = integral_candidate
-        else:
-            self.integral = integral_candidate
-        self.prev_error = error
-        self.prev_pv = pv
-        return u, error, self.integral, derivative
-
 # --- GUI och Simulering ---
 class PIDSimulatorApp:
     def on_mouse_move(self, event):
-        # Visa vertikal markör och tooltip endast i paus- eller stega-läge
-        if self.running:
-            # Göm markör och tooltip om simulering körs
-            if self.cursor_line:
-                for line in self.cursor_line:
-                    line.set_visible(False)
-                self.canvas.draw()
-            if self.tooltip:
-                self.tooltip.place_forget()
-            return
-        # Endast visa om musen är över någon av axlarna
-        if event.inaxes not in self.axs:
-            if self.cursor_line:
-                for line in self.cursor_line:
-                    line.set_visible(False)
-                self.canvas.draw()
+        """Spara senaste musrörelsen - den hanteras högst en gång per hover_interval ms"""
+        self._hover_event = event
+        if self._hover_id is None:
+            self._hover_id = self.root.after(self.hover_interval, self.update_hover)
+
+    def update_hover(self):
+        """Flytta markören och uppdatera tooltip för den senaste musrörelsen"""
+        self._hover_id = None
+        event = self._hover_event
+        # Visa vertikal markör och tooltip endast i paus- eller stega-läge och
+        # endast om musen är över någon av axlarna
+        if self.running or event.inaxes not in self.axs:
+            self.crosshair.hide()
             if self.tooltip:
                 self.tooltip.place_forget()
             return
-        t_vals = self.t
+        t_vals = self.history.t
         if len(t_vals) == 0 or event.xdata is None:
             return
         x = event.xdata
-        idx = np.argmin(np.abs(np.array(t_vals) - x))
+        idx = nearest_index(t_vals, x)
         tid = t_vals[idx]
-        # Skapa markörlinjer om de inte finns
-        if not self.cursor_line:
-            self.cursor_line = []
-            for ax in self.axs:
-                line, = ax.plot([tid, tid], ax.get_ylim(), color='red', linestyle='--', linewidth=1, zorder=10)
-                self.cursor_line.append(line)
-        # Flytta markörlinjer
-        for i, ax in enumerate(self.axs):
-            self.cursor_line[i].set_xdata([tid, tid])
-            self.cursor_line[i].set_visible(True)
-            # Anpassa höjd om axelns y-lim ändrats
-            self.cursor_line[i].set_ydata(ax.get_ylim())
-        self.canvas.draw()
+        self.crosshair.show(tid)
         # Hämta värden
-        yv = self.y[idx] if idx < len(self.y) else None
-        uv = self.u[idx] if idx < len(self.u) else None
-        ev = self.e[idx] if idx < len(self.e) else None
-        iv = self.i[idx] if idx < len(self.i) else None
-        dv = self.d[idx] if idx < len(self.d) else None
-        kp = self.parse_float(self.kp_var)
-        ti = self.parse_float(self.ti_var) if self.i_active_var.get() else 0.0
-        td = self.parse_float(self.td_var) if self.d_active_var.get() else 0.0
+        yv = self.history.value('y', idx)
+        uv = self.history.value('u', idx)
+        ev = self.history.value('e', idx)
+        iv = self.history.value('i', idx)
+        dv = self.history.value('d', idx)
+        fp, fi, fd = self.contribution_factors()
         # Beräkna P, I, D-bidrag
-        p_term = kp * ev if ev is not None else None
-        i_term = kp / ti * iv if (iv is not None and ti != 0) else None
-        d_term = -kp * td * dv if (dv is not None) else None
+        p_term = fp * ev if ev is not None else None
+        i_term = fi * iv if (iv is not None and fi is not None) else None
+        d_term = fd * dv if (dv is not None and fd is not None) else None
         # Bygg text
         text = f"t = {tid:.0f}\n"
         text += f"y = {yv:.2f}\n" if yv is not None else "y = -\n"
@@ -326,14 +186,15 @@ class PIDSimulatorApp:
         parent = self.canvas.get_tk_widget().master
         if not self.tooltip or not self.tooltip.winfo_exists():
             self.tooltip = tk.Label(parent, text=text, bg="#ffffe0", relief="solid", borderwidth=1, font=("Arial", 9))
-        else:
+            self.tooltip.update_idletasks()  # Uppdatera storlek
+        elif self.tooltip.cget('text') != text:
             self.tooltip.config(text=text)
+            self.tooltip.update_idletasks()
         # Placera tooltip nära musen (justera för parent-fönster)
         x_root = parent.winfo_pointerx() - parent.winfo_rootx() + 20
         y_root = parent.winfo_pointery() - parent.winfo_rooty() + 20
  # Hämta canvasbredd och tooltipbredd
         canvas_width = self.canvas.get_tk_widget().winfo_width()
-        self.tooltip.update_idletasks()  # Uppdatera storlek
         tooltip_width = self.tooltip.winfo_width()
         # Om tooltip går utanför canvas till höger, placera till vänster om musen
         if x_root + tooltip_width > canvas_width:
@@ -367,22 +228,61 @@ class PIDSimulatorApp:
                               enhetslös_K=self.enhetslös_K_var.get())
         self.pid = PID(Kp=2.0, Ti=10.0, Td=1.0, dt=self.dt)
         self.setpoint = 50.0
+        # Headless simuleringsmotor - GUI:t läser parametrar och ritar, motorn räknar
+        self.engine = SimulationEngine(self.process, self.pid, setpoint=self.setpoint, dt=self.dt)
+        # Motorn stegas i en egen tråd; GUI:t hämtar samplen med sin egen timer
+        self.worker = SimulationWorker(self.engine)
+        self._drain_id = None
         # Begränsning och antiwindup
         self.u_min = 0.0
         self.u_max = 100.0
         self.antiwindup_var = tk.BooleanVar(value=True)
-        # Historik
-        self.t = [0]
-        self.y = [self.nv_var.get()]  # Starta på normalvärdet
-        self.u = [0]
-        self.e = [0]
-        self.i = [0]
-        self.d = [0]
-        self.sp = [self.setpoint]
+        # Historik (förallokerad, kolumnvis)
+        self.history = History(capacity=self.n_steps + 1)
+        # Körning utan slut: historiken rullar och behåller de senaste rolling_capacity_var samplen
+        self.endless_var = tk.BooleanVar(value=False)
+        self.rolling_capacity_var = tk.IntVar(value=20000)
+        self.reset_history()
         # Tidsfönster
         self.window_mode = tk.StringVar(value="all")  # "all" eller "window"
         self.window_size = tk.IntVar(value=30)
         self.window_start = 0
+        # Snabb grafritning (persistenta linjer + blitting) istället för full omritning varje steg
+        self.fast_plot_var = tk.BooleanVar(value=True)
+        self.plot_view = None
+        # Bildschemaläggning: omritningar och etikettändringar slås ihop till högst max_fps bilder/s
+        self.max_fps = 30
+        self._frame_id = None
+        self._last_frame = 0.0
+        self._plot_dirty = False
+        self._pending_texts = {}  # Etikett -> text som skrivs vid nästa bild
+        self._shown_texts = {}  # Etikett -> senast skrivna text
+        self._button_state = None
+        # Markören: musrörelser hanteras högst en gång per hover_interval ms
+        self.hover_interval = 16
+        # Profilering: rullande tid per fas, steg/s och bilder/s i ett statusfält under graferna
+        self.profiler = PhaseProfiler()
+        self.profile_var = tk.BooleanVar(value=False)
+        self.profile_interval = 500  # ms mellan uppdateringar av statusfältet
+        self._profile_id = None
+        self._hover_id = None
+        self._hover_event = None
+        # Högsta översläng (%) som autotrimningen accepterar utan straff
+        self.autotune_overshoot_limit = 10.0
+        # Antal realiseringar i Monte Carlo-analysen
+        self.mc_runs_var = tk.IntVar(value=200)
+        # Löpande loggning av varje sampel till fil (DataLogger) när rutan är ikryssad
+        self.log_var = tk.BooleanVar(value=False)
+        self.logger = None
+        # Uppspelning av inspelade körningar: graferna visar recording istället för den levande historiken
+        self.recording = None
+        self.live_history = None
+        self.replay_playing = False
+        self.replay_speed_var = tk.DoubleVar(value=100.0)  # Sampel per sekund
+        self.replay_pos_var = tk.DoubleVar(value=1)
+        self._replay_id = None
+        self._replay_clock = 0.0
+        self._replay_pos = 1.0
         # PID-komponent aktivering
         self.i_active_var = tk.BooleanVar(value=True)
         self.d_active_var = tk.BooleanVar(value=True)
@@ -390,6 +290,9 @@ class PIDSimulatorApp:
         self.autopause_var = tk.BooleanVar(value=True)
         # Simuleringshastighet (delay i ms mellan steg)
         self.speed_var = tk.IntVar(value=300)  # 300ms standard
+        # Maxläge: simuleringstråden räknar så fort den kan, bildfrekvensen är frikopplad
+        self.max_speed_var = tk.BooleanVar(value=False)
+        self.frame_interval = 33  # ms mellan hämtningar från simuleringstråden (~30 per sekund)
         
         # Manuellt läge och stegsvarsanalys
         self.manual_mode_var = tk.BooleanVar(value=False)
@@ -447,9 +350,8 @@ class PIDSimulatorApp:
         self.create_widgets()
         # Lägg till change callbacks EFTER att widgets skapats
         self.setup_change_tracking()
-        # Tooltip och markör
+        # Tooltip
         self.tooltip = None
-        self.cursor_line = None  # For vertical marker
         # Uppdatera hastighetsetikett
         self.update_speed_label()
         # Initiera preset-val
@@ -555,6 +457,9 @@ class PIDSimulatorApp:
         ttk.Label(sys_row2, text="Normalvärde").pack(side=tk.LEFT, padx=5)
         self.nv_entry = ttk.Entry(sys_row2, textvariable=self.nv_var, width=6)
         self.nv_entry.pack(side=tk.LEFT, padx=5)
+        # Exakt (ZOH) diskretisering istället för Euler - stabil även när T är liten jämfört med dt
+        self.zoh_var = tk.BooleanVar(value=False)
+        ttk.Checkbutton(sys_row2, text="Exakt diskretisering (ZOH)", variable=self.zoh_var).pack(side=tk.LEFT, padx=5)
         ttk.Button(sys_row2, text="Spara systemparametrar", command=self.save_system_changes).pack(side=tk.RIGHT, padx=5)
         
         # Tredje raden - Störningar
@@ -596,8 +501,6 @@ class PIDSimulatorApp:
         self.pulse_dur_entry.pack(side=tk.LEFT, padx=5)
         self.disturbance_widgets.append(self.pulse_dur_entry)
         
-        self.pulse_active = False
-        self.pulse_steps_left = 0
         self.pulse_button = ttk.Button(sys_row3, text="Pulsstörning", command=self.trigger_pulse)
         self.pulse_button.pack(side=tk.LEFT, padx=5)
         self.disturbance_widgets.append(self.pulse_button)
@@ -680,6 +583,9 @@ class PIDSimulatorApp:
         self.td_entry = ttk.Entry(self.td_frame, textvariable=self.td_var, width=6)
         self.td_entry.pack(side=tk.LEFT, padx=5)
         
+        # Autotrimning (föreslår parametrar, sparas med "Spara regulatorparametrar")
+        ttk.Button(self.pid_params_frame, text="Autotrimma", command=self.autotune).pack(side=tk.LEFT, padx=10)
+        
         # On/Off hysteresis-kontroller (samma rad som PID-parametrar)
         self.onoff_frame = ttk.Frame(pid_row4)
         self.onoff_frame.pack(fill=tk.X, padx=5, pady=2)
@@ -767,7 +673,7 @@ class PIDSimulatorApp:
         self.perf_frame = ttk.LabelFrame(frame, text="Prestandamått")
         self.perf_frame.pack(fill=tk.X, padx=5, pady=5)
         self.perf_labels = []
-        for i in range(4):
+        for i in range(5):
             lbl = ttk.Label(self.perf_frame, text="", font=("Arial", 10))
             lbl.pack(anchor="w", padx=5)
             self.perf_labels.append(lbl)
@@ -784,6 +690,12 @@ class PIDSimulatorApp:
         self.reset_btn = ttk.Button(sim_frame, text="Återställ", command=self.reset)
         self.reset_btn.pack(side=tk.LEFT, padx=2)
         ttk.Checkbutton(sim_frame, text="Autopaus", variable=self.autopause_var).pack(side=tk.LEFT, padx=10)
+        ttk.Checkbutton(sim_frame, text="Oändlig", variable=self.endless_var, command=self.apply_history_limit).pack(side=tk.LEFT)
+        ttk.Label(sim_frame, text="Historik:").pack(side=tk.LEFT, padx=(5,2))
+        capacity_entry = ttk.Entry(sim_frame, textvariable=self.rolling_capacity_var, width=7)
+        capacity_entry.pack(side=tk.LEFT)
+        capacity_entry.bind("<Return>", lambda e: self.apply_history_limit())
+        capacity_entry.bind("<FocusOut>", lambda e: self.apply_history_limit())
         
         # Hastighetskontroller
         ttk.Label(sim_frame, text="Hastighet:").pack(side=tk.LEFT, padx=(20,2))
@@ -793,6 +705,7 @@ class PIDSimulatorApp:
         ttk.Button(speed_frame, text=">>", command=self.speed_faster, width=3).pack(side=tk.LEFT)
         self.speed_label = ttk.Label(speed_frame, text="1x", width=4)
         self.speed_label.pack(side=tk.LEFT, padx=2)
+        ttk.Checkbutton(speed_frame, text="Max", variable=self.max_speed_var, command=self.update_speed_label).pack(side=tk.LEFT, padx=2)
 
         # Tidsfönster (flyttad längst ner)
         window_frame = ttk.LabelFrame(frame, text="Tidsfönster")
@@ -803,16 +716,22 @@ class PIDSimulatorApp:
         ttk.Entry(window_frame, textvariable=self.window_size, width=4).pack(side=tk.LEFT)
         ttk.Button(window_frame, text="<", command=self.window_back).pack(side=tk.LEFT, padx=2)
         ttk.Button(window_frame, text=">", command=self.window_forward).pack(side=tk.LEFT, padx=2)
+        ttk.Checkbutton(window_frame, text="Snabb grafritning", variable=self.fast_plot_var, command=self.update_plot).pack(side=tk.LEFT, padx=10)
         
         # Skapa en container för grafer och export-knappar (i simulator-fliken)
         graph_container = ttk.Frame(self.simulator_frame)
         graph_container.pack(side=tk.RIGHT, fill=tk.BOTH, expand=True)
         
-        # Plott
-        self.fig, self.axs = plt.subplots(3, 1, sharex=True, figsize=(7,6))
+        # Plott - matplotlib laddas först här (Figure direkt, utan pyplot)
+        from matplotlib.figure import Figure
+        from matplotlib.backends.backend_tkagg import FigureCanvasTkAgg
+        self.fig = Figure(figsize=(7,6))
+        self.axs = self.fig.subplots(3, 1, sharex=True)
         self.canvas = FigureCanvasTkAgg(self.fig, master=graph_container)
         # Koppla musrörelse till canvas (måste ske efter att self.canvas skapats)
         self.canvas.mpl_connect('motion_notify_event', self.on_mouse_move)
+        self.canvas.mpl_connect('figure_leave_event', self.on_mouse_move)
+        self.crosshair = Crosshair(self.fig, self.axs, self.canvas)
         self.canvas.get_tk_widget().pack(fill=tk.BOTH, expand=True)
         
         # Export-knappar under graferna
@@ -820,17 +739,37 @@ class PIDSimulatorApp:
         export_frame.pack(fill=tk.X, pady=5)
         ttk.Button(export_frame, text="Exportera grafer", command=self.export_plots).pack(side=tk.RIGHT, padx=5)
         ttk.Button(export_frame, text="Spara data", command=self.export_data).pack(side=tk.RIGHT, padx=5)
+        ttk.Button(export_frame, text="Monte Carlo", command=self.run_monte_carlo).pack(side=tk.LEFT, padx=5)
+        ttk.Label(export_frame, text="Körningar").pack(side=tk.LEFT)
+        ttk.Entry(export_frame, textvariable=self.mc_runs_var, width=5).pack(side=tk.LEFT, padx=5)
+        ttk.Checkbutton(export_frame, text="Logga till fil", variable=self.log_var, command=self.toggle_logging).pack(side=tk.LEFT, padx=10)
+        ttk.Button(export_frame, text="Spela upp...", command=self.open_replay).pack(side=tk.LEFT, padx=5)
+        ttk.Checkbutton(export_frame, text="Profilering", variable=self.profile_var, command=self.toggle_profiler).pack(side=tk.LEFT, padx=10)
+        # Statusfält för profileringen (visas bara när den är påslagen)
+        self.profile_label = ttk.Label(graph_container, text="", font=("Courier", 9), justify=tk.LEFT, anchor="w")
+
+        # Uppspelningskontroller (visas bara när en inspelning är öppen)
+        self.export_frame = export_frame
+        self.replay_frame = ttk.Frame(graph_container)
+        self.replay_btn = ttk.Button(self.replay_frame, text="Spela", width=6, command=self.toggle_replay)
+        self.replay_btn.pack(side=tk.LEFT, padx=5)
+        self.replay_scale = ttk.Scale(self.replay_frame, from_=1, to=1, variable=self.replay_pos_var, command=self.seek_replay)
+        self.replay_scale.pack(side=tk.LEFT, fill=tk.X, expand=True, padx=5)
+        ttk.Label(self.replay_frame, text="Sampel/s").pack(side=tk.LEFT)
+        ttk.Entry(self.replay_frame, textvariable=self.replay_speed_var, width=7).pack(side=tk.LEFT, padx=5)
+        ttk.Button(self.replay_frame, text="Stäng uppspelning", command=self.close_replay).pack(side=tk.LEFT, padx=5)
         
         # Sätt initiala tillstånd för synlighet
         self.on_preset_change()  # Sätt korrekt synlighet för regulator-kontroller
         self.on_disturbance_change()  # Sätt korrekt synlighet för störningskontroller
         self.on_integrerande_change()  # Sätt korrekt synlighet för utflöde
         
-        # Skapa hjälp-innehåll
-        self.create_help_content()
-        
-        # Skapa teori-innehåll
-        self.create_theory_content()
+        # Hjälp- och teori-innehållet byggs först när fliken väljs första gången
+        self.lazy_tabs = {
+            str(self.help_frame): self.create_help_content,
+            str(self.theory_frame): self.create_theory_content,
+        }
+        self.notebook.bind("<<NotebookTabChanged>>", self.on_tab_changed)
         
         # Skapa tooltips för viktiga fält
         self.create_tooltips()
@@ -913,228 +852,155 @@ class PIDSimulatorApp:
         for child in widget.winfo_children():
             self._add_tooltips_recursive(child)
 
+    def on_tab_changed(self, event=None):
+        """Bygg innehållet i hjälp-/teorifliken vid första valet"""
+        create = self.lazy_tabs.pop(self.notebook.select(), None)
+        if create is not None:
+            create()
+
     def create_help_content(self):
         """Skapar hjälpinnehållet i hjälp-fliken"""
-        # Scrollbar för hjälptext
-        help_canvas = tk.Canvas(self.help_frame)
-        help_scrollbar = ttk.Scrollbar(self.help_frame, orient="vertical", command=help_canvas.yview)
-        help_content_frame = ttk.Frame(help_canvas)
-        
-        help_content_frame.bind(
-            "<Configure>",
-            lambda e: help_canvas.configure(scrollregion=help_canvas.bbox("all"))
+        self.help_text = self.create_markdown_tab(
+            self.help_frame, "help.md",
+            "# Hjälpfil hittades inte\n\nAnvänd tooltips genom att hovra över fält för snabb hjälp."
         )
         
-        help_canvas.create_window((0, 0), window=help_content_frame, anchor="nw")
-        help_canvas.configure(yscrollcommand=help_scrollbar.set)
-        
-        help_canvas.pack(side="left", fill="both", expand=True)
-        help_scrollbar.pack(side="right", fill="y")
-        
-        # Läs hjälpfil om den finns
-        help_file_path = resource_path("help.md")
-        help_content = ""
-        
-        try:
-            with open(help_file_path, 'r', encoding='utf-8') as f:
-                help_content = f.read()
-                # Ta bort alla potentiellt problematiska unicode-tecken
-                import re
-                help_content = re.sub(r'[^\u0000-\uFFFF]', '', help_content)
-        except FileNotFoundError:
-            help_content = "# Hjälpfil hittades inte\n\nAnvänd tooltips genom att hovra över fält för snabb hjälp."
-        
-        # Enkel markdown-parsing för visning
-        self.display_markdown(help_content_frame, help_content)
-        
-        # Bind mushjul till scrollning - behöver bindas till alla widgets
-        def _on_mousewheel(event):
-            help_canvas.yview_scroll(int(-1*(event.delta/120)), "units")
-        
-        # Rekursiv binding av mushjul till alla widgets i hjälp-framen
-        def bind_mousewheel_recursive(widget):
-            widget.bind("<MouseWheel>", _on_mousewheel)
-            for child in widget.winfo_children():
-                bind_mousewheel_recursive(child)
-        
-        bind_mousewheel_recursive(self.help_frame)
-        
     def create_theory_content(self):
         """Skapar teoriinnehållet i teori-fliken"""
-        # Scrollbar för teoritext
-        theory_canvas = tk.Canvas(self.theory_frame)
-        theory_scrollbar = ttk.Scrollbar(self.theory_frame, orient="vertical", command=theory_canvas.yview)
-        theory_content_frame = ttk.Frame(theory_canvas)
-        
-        theory_content_frame.bind(
-            "<Configure>",
-            lambda e: theory_canvas.configure(scrollregion=theory_canvas.bbox("all"))
+        self.theory_text = self.create_markdown_tab(
+            self.theory_frame, "teori-och-bakgrund.md",
+            "# Teorifil hittades inte\n\nTeoridokumentet (teori-och-bakgrund.md) kunde inte hittas."
         )
-        
-        theory_canvas.create_window((0, 0), window=theory_content_frame, anchor="nw")
-        theory_canvas.configure(yscrollcommand=theory_scrollbar.set)
-        
-        theory_canvas.pack(side="left", fill="both", expand=True)
-        theory_scrollbar.pack(side="right", fill="y")
-        
-        # Läs teorifil om den finns
-        theory_file_path = resource_path("teori-och-bakgrund.md")
-        theory_content = ""
-        
-        try:
-            with open(theory_file_path, 'r', encoding='utf-8') as f:
-                theory_content = f.read()
-                # Ta bort alla potentiellt problematiska unicode-tecken
-                import re
-                theory_content = re.sub(r'[^\u0000-\uFFFF]', '', theory_content)
-        except FileNotFoundError:
-            theory_content = "# Teorifil hittades inte\n\nTeoridokumentet (teori-och-bakgrund.md) kunde inte hittas."
-        
-        # Enkel markdown-parsing för visning
-        self.display_markdown(theory_content_frame, theory_content)
-        
-        # Bind mushjul till scrollning
-        def _on_mousewheel_theory(event):
-            theory_canvas.yview_scroll(int(-1*(event.delta/120)), "units")
-        
-        # Rekursiv binding av mushjul till alla widgets i teori-framen
-        def bind_mousewheel_recursive_theory(widget):
-            widget.bind("<MouseWheel>", _on_mousewheel_theory)
-            for child in widget.winfo_children():
-                bind_mousewheel_recursive_theory(child)
-        
-        bind_mousewheel_recursive_theory(self.theory_frame)
-        
-    def display_markdown(self, parent, markdown_text):
-        """Enkel markdown-renderer för hjälptext"""
-        lines = markdown_text.split('\n')
-        in_code_block = False
-        
-        for line in lines:
-            original_line = line
-            line = line.strip()
-            
-            if not line:
-                # Tom rad
-                ttk.Label(parent, text="").pack(anchor="w", pady=2)
-                continue
-            
-            # Hantera kodblock
-            if line.startswith('```'):
-                in_code_block = not in_code_block
-                if not in_code_block:
-                    # Avsluta kodblock med extra mellanrum
-                    ttk.Label(parent, text="").pack(anchor="w", pady=2)
-                continue
-            
-            if in_code_block:
-                # Kodrad - visa med monospace-font, vänsterjusterad
-                label = tk.Label(parent, text=original_line, font=("Courier New", 9), 
-                               bg="#f5f5f5", fg="darkblue", justify="left", anchor="w")
-                label.pack(anchor="w", pady=1, padx=20)
-                continue
-            
-            if line.startswith('# '):
-                # Huvudrubrik
-                title = line[2:]
-                label = tk.Label(parent, text=title, font=("Arial", 16, "bold"), fg="blue")
-                label.pack(anchor="w", pady=(10, 5))
-                
-            elif line.startswith('## '):
-                # Underrubrik
-                subtitle = line[3:]
-                label = tk.Label(parent, text=subtitle, font=("Arial", 14, "bold"), fg="darkblue")
-                label.pack(anchor="w", pady=(8, 3))
-                
-            elif line.startswith('### '):
-                # Mindre rubrik
-                subsubtitle = line[4:]
-                label = tk.Label(parent, text=subsubtitle, font=("Arial", 12, "bold"), fg="darkgreen")
-                label.pack(anchor="w", pady=(5, 2))
-                
-            elif line.startswith('#### '):
-                # Minsta rubrik
-                small_title = line[5:]
-                label = tk.Label(parent, text=small_title, font=("Arial", 10, "bold"), fg="darkred")
-                label.pack(anchor="w", pady=(3, 1))
-                
-            elif line.startswith('- ') or line.startswith('* '):
-                # Listpunkt (hantera fetstil inom listpunkter)
-                bullet_text = line[2:]
-                self.create_mixed_text_label(parent, f"• {bullet_text}", padx=20, pady=1)
-                
-            elif '**' in line or '*' in line:
-                # Fetstil eller kursiv (hantera blandad text)
-                self.create_mixed_text_label(parent, line, padx=0, pady=1)
-                
-            else:
-                # Vanlig text
-                label = tk.Label(parent, text=line, wraplength=700, justify="left", font=("Arial", 9))
-                label.pack(anchor="w", pady=1)
-
-    def is_mathematical_expression(self, line):
-        """Identifierar om en rad innehåller matematiska uttryck"""
-        # Enkel regel: Kodblock (```) hanteras redan av markdown-renderaren
-        # Ingen ytterligare identifiering behövs - låt kodblock vara matematik
-        return False
 
-    def create_mixed_text_label(self, parent, text, padx=0, pady=1):
-        """Skapar en label med blandad text (normal + fetstil + kursiv)"""
-        # Skapa en frame för att hålla text-delar
-        text_frame = tk.Frame(parent)
-        text_frame.pack(anchor="w", padx=padx, pady=pady, fill="x")
+    def create_markdown_tab(self, parent, filename, missing_text):
+        """Visar en markdown-fil i en skrivskyddad Text-widget med scrollbar"""
+        from markdown_view import read_markdown, parse_markdown, render_markdown
+        text = tk.Text(parent, wrap="word", font=("Arial", 9), relief="flat", padx=10, pady=5,
+                       background=parent.winfo_toplevel().cget("background"), cursor="arrow")
+        scrollbar = ttk.Scrollbar(parent, orient="vertical", command=text.yview)
+        text.configure(yscrollcommand=scrollbar.set)
+        text.pack(side="left", fill="both", expand=True)
+        scrollbar.pack(side="right", fill="y")
+        # Texten rullar med mushjulet direkt - ingen bindning per widget behövs
+        render_markdown(text, parse_markdown(read_markdown(resource_path(filename), missing_text)))
+        return text
         
-        current_row = tk.Frame(text_frame)
-        current_row.pack(anchor="w", fill="x")
-        
-        # Använd alltid Arial för vanlig text med formatering
-        base_font_family = "Arial"
-        
-        # Enkel parsing av markdown-formatering
-        import re
-        
-        # Hantera både ** och * formatering
-        # Först dela på ** för fetstil
-        parts = text.split('**')
-        
-        for i, part in enumerate(parts):
-            if not part:
-                continue
-                
-            if i % 2 == 1:  # Udda index = fetstil
-                font = (base_font_family, 9, "bold")
-                label = tk.Label(current_row, text=part, font=font)
-                label.pack(side="left")
-            else:
-                # Hantera kursiv inom normal text
-                italic_parts = part.split('*')
-                for j, italic_part in enumerate(italic_parts):
-                    if not italic_part:
-                        continue
-                    
-                    if j % 2 == 1:  # Udda index = kursiv
-                        font = (base_font_family, 9, "italic")
-                    else:  # Jämn index = normal text
-                        font = (base_font_family, 9)
-                    
-                    # Hantera radbrytningar
-                    if '\n' in italic_part:
-                        lines = italic_part.split('\n')
-                        for k, line_part in enumerate(lines):
-                            if line_part:
-                                label = tk.Label(current_row, text=line_part, font=font)
-                                label.pack(side="left")
-                            if k < len(lines) - 1:  # Inte sista delen
-                                current_row = tk.Frame(text_frame)
-                                current_row.pack(anchor="w", fill="x")
-                    else:
-                        label = tk.Label(current_row, text=italic_part, font=font)
-                        label.pack(side="left")
-
     def trigger_pulse(self):
         # Aktivera puls-störning
-        self.pulse_active = True
-        self.pulse_steps_left = self.pulse_dur_var.get()
+        with self.worker.lock:
+            self.engine.trigger_pulse(self.pulse_mag_var.get(), self.pulse_dur_var.get())
+
+    def autotune(self):
+        """Föreslå Kp/Ti/Td som minimerar ITAE (med överslängsgräns) för aktuell krets"""
+        from tkinter import messagebox
+        from tuning import Tuner, TuningCost
+        if self.preset_mode.get() == "OnOff" or self.manual_mode_var.get():
+            messagebox.showwarning("Varning", "Autotrimning kräver P-, PI- eller PID-reglering i automatiskt läge.")
+            return
+        # Trimma bara de komponenter som är aktiva
+        tune = ['Kp']
+        if self.i_active_var.get():
+            tune.append('Ti')
+        if self.d_active_var.get():
+            tune.append('Td')
+        cost = TuningCost('itae', overshoot_limit=self.autotune_overshoot_limit)
+        self.root.config(cursor="watch")
+        self.root.update_idletasks()
+        try:
+            with self.worker.lock:
+                self.sync_engine()
+                tuner = Tuner(self.engine, n_steps=self.n_steps, cost=cost, tune=tune)
+            result = tuner.tune()
+        except ImportError:
+            messagebox.showerror("Fel", "Autotrimning kräver paketet scipy (pip install scipy).")
+            return
+        finally:
+            self.root.config(cursor="")
+        params = result.params
+        for name, var in (('Kp', self.kp_var), ('Ti', self.ti_var), ('Td', self.td_var)):
+            if name in tune:
+                var.set(f"{params[name]:.3g}")
+        m = result.metrics
+        messagebox.showinfo(
+            "Autotrimning",
+            "Föreslagna parametrar: " + ", ".join(f"{name} = {params[name]:.3g}" for name in tune) + "\n\n"
+            f"ITAE: {m['itae']:.0f}\n"
+            f"Översläng: {m['overshoot_pct']:.1f}% (gräns {self.autotune_overshoot_limit:.0f}%)\n"
+            f"Inställningstid (±5%): {m['settling_time']:.1f}\n"
+            f"Simuleringar: {result.evaluations}\n\n"
+            "Klicka på \"Spara regulatorparametrar\" för att använda dem."
+        )
+
+    def run_monte_carlo(self):
+        """Kör aktuell reglerkrets många gånger med olika brusfrön och visa spridningen"""
+        from tkinter import messagebox
+        import copy
+        from montecarlo import monte_carlo
+        try:
+            n_runs = int(self.mc_runs_var.get())
+        except (tk.TclError, ValueError):
+            n_runs = 0
+        if n_runs < 1:
+            messagebox.showwarning("Varning", "Antal körningar måste vara minst 1.")
+            return
+        # Samma krets som simuleringen, men från starttillståndet
+        with self.worker.lock:
+            self.sync_engine()
+            template = copy.deepcopy(self.engine)
+        template.reset()
+        pulse = None
+        if self.signal_disturbance_var.get() and self.pulse_mag_var.get() != 0:
+            # Pulsstörningen läggs mitt i körningen
+            pulse = (self.n_steps // 2, self.pulse_mag_var.get(), self.pulse_dur_var.get())
+        self.root.config(cursor="watch")
+        self.root.update_idletasks()
+        try:
+            result = monte_carlo(template, n_runs=n_runs, n_steps=self.n_steps, pulse=pulse)
+        finally:
+            self.root.config(cursor="")
+        self.show_monte_carlo(result, template.setpoint)
+
+    def show_monte_carlo(self, result, setpoint):
+        """Visa percentilband för PV och utsignal samt prestandamåttens spridning i ett eget fönster"""
+        from matplotlib.figure import Figure
+        from matplotlib.backends.backend_tkagg import FigureCanvasTkAgg
+        win = tk.Toplevel(self.root)
+        win.title(f"Monte Carlo - {result.n_runs} körningar")
+        fig = Figure(figsize=(7, 5))
+        ax_y, ax_u = fig.subplots(2, 1, sharex=True)
+        t = result.t
+        percent = self.percent_mode_var.get()
+        for ax, signal, ylabel in ((ax_y, 'y', "Processvärde (%)" if percent else "Processvärde"),
+                                   (ax_u, 'u', "Utsignal (%)")):
+            band = result.band
+            convert = self.to_percent if percent and signal == 'y' else (lambda v: v)
+            ax.fill_between(t, convert(band(signal, 5)), convert(band(signal, 95)),
+                            color='C0', alpha=0.2, linewidth=0, label='5-95%')
+            ax.fill_between(t, convert(band(signal, 25)), convert(band(signal, 75)),
+                            color='C0', alpha=0.4, linewidth=0, label='25-75%')
+            ax.plot(t, convert(band(signal, 50)), color='C0', label='Median')
+            if signal == 'y':
+                ax.axhline(self.to_percent(setpoint) if percent else setpoint, color='k',
+                           linestyle='--', label='Börvärde')
+            ax.set_ylabel(ylabel)
+            ax.grid(alpha=0.3)
+            ax.legend(loc='upper right')
+        ax_u.set_xlabel('Tid')
+        fig.tight_layout()
+        canvas = FigureCanvasTkAgg(fig, master=win)
+        canvas.get_tk_widget().pack(fill=tk.BOTH, expand=True)
+        canvas.draw()
+
+        # Prestandamått: median och 5-95%-intervall över realiseringarna
+        names = [('overshoot', "Översläng", 2), ('rise_time', "Stigtid (90%)", 1),
+                 ('settling_time', "Inställningstid (±5%)", 1), ('steady_state_error', "Stationärt fel", 2),
+                 ('iae', "IAE", 1), ('ise', "ISE", 1), ('itae', "ITAE", 0), ('decay_ratio', "Dämpkvot", 2)]
+        summary = result.kpi_summary()
+        lines = []
+        for key, label, decimals in names:
+            q = summary[key]
+            lines.append(f"{label}: {q[50]:.{decimals}f}  (5-95%: {q[5]:.{decimals}f} - {q[95]:.{decimals}f})")
+        ttk.Label(win, text="\n".join(lines), justify="left").pack(anchor="w", padx=10, pady=5)
 
     def on_enhetslös_K_change(self):
         """Hanterar växling till/från enhetslös K"""
@@ -1169,6 +1035,9 @@ class PIDSimulatorApp:
 
     def update_speed_label(self):
         # Beräkna hastighets-multiplikator (300ms = 1x)
+        if self.max_speed_var.get():
+            self.speed_label.config(text="Max")
+            return
         delay = self.speed_var.get()
         speed_factor = 300 / delay
         if speed_factor >= 1:
@@ -1185,19 +1054,28 @@ class PIDSimulatorApp:
     def validate_T_value(self, show_warning=True):
         """Validerar T-värdet och visar varning om det är <= 0"""
         dt = 1.0  # Simuleringssteg, hårdkodat i denna version
-        T_min = dt
+        # Euler kräver T >= dt för stabil simulering, ZOH är stabil för alla T > 0
+        zoh = self.zoh_var.get()
+        T_min = 0.01 if zoh else dt
         T_value = self.parse_float(self.proc_t_var)
         if T_value < T_min:
             self.proc_t_var.set(str(T_min))
             if show_warning:
                 import tkinter.messagebox as msgbox
-                msgbox.showerror(
-                    "Felaktig tidskonstant",
-                    f"Tidskonstanten T måste vara minst dt = {dt} sekund(er) för stabil simulering.\n"
-                    f"Simuleringen har stoppats och T har satts till {T_min}.\n\n"
-                    "För snabba system (liten T) krävs mindre tidssteg dt.\n"
-                    "Vill du simulera ännu snabbare system, kontakta utvecklaren för att göra dt justerbar."
-                )
+                if zoh:
+                    msgbox.showerror(
+                        "Felaktig tidskonstant",
+                        f"Tidskonstanten T måste vara minst {T_min}.\n"
+                        f"Simuleringen har stoppats och T har satts till {T_min}."
+                    )
+                else:
+                    msgbox.showerror(
+                        "Felaktig tidskonstant",
+                        f"Tidskonstanten T måste vara minst dt = {dt} sekund(er) för stabil simulering.\n"
+                        f"Simuleringen har stoppats och T har satts till {T_min}.\n\n"
+                        "För snabba system (liten T) krävs mindre tidssteg dt,\n"
+                        "eller kryssa i \"Exakt diskretisering (ZOH)\" som är stabil för alla T."
+                    )
             return T_min
         return T_value
 
@@ -1206,15 +1084,15 @@ class PIDSimulatorApp:
             size = self.parse_float(self.window_size)
             step = max(1, int(size * 0.2))
             self.window_start = max(0, self.window_start - step)
-            self.update_plot()
+            self.request_redraw()
 
     def window_forward(self):
         if self.window_mode.get() == "window":
             size = self.parse_float(self.window_size)
             step = max(1, int(size * 0.2))
-            max_start = max(0, len(self.t) - int(size))
+            max_start = max(0, len(self.history) - int(size))
             self.window_start = min(max_start, self.window_start + step)
-            self.update_plot()
+            self.request_redraw()
 
     def set_setpoint(self):
         # Hantera svenska decimalkomma
@@ -1235,10 +1113,8 @@ class PIDSimulatorApp:
         # Uppdatera även startvärdet och historiken om vi inte är mitt i en simulering
         if not self.running:
             self.process.y = self.nv_var.get()
-            # Uppdatera hela dötidshistoriken med nya normalvärdet
-            self.process.y_hist = [self.nv_var.get()] * len(self.process.y_hist)
             # Uppdatera den första punkten i plot-historiken
-        self.update_plot()
+        self.request_redraw()
 
     def on_manual_mode_change(self):
         """Aktivera/inaktivera manuell kontroll"""
@@ -1246,8 +1122,8 @@ class PIDSimulatorApp:
             self.manual_entry.configure(state="normal")
         else:
             self.manual_entry.configure(state="disabled")
-        # Uppdatera plotten direkt när manuellt läge växlas
-        self.update_plot()
+        # Uppdatera plotten när manuellt läge växlas
+        self.request_redraw()
     
     def on_preset_change(self):
         """Hanterar växling mellan regulator-presets"""
@@ -1317,8 +1193,7 @@ class PIDSimulatorApp:
         else:
             # Inaktivera störningar
             self.noise_std_var.set(0.0)
-            self.pulse_active = False
-            self.pulse_steps_left = 0
+            self.engine.cancel_pulse()
             
             # Dölj alla störningswidgets
             for widget in self.disturbance_widgets:
@@ -1403,7 +1278,7 @@ class PIDSimulatorApp:
         # Uppdatera highlighting för att säkerställa rätt färger
         self.highlight_unsaved_changes()
         
-        self.update_plot()
+        self.request_redraw()
         self.update_percent_status()
         
     def on_unit_change(self, event=None):
@@ -1411,7 +1286,7 @@ class PIDSimulatorApp:
         # Uppdatera börvärde-etiketten om vi inte är i procentläge
         if not self.percent_mode_var.get():
             self.sp_unit_label.config(text=self.process_unit_var.get())
-        self.update_plot()
+        self.request_redraw()
         
     def on_scale_change(self, *args):
         """Hanterar ändringar av mätområdet (min/max)"""
@@ -1436,8 +1311,8 @@ class PIDSimulatorApp:
             # Återaktivera change tracking
             self._ignore_changes = False
         
-        # Uppdatera grafen efter en kort fördröjning för att undvika spam
-        self.root.after(100, self.update_plot)
+        # Uppdatera grafen vid nästa bild (snabba ändringar slås ihop till en omritning)
+        self.request_redraw()
         
     def update_scale(self):
         """Uppdaterar mätområdet och börvärdet när användaren klickar på Uppdatera-knappen"""
@@ -1462,8 +1337,8 @@ class PIDSimulatorApp:
             # Återaktivera change tracking
             self._ignore_changes = False
         
-        # Uppdatera grafen direkt
-        self.update_plot()
+        # Uppdatera grafen vid nästa bild
+        self.request_redraw()
         
     def on_measurement_range_change(self, *args):
         """Hanterar ändringar av mätområdet - uppdaterar skalning till samma värden"""
@@ -1721,7 +1596,7 @@ class PIDSimulatorApp:
         self.highlight_unsaved_changes()
         
         # Uppdatera plotten med nya skalningsvärden
-        self.update_plot()
+        self.request_redraw()
         
     def save_regulator_changes(self):
         """Sparar ändringar i Regulatorparametrar (Kp, Ti, Td, börvärde, mätområde, utsignal)"""
@@ -1784,7 +1659,7 @@ class PIDSimulatorApp:
         self.highlight_unsaved_changes()
         
         # Uppdatera plot (utan att resetta historiken)
-        self.update_plot()
+        self.request_redraw()
     
     def save_system_changes(self):
         """Sparar ändringar i Systemparametrar (normalvärde, processparametrar)"""
@@ -1806,7 +1681,7 @@ class PIDSimulatorApp:
         self.highlight_unsaved_changes()
         
         # Uppdatera plot (utan att resetta historiken)
-        self.update_plot()
+        self.request_redraw()
         
     def reset_scale(self):
         """Återställer skalning till mätområdet"""
@@ -1821,14 +1696,14 @@ class PIDSimulatorApp:
         # Återställ highlights eftersom värdena nu är "sparade"
         self.clear_unsaved_graph_highlights()
         
-        self.update_plot()
+        self.request_redraw()
         self.update_percent_status()
         
     def update_percent_status(self):
         """Uppdaterar statustext för procentvisning"""
-        if self.percent_mode_var.get() and len(self.y) > 0:
-            current_y = self.y[-1]
-            current_sp = self.sp[-1] if len(self.sp) > 0 else self.setpoint
+        if self.percent_mode_var.get() and len(self.history) > 0:
+            current_y = self.history.last('y')
+            current_sp = self.history.last('sp')
             nv = self.nv_var.get()
             
             y_pct = self.to_percent(current_y)
@@ -1836,9 +1711,9 @@ class PIDSimulatorApp:
             nv_pct = self.to_percent(nv)
             
             status = f"Aktuellt: PV={y_pct:.1f}%, BV={sp_pct:.1f}%, NV={nv_pct:.1f}%"
-            self.percent_status_label.config(text=status)
+            self.set_text(self.percent_status_label, status)
         else:
-            self.percent_status_label.config(text="")
+            self.set_text(self.percent_status_label, "")
             
     def export_plots(self):
         """Exportera grafer till fil"""
@@ -1867,17 +1742,22 @@ class PIDSimulatorApp:
         if filepath:
             try:
                 # Spara graferna med hög upplösning
-                self.fig.savefig(filepath, dpi=300, bbox_inches='tight')
+                if self.plot_view is not None:
+                    # Animerade kurvor ritas inte av savefig - gör dem statiska under exporten
+                    with self.plot_view.static_artists():
+                        self.fig.savefig(filepath, dpi=300, bbox_inches='tight')
+                else:
+                    self.fig.savefig(filepath, dpi=300, bbox_inches='tight')
                 messagebox.showinfo("Export", f"Grafer sparade som:\n{filepath}")
             except Exception as e:
                 messagebox.showerror("Fel", f"Kunde inte spara grafer:\n{str(e)}")
     
     def export_data(self):
-        """Exportera rådata till CSV-fil"""
+        """Exportera rådata till CSV-fil (svenskt format) eller binärt format (Parquet, Feather, NPZ)"""
         from tkinter import filedialog, messagebox
-        import csv
+        from export import FORMATS, export_columns
         
-        if len(self.t) < 2:
+        if len(self.history) < 2:
             messagebox.showwarning("Varning", "Ingen data att exportera. Kör simuleringen först.")
             return
             
@@ -1889,66 +1769,203 @@ class PIDSimulatorApp:
         
         filepath = filedialog.asksaveasfilename(
             defaultextension=".csv",
-            filetypes=[("CSV-filer", "*.csv"), ("Alla filer", "*.*")],
+            filetypes=[(name, f"*{ext}") for ext, name in FORMATS.items()] + [("Alla filer", "*.*")],
             initialfile=filename
         )
         
         if filepath:
             try:
-                with open(filepath, 'w', newline='', encoding='utf-8-sig') as csvfile:
-                    writer = csv.writer(csvfile, delimiter=';')  # Svenskt CSV-format
-                    
-                    # Rubrikrad
-                    headers = ['Tid', 'Processvärde', 'Börvärde', 'Regulatorut', 'Fel', 'P-bidrag', 'I-bidrag', 'D-bidrag']
-                    if self.percent_mode_var.get():
-                        headers[1] += ' (%)'
-                        headers[2] += ' (%)'
-                    writer.writerow(headers)
-                    
-                    # Data
-                    kp = self.parse_float(self.kp_var)
-                    ti = self.parse_float(self.ti_var) if self.i_active_var.get() else 0.0
-                    td = self.parse_float(self.td_var) if self.d_active_var.get() else 0.0
-                    
-                    for i in range(len(self.t)):
-                        y_val = self.y[i] if i < len(self.y) else None
-                        sp_val = self.sp[i] if i < len(self.sp) else None
-                        u_val = self.u[i] if i < len(self.u) else None
-                        e_val = self.e[i] if i < len(self.e) else None
-                        
-                        # Konvertera till procent om valt
-                        if self.percent_mode_var.get() and y_val is not None:
-                            y_val = self.to_percent(y_val)
-                        if self.percent_mode_var.get() and sp_val is not None:
-                            sp_val = self.to_percent(sp_val)
-                            
-                        # Beräkna PID-bidrag
-                        p_val = kp * e_val if e_val is not None else None
-                        i_val = (kp/ti * self.i[i]) if (i < len(self.i) and self.i[i] is not None and ti != 0) else None
-                        d_val = (-kp*td * self.d[i]) if (i < len(self.d) and self.d[i] is not None) else None
-                        
-                        row = [
-                            f"{self.t[i]:.1f}".replace('.', ','),  # Svenska decimalkomma
-                            f"{y_val:.2f}".replace('.', ',') if y_val is not None else '',
-                            f"{sp_val:.2f}".replace('.', ',') if sp_val is not None else '',
-                            f"{u_val:.2f}".replace('.', ',') if u_val is not None else '',
-                            f"{e_val:.2f}".replace('.', ',') if e_val is not None else '',
-                            f"{p_val:.2f}".replace('.', ',') if p_val is not None else '',
-                            f"{i_val:.2f}".replace('.', ',') if i_val is not None else '',
-                            f"{d_val:.2f}".replace('.', ',') if d_val is not None else ''
-                        ]
-                        writer.writerow(row)
-                        
+                # Rubriker och kolumner (saknade I/D-värden är NaN och blir tomma fält i CSV)
+                headers = ['Tid', 'Processvärde', 'Börvärde', 'Regulatorut', 'Fel', 'P-bidrag', 'I-bidrag', 'D-bidrag']
+                if self.percent_mode_var.get():
+                    headers[1] += ' (%)'
+                    headers[2] += ' (%)'
+                fp, fi, fd = self.contribution_factors()
+                h = self.history
+                y = h.column('y')
+                sp = h.column('sp')
+                # Konvertera till procent om valt
+                if self.percent_mode_var.get():
+                    y = self.to_percent(y)
+                    sp = self.to_percent(sp)
+                e = h.column('e')
+                values = [
+                    h.column('t'), y, sp, h.column('u'), e,
+                    fp * e,
+                    fi * h.column('i') if fi is not None else np.full(len(h), np.nan),
+                    fd * h.column('d') if fd is not None else np.full(len(h), np.nan),
+                ]
+                export_columns(filepath, dict(zip(headers, values)), decimals=(1, 2, 2, 2, 2, 2, 2, 2))
                 messagebox.showinfo("Export", f"Data sparad som:\n{filepath}")
             except Exception as e:
                 messagebox.showerror("Fel", f"Kunde inte spara data:\n{str(e)}")
                 
+    def toggle_logging(self):
+        """Starta eller stoppa loggningen till fil (kryssrutan "Logga till fil")"""
+        from tkinter import filedialog, messagebox
+        from datalogger import DataLogger
+        if not self.log_var.get():
+            self.stop_logging()
+            return
+        filepath = filedialog.asksaveasfilename(
+            defaultextension=".pidlog",
+            filetypes=[("PID-loggar", "*.pidlog"), ("Alla filer", "*.*")],
+            initialfile="PID_logg.pidlog"
+        )
+        if not filepath:
+            self.log_var.set(False)
+            return
+        # Samma förstärkningar som graferna och exporten (Ti/Td = 0 för inaktiva komponenter)
+        kp, ti, td = self.plot_gains()
+        metadata = {
+            'dt': self.dt,
+            'Kp': kp, 'Ti': ti, 'Td': td,
+            'K': self.parse_float(self.proc_k_var), 'T': self.parse_float(self.proc_t_var),
+            'dead_time': self.parse_float(self.proc_dead_var), 'unit': self.process_unit_var.get(),
+        }
+        try:
+            self.logger = DataLogger(filepath, metadata=metadata)
+            # Det som redan simulerats loggas först, sedan varje ny bild
+            history = self.live_history if self.recording is not None else self.history
+            self.logger.append_history(history, 0, len(history))
+        except OSError as e:
+            self.logger = None
+            self.log_var.set(False)
+            messagebox.showerror("Fel", f"Kunde inte starta loggningen:\n{str(e)}")
+
+    def stop_logging(self):
+        """Skriv det som finns kvar i loggbufferten och stäng loggfilen"""
+        if self.logger is not None:
+            self.logger.close()
+            self.logger = None
+        self.log_var.set(False)
+
+    def plot_gains(self):
+        """Kp, Ti och Td för P-, I- och D-bidragen (Ti/Td = 0 för inaktiva komponenter)"""
+        kp = self.parse_float(self.kp_var)
+        ti = self.parse_float(self.ti_var) if self.i_active_var.get() else 0.0
+        td = self.parse_float(self.td_var) if self.d_active_var.get() else 0.0
+        return kp, ti, td
+
+    def contribution_factors(self):
+        """(fp, fi, fd) så att P-, I- och D-bidragen är fp·e, fi·i och fd·d (None = inget bidrag); inspelningens vid uppspelning"""
+        if self.recording is not None:
+            return self.recording.factors
+        kp, ti, td = self.plot_gains()
+        return kp, (kp / ti if ti != 0 else None), -kp * td
+
+    def active_components(self):
+        """Om I- och D-bidragen ska visas"""
+        if self.recording is not None:
+            return self.recording.i_active, self.recording.d_active
+        return self.i_active_var.get(), self.d_active_var.get()
+
+    def open_replay(self):
+        """Öppna en inspelad körning (logg eller sparad data) och visa den i graferna utan att simulera om"""
+        from tkinter import filedialog, messagebox
+        from replay import RECORDING_FORMATS, RecordedHistory, open_recording
+        filepath = filedialog.askopenfilename(
+            filetypes=[("Inspelningar", " ".join(f"*{ext}" for ext in RECORDING_FORMATS))]
+                      + [(name, f"*{ext}") for ext, name in RECORDING_FORMATS.items()]
+                      + [("Alla filer", "*.*")]
+        )
+        if not filepath:
+            return
+        try:
+            recording = open_recording(filepath)
+        except (RuntimeError, ValueError, OSError) as e:
+            messagebox.showerror("Fel", f"Kunde inte öppna inspelningen:\n{str(e)}")
+            return
+        if len(recording) == 0:
+            messagebox.showwarning("Varning", "Inspelningen innehåller inga sampel.")
+            return
+        if recording.percent:
+            # Sparad i procent - räkna om till fysiska enheter med nuvarande mätområde
+            for name in ('y', 'sp'):
+                recording.signals[name] = self.from_percent(recording.signals[name])
+        self.running = False
+        self.worker.pause()
+        self.stop_replay()
+        if self.recording is None:
+            self.live_history = self.history
+        self.recording = recording
+        self.history = RecordedHistory(recording)
+        self._replay_pos = float(len(recording))
+        self.replay_scale.configure(to=len(recording))
+        self.replay_pos_var.set(len(recording))
+        self.replay_frame.pack(fill=tk.X, pady=2, before=self.export_frame)
+        self.window_start = 0
+        if self.plot_view is not None:
+            self.plot_view.invalidate()
+        self.request_redraw()
+        self.update_buttons()
+
+    def close_replay(self):
+        """Stäng inspelningen och visa den levande simuleringen igen"""
+        if self.recording is None:
+            return
+        self.stop_replay()
+        self.replay_frame.pack_forget()
+        self.history = self.live_history
+        self.recording = None
+        self.live_history = None
+        self.window_start = 0
+        if self.plot_view is not None:
+            self.plot_view.invalidate()
+        self.request_redraw()
+        self.update_buttons()
+
+    def seek_replay(self, value=None):
+        """Visa inspelningen fram till reglagets position"""
+        if self.recording is None:
+            return
+        self._replay_pos = float(self.replay_pos_var.get())
+        self.history.seek(self._replay_pos)
+        self.request_redraw()
+
+    def toggle_replay(self):
+        """Spela upp eller pausa inspelningen"""
+        if self.replay_playing:
+            self.stop_replay()
+            return
+        if self._replay_pos >= len(self.recording):
+            self._replay_pos = 1.0  # Börja om från början
+        self.replay_playing = True
+        self.replay_btn.config(text="Paus")
+        self._replay_clock = time.perf_counter()
+        self._replay_id = self.root.after(self.frame_interval, self.replay_tick)
+
+    def stop_replay(self):
+        if self._replay_id is not None:
+            self.root.after_cancel(self._replay_id)
+            self._replay_id = None
+        self.replay_playing = False
+        self.replay_btn.config(text="Spela")
+
+    def replay_tick(self):
+        """Flytta uppspelningen framåt enligt verklig tid och hastigheten (sampel per sekund)"""
+        self._replay_id = None
+        now = time.perf_counter()
+        try:
+            speed = max(0.0, float(self.replay_speed_var.get()))
+        except (tk.TclError, ValueError):
+            speed = 100.0
+        self._replay_pos = min(float(len(self.recording)), self._replay_pos + (now - self._replay_clock) * speed)
+        self._replay_clock = now
+        self.replay_pos_var.set(self._replay_pos)
+        self.history.seek(self._replay_pos)
+        self.request_redraw()
+        if self._replay_pos >= len(self.recording):
+            self.stop_replay()
+        else:
+            self._replay_id = self.root.after(self.frame_interval, self.replay_tick)
+
     def to_percent(self, value):
         """Konvertera värde till procent baserat på mätområdet"""
         min_val = self.matområde_min_var.get()
         max_val = self.matområde_max_var.get()
         if max_val == min_val:
-            return 0.0
+            return 0.0 * value  # Fungerar för både tal och NumPy-arrayer
         return 100.0 * (value - min_val) / (max_val - min_val)
         
     def from_percent(self, percent):
@@ -1958,22 +1975,24 @@ class PIDSimulatorApp:
         return min_val + (max_val - min_val) * percent / 100.0
 
     def start(self):
+        if self.recording is not None:
+            return  # En inspelning visas - ingen simulering
         self.running = True
         self._auto_paused = False  # Släpp alltid auto-paus när Kör trycks
         self.update_buttons()
-        # Nollställ auto-paus innan första steget
-        self._auto_paused = False
-        self.simulate(step=True)
-        # Om running fortfarande är True (dvs inte auto-pausad), fortsätt loopen
-        if self.running:
-            self.root.after(300, self.simulate)
+        # Tråden räknar första steget direkt och fortsätter sedan i vald takt
+        self.sync_worker()
+        self.worker.run()
+        self.schedule_drain()
 
     def pause(self):
         self.running = False
+        self.worker.pause()
         self.update_buttons()
 
     def step_once(self):
         self.running = False
+        self.worker.pause()
         self.update_buttons()
         T_min = 0.01
         T_value = self.parse_float(self.proc_t_var)
@@ -1986,53 +2005,52 @@ class PIDSimulatorApp:
                 f"Simuleringen har stoppats och T har satts till {T_min}."
             )
             return
-        self.simulate(step=True)
+        if self.recording is not None:
+            return
+        self.sync_worker()
+        self.worker.step()
+        self.schedule_drain()
 
-    def reset(self):
-        self.running = False
-        self._auto_paused = False
-        self.current_step = 0
-        T_min = 0.01
-        T_value = self.parse_float(self.proc_t_var)
-        if T_value < T_min:
-            self.proc_t_var.set(str(T_min))
-            import tkinter.messagebox as msgbox
-            msgbox.showerror(
-                "Felaktig tidskonstant",
-                f"Tidskonstanten T måste vara minst {T_min}.\n"
-                f"Simuleringen har stoppats och T har satts till {T_min}."
-            )
+    def apply_history_limit(self):
+        """Rullande historik i oändligt läge (de senaste samplen enligt Historik-fältet), annars obegränsad"""
+        # Under uppspelning gäller gränsen den levande historiken
+        history = self.live_history if self.recording is not None else self.history
+        if not self.endless_var.get():
+            history.set_max_length(None)
             return
-        self.process = Process(
-            K=self.parse_float(self.proc_k_var),
-            T=T_value,
-            dead_time=self.parse_float(self.proc_dead_var),
-            integrerande=self.integrerande_var.get(),
-            Fout=self.parse_float(self.proc_fout_var),
-            normalvarde=self.nv_var.get(),
-            matområde_min=self.matområde_min_var.get(),
-            matområde_max=self.matområde_max_var.get(),
-            enhetslös_K=self.enhetslös_K_var.get()
-        )
-        self.pid = PID(Kp=self.parse_float(self.kp_var), Ti=self.parse_float(self.ti_var), Td=self.parse_float(self.td_var), dt=self.dt)
         try:
-            self.setpoint = float(str(self.sp_var.get()).replace(",", "."))
-        except Exception:
-            self.setpoint = 0.0
-        self.t = [0]
-        self.y = [self.nv_var.get()]  # Starta på normalvärdet
-        self.u = [0]
-        self.e = [0]
-        self.i = [0]
-        self.d = [0]
-        self.sp = [self.setpoint]
-        self.update_plot()
-        self.formel_label.config(text="")
-        self.update_buttons()
+            capacity = max(100, int(self.rolling_capacity_var.get()))
+        except (tk.TclError, ValueError):
+            capacity = history.max_length or 20000
+        self.rolling_capacity_var.set(capacity)
+        history.set_max_length(capacity)
+        self.request_redraw()
+
+    def reset_history(self):
+        """Tömmer historiken och lägger in startpunkten (normalvärdet)"""
+        self.history.clear()
+        self.history.append(0, self.nv_var.get(), 0, 0, 0, 0, self.setpoint)
+        self.rebuild_metrics()
+
+    def rebuild_metrics(self):
+        """Räknar om prestandamåtten från hela historiken"""
+        self.metrics = StepMetrics()
+        self.metrics.extend(self.history.t, self.history.y, self.history.sp)
+
     def update_buttons(self):
         # Kör-knappen inaktiv under körning, aktiv annars
         # Om auto-pausad: Kör aktiv, Paus inaktiv
-        if self.running:
+        state = (self.running, self._auto_paused, self.recording is not None)
+        if state == self._button_state:
+            return  # Oförändrat - undvik onödiga widgetanrop varje bild
+        self._button_state = state
+        if self.recording is not None:
+            # Uppspelning - Återställ stänger inspelningen
+            self.start_btn.state(["disabled"])
+            self.pause_btn.state(["disabled"])
+            self.step_btn.state(["disabled"])
+            self.reset_btn.state(["!disabled"])
+        elif self.running:
             self.start_btn.state(["disabled"])
             self.pause_btn.state(["!disabled"])
             self.step_btn.state(["disabled"])
@@ -2048,53 +2066,93 @@ class PIDSimulatorApp:
             self.step_btn.state(["!disabled"])
             self.reset_btn.state(["!disabled"])
 
-    def simulate(self, step=False):
-        # Kontrollera numerisk instabilitet: PV utanför ±2×mätområdets gränser
+    def schedule_drain(self):
+        """Hämta från simuleringstråden med GUI:ts egen timer (en gång per frame_interval)"""
+        if self._drain_id is None:
+            self._drain_id = self.root.after(self.frame_interval, self.drain_worker)
+
+    def drain_worker(self):
+        """Lägg trådens nya sampel i historiken, loggen och prestandamåtten och hantera stopphändelser"""
+        self._drain_id = None
+        profiler = self.profiler
+        if self.running:
+            with profiler.phase('Tk-variabler'):
+                self.sync_worker()  # Ändrade inställningar gäller från trådens nästa block
+        busy = self.worker.busy  # Läses före drain() så att inget block från ett avslutat kommando missas
+        batches = self.worker.drain()
+        if self.running or busy:
+            self.schedule_drain()
+        if not batches:
+            return
+        rows = batches[0].rows if len(batches) == 1 else np.concatenate([batch.rows for batch in batches])
+        if profiler.enabled:
+            # Regulatorberäkningen sker i simuleringstråden - dess tid per block följer med blocken
+            profiler.add('regulator (tråd)', sum(batch.elapsed for batch in batches))
+            profiler.count('steg', len(rows))
+        if len(rows):
+            with profiler.phase('historik'):
+                if self.logger is not None:
+                    self.logger.append_rows(rows)
+                # Under uppspelning fortsätter den levande historiken i bakgrunden
+                history = self.live_history if self.recording is not None else self.history
+                history.extend(rows)
+                self.metrics.extend(rows[:, 0], rows[:, 1], rows[:, 6])
+        self.current_step = batches[-1].step
+        last = next((batch.last for batch in reversed(batches) if batch.last is not None), None)
+        if last is not None:
+            with profiler.phase('formel'):
+                self.show_step_formula(*last)
+            self.request_redraw()
+            self.update_percent_status()  # Uppdatera procentstatus
+        for batch in batches:
+            # Händelser från före ett senare kommando (t.ex. Kör igen) gäller inte längre
+            if batch.event is not None and batch.sequence == self.worker.requested:
+                self.stop_on_event(batch.event, batch.pv)
+        self.update_buttons()
+
+    def stop_on_event(self, event, pv):
+        """Tråden har stannat: numerisk instabilitet, alla steg räknade eller automatisk paus"""
+        self.running = False
+        self._auto_paused = event == 'autopause'
+        self.update_buttons()
+        if event != 'unstable':
+            return
         mat_min = self.parse_float(self.matområde_min_var)
         mat_max = self.parse_float(self.matområde_max_var)
-        pv = self.process.y
-        if pv < mat_min - abs(mat_max-mat_min)*2 or pv > mat_max + abs(mat_max-mat_min)*2:
-            self.running = False
-            self._auto_paused = False
-            self.update_buttons()
-            import tkinter.messagebox as msgbox
-            msgbox.showerror(
-                "Numerisk instabilitet",
-                f"Processvärdet (PV) har gått utanför rimliga gränser.\n\n"
-                f"PV = {pv:.3g}, mätområde = [{mat_min}, {mat_max}]\n\n"
-                "Möjliga orsaker:\n"
-                "- För liten tidskonstant T\n"
-                "- För stort tidssteg dt\n"
-                "- Extremt höga regulatorparametrar (Kp, Ti, Td)\n\n"
-                "Åtgärder:\n"
-                "- Öka T\n"
-                "- Minska dt (hastighet)\n"
-                "- Justera Kp, Ti, Td till rimliga värden"
+        import tkinter.messagebox as msgbox
+        msgbox.showerror(
+            "Numerisk instabilitet",
+            f"Processvärdet (PV) har gått utanför rimliga gränser.\n\n"
+            f"PV = {pv:.3g}, mätområde = [{mat_min}, {mat_max}]\n\n"
+            "Möjliga orsaker:\n"
+            "- För liten tidskonstant T\n"
+            "- För stort tidssteg dt\n"
+            "- Extremt höga regulatorparametrar (Kp, Ti, Td)\n\n"
+            "Åtgärder:\n"
+            "- Öka T\n"
+            "- Minska dt (hastighet)\n"
+            "- Justera Kp, Ti, Td till rimliga värden"
+        )
+
+    def sync_worker(self):
+        """Överför inställningarna till motorn och simuleringstråden (takt, stoppvillkor, sparade bidrag)"""
+        # Numerisk instabilitet: PV utanför ±2×mätområdets gränser
+        mat_min = self.parse_float(self.matområde_min_var)
+        mat_max = self.parse_float(self.matområde_max_var)
+        margin = abs(mat_max - mat_min) * 2
+        with self.worker.lock:
+            self.sync_engine()
+            self.worker.configure(
+                interval=0.0 if self.max_speed_var.get() else self.speed_var.get() / 1000.0,
+                max_steps=None if self.endless_var.get() else self.n_steps,
+                pv_limits=(mat_min - margin, mat_max + margin),
+                autopause=self.autopause_var.get(),
+                record_i=self.i_active_var.get(),
+                record_d=self.d_active_var.get(),
             )
-            return
-        if self.current_step >= self.n_steps:
-            self.running = False
-            self._auto_paused = False
-            self.update_buttons()
-            return
-        # Automatisk paus om ärvärdet varit inom ±5% av börvärdet under 20 steg
-        window = 20
-        # Blockera autopaus om användaren valt det
-        if self.autopause_var.get():
-            if len(self.y) > window and not self._auto_paused:
-                y_arr = np.array(self.y[-window:])
-                sp_arr = np.array(self.sp[-window:])
-                # Auto-paus om ärvärdet är nära BV (±5%)
-                within_5 = np.abs(y_arr - sp_arr) <= 0.05 * np.abs(sp_arr)
-                # Auto-paus om ärvärdet är stabilt (liten variation)
-                bv_ref = np.abs(sp_arr[0]) if np.abs(sp_arr[0]) > 0 else 1.0
-                stable = (np.max(y_arr) - np.min(y_arr)) < max(0.01 * bv_ref, 0.5)
-                if np.all(within_5) or stable:
-                    if not step:
-                        self.running = False
-                        self._auto_paused = True
-                        self.update_buttons()
-                        return
+
+    def sync_engine(self):
+        """Överför sparade parametrar och GUI-inställningar till motorn (med worker.lock). Returnerar börvärdet i fysiska enheter"""
         # Hämta parametrar från sparade värden (inte GUI) 
         self.pid.Kp = self.saved_params['kp']
         Ti = self.saved_params['ti'] if self.saved_params['i_active'] else 0.0
@@ -2124,57 +2182,23 @@ class PIDSimulatorApp:
         self.process.matområde_min = self.saved_params['matområde_min']
         self.process.matområde_max = self.saved_params['matområde_max']
         self.process.enhetslös_K = self.enhetslös_K_var.get()
-        # --- Störningar ---
-        noise_std = self.noise_std_var.get()
-        noise = np.random.normal(0, noise_std) if noise_std > 0 else 0.0
-        pulse = 0.0
-        if getattr(self, 'pulse_active', False) and getattr(self, 'pulse_steps_left', 0) > 0:
-            pulse = self.pulse_mag_var.get()
-            self.pulse_steps_left -= 1
-            if self.pulse_steps_left <= 0:
-                self.pulse_active = False
-        # Simulera ett steg
-        pv = self.process.y
-        
-        # Kontrollera om manuellt läge är aktivt
-        if self.manual_mode_var.get():
-            # Manuellt läge - använd användarens utsignal
-            ctrl = self.parse_float(self.manual_output_var)
-            # Begränsa till 0-100%
-            ctrl = max(0.0, min(100.0, ctrl))
-            # Sätt PID-värden till 0 i manuellt läge
-            err = current_setpoint - pv
-            integ = 0.0
-            deriv = 0.0
-        elif self.preset_mode.get() == "OnOff":
-            # On/Off-reglering
-            ctrl = self.onoff_controller.step(current_setpoint, pv, umin=self.saved_params['u_min'], umax=self.saved_params['u_max'])
-            err = current_setpoint - pv
-            integ = 0.0
-            deriv = 0.0
-        else:
-            # Automatiskt läge - PID-beräkning med skydd mot division med noll
-            try:
-                ctrl, err, integ, deriv = self.pid.step(
-                    current_setpoint, pv,
-                    umin=self.saved_params['u_min'], umax=self.saved_params['u_max'],
-                    antiwindup=self.antiwindup_var.get()
-                )
-            except ZeroDivisionError:
-                ctrl, err, integ, deriv = 0.0, 0.0, 0.0, 0.0
-        # Applicera störningar på processvärdet (y)
-        self.process.step(ctrl, self.dt)
-        self.process.y += noise + pulse
-        self.current_step += 1
-        self.t.append(self.current_step*self.dt)
-        self.y.append(self.process.y)
-        self.u.append(ctrl)
-        self.e.append(err)
-        self.i.append(integ if self.i_active_var.get() else None)
-        self.d.append(deriv if self.d_active_var.get() else None)
-        self.sp.append(current_setpoint)
-        
-        # Visa formel och resultat med delmoment
+        self.process.discretization = 'zoh' if self.zoh_var.get() else 'euler'
+        # --- Överför GUI-inställningar till simuleringsmotorn ---
+        engine = self.engine
+        engine.process = self.process
+        engine.controller = self.onoff_controller if self.preset_mode.get() == "OnOff" else self.pid
+        engine.setpoint = current_setpoint
+        engine.umin = self.saved_params['u_min']
+        engine.umax = self.saved_params['u_max']
+        engine.antiwindup = self.antiwindup_var.get()
+        # Manuellt läge - använd användarens utsignal
+        engine.manual_output = self.parse_float(self.manual_output_var) if self.manual_mode_var.get() else None
+        # Störningar (brus och puls läggs på processvärdet i motorn)
+        engine.noise_std = self.noise_std_var.get()
+        return current_setpoint
+
+    def show_step_formula(self, pv, ctrl, err, integ, deriv):
+        """Visa formel och resultat med delmoment för senaste steget"""
         if self.manual_mode_var.get():
             # Manuellt läge - visa enklare information
             formel = "MANUELLT LÄGE\n"
@@ -2217,61 +2241,127 @@ class PIDSimulatorApp:
                 res += " (begränsad)"
             if self.antiwindup_var.get():
                 res += ", antiwindup aktiv"
-        self.formel_label.config(text=formel + res)
-        self.update_plot()
-        self.update_percent_status()  # Uppdatera procentstatus
-        if self.running and not step:
-            self.root.after(self.speed_var.get(), self.simulate)
-        self.update_buttons()
+        self.set_text(self.formel_label, formel + res)
+
+    def request_redraw(self):
+        """Markera graferna som inaktuella - de ritas om vid nästa bild"""
+        self._plot_dirty = True
+        self.schedule_frame()
+
+    def set_text(self, label, text):
+        """Köa ny text för en etikett - skrivs vid nästa bild och bara om texten ändrats"""
+        self._pending_texts[label] = text
+        self.schedule_frame()
+
+    def schedule_frame(self):
+        """Schemalägg nästa bild, tidigast 1/max_fps efter den förra"""
+        if self._frame_id is None:
+            wait = self._last_frame + 1.0 / self.max_fps - time.perf_counter()
+            self._frame_id = self.root.after(max(0, int(wait * 1000)), self.render_frame)
+
+    def render_frame(self):
+        """Rita en bild: graferna om de är inaktuella och de etiketter vars text ändrats"""
+        # _frame_id är kvar under ritningen så att set_text nedan inte schemalägger en ny bild
+        self._last_frame = time.perf_counter()
+        try:
+            if self._plot_dirty:
+                self._plot_dirty = False
+                self.update_plot()
+                self.profiler.count('bilder')
+            pending, self._pending_texts = self._pending_texts, {}
+            with self.profiler.phase('etiketter'):
+                for label, text in pending.items():
+                    if self._shown_texts.get(label) != text:
+                        label.config(text=text)
+                        self._shown_texts[label] = text
+        finally:
+            self._frame_id = None
+
+    def toggle_profiler(self):
+        """Slå på/av profileringen och dess statusfält under graferna"""
+        self.profiler.clear()
+        self.profiler.enabled = self.profile_var.get()
+        if self.profiler.enabled:
+            self.profile_label.config(text="")
+            self.profile_label.pack(fill=tk.X, padx=5, after=self.export_frame)
+            self.profile_tick()
+        else:
+            self.profile_label.pack_forget()
+            if self._profile_id is not None:
+                self.root.after_cancel(self._profile_id)
+                self._profile_id = None
+
+    def profile_tick(self):
+        """Skriv profileringens rullande mått i statusfältet (var profile_interval ms)"""
+        self._profile_id = None
+        if not self.profiler.enabled:
+            return
+        delay = 0.0 if self.max_speed_var.get() else self.speed_var.get() / 1000.0
+        self.profile_label.config(text=self.profiler.report(requested_delay=delay))
+        self._profile_id = self.root.after(self.profile_interval, self.profile_tick)
 
     def update_plot(self):
-        for ax in self.axs:
-            ax.clear()
-        # Återställ markör så att den skapas på nytt vid nästa mouse-over
-        self.cursor_line = None
+        with self.profiler.phase('plotdata'):
+            data = self.collect_plot_data()
+        if self.fast_plot_var.get():
+            # Snabb grafritning - persistenta linjer och blitting
+            if self.plot_view is None:
+                self.plot_view = PlotView(self.fig, self.axs, self.canvas, self.profiler)
+            self.plot_view.update(data)
+        else:
+            if self.plot_view is not None:
+                self.plot_view.detach()
+                self.plot_view = None
+            self.draw_full(data)
+        # Omritningen har tagit bort markören
+        self.crosshair.invalidate()
+        with self.profiler.phase('prestandamått'):
+            self.update_performance()
+
+    def collect_plot_data(self):
+        """Samlar ihop det som ska plottas (gemensamt för full omritning och snabb grafritning)"""
         # Välj datafönster
+        x_window = None
         if self.window_mode.get() == "window":
             size = self.window_size.get()
             start = self.window_start
-            end = min(len(self.t), start + size)
-            t = self.t[start:end]
-            y = self.y[start:end]
-            sp = self.sp[start:end]
-            u = self.u[start:end]
-            e = self.e[start:end]
-            i = [v for v in self.i[start:end]]
-            d = [v for v in self.d[start:end]]
+            end = min(len(self.history), start + size)
+            if len(self.history) > start:
+                x_window = (self.history.t[start], self.history.t[start] + max(size - 1, 1) * self.dt)
         else:
-            t = self.t
-            y = self.y
-            sp = self.sp
-            u = self.u
-            e = self.e
-            i = self.i
-            d = self.d
+            start, end = 0, len(self.history)
+        # Vyer över historiken (ingen kopiering); saknade I/D-värden är NaN
+        h = self.history
+        t = h.column('t', start, end)
+        y = h.column('y', start, end)
+        sp = h.column('sp', start, end)
+        u = h.column('u', start, end)
+        e = h.column('e', start, end)
+        i = h.column('i', start, end)
+        d = h.column('d', start, end)
         # Konvertera till procent om valt
         if self.percent_mode_var.get():
-            y_plot = [self.to_percent(val) for val in y]
-            sp_plot = [self.to_percent(val) for val in sp]
+            y_plot = self.to_percent(y)
+            sp_plot = self.to_percent(sp)
             # För procentvisning, använd alltid 0-100% skala
             ymin, ymax = 0, 100
             ylabel = 'Processvärde (%)'
+            bv_label = 'Börvärde (%)'
         else:
             y_plot = y
             sp_plot = sp
             # För fysiska enheter, använd sparade graf-skala värden
             ymin, ymax = self.saved_params.get('graph_min', self.process_min.get()), self.saved_params.get('graph_max', self.process_max.get())
             ylabel = f'Processvärde ({self.process_unit_var.get()})'
-            
-        # Plotta
-        if self.percent_mode_var.get():
-            bv_label = 'Börvärde (%)'
-        else:
             bv_label = f'Börvärde ({self.process_unit_var.get()})'
-        
-        self.axs[0].plot(t, sp_plot, 'k--', label=bv_label)
-        self.axs[0].plot(t, y_plot, label='Är-värde')
-        
+
+        data = {
+            't': t, 'y': y_plot, 'sp': sp_plot, 'u': u, 'x_window': x_window,
+            'y_limits': (ymin, ymax), 'y_label': ylabel, 'sp_label': bv_label,
+            'hyst_upper': None, 'hyst_lower': None,
+            'sum': None, 'p': None, 'i': None, 'd': None, 'v_range': None, 'v_ylabel': None,
+        }
+
         # Visa hysteresis-gränser för On/Off-reglering
         if self.preset_mode.get() == "OnOff" and len(t) > 0:
             hyst_type = self.onoff_hysteresis_type.get()
@@ -2291,207 +2381,205 @@ class PIDSimulatorApp:
                 hyst_high_plot = hyst_high
                 hyst_low_plot = hyst_low
             
-            # Rita hysteresis-linjer
             if hyst_type in ["upper", "both"]:
-                upper_line = [setpoint_plot + hyst_high_plot] * len(t)
-                self.axs[0].plot(t, upper_line, 'r:', alpha=0.7, linewidth=1, label=f'Hysteresis +{hyst_high:.1f}')
-            
+                data['hyst_upper'] = (setpoint_plot + hyst_high_plot, f'Hysteresis +{hyst_high:.1f}')
             if hyst_type in ["lower", "both"]:
-                lower_line = [setpoint_plot - hyst_low_plot] * len(t)
-                self.axs[0].plot(t, lower_line, 'r:', alpha=0.7, linewidth=1, label=f'Hysteresis -{hyst_low:.1f}')
-        
-        # Tunna horisontella linjer för varje yticks (skala)
-        yticks = np.linspace(ymin, ymax, num=8)
-        for yy in yticks:
-            self.axs[0].axhline(yy, color='gray', linewidth=0.3, alpha=0.5, zorder=0)
-        self.axs[0].set_ylim(ymin, ymax)
-        self.axs[0].set_ylabel(ylabel)
-        self.axs[0].legend()
+                data['hyst_lower'] = (setpoint_plot - hyst_low_plot, f'Hysteresis -{hyst_low:.1f}')
 
         if self.manual_mode_var.get():
             # Manuellt läge - visa endast styrsignal
-            self.axs[1].plot(t, u, label='Manuell styrsignal')
-            # Använd endast u-värden för skalning
-            all_y = np.array(u)
+            data['mode'] = 'manual'
+            data['u_label'] = 'Manuell styrsignal'
+            data['u_ylabel'] = 'Manuell styrsignal (%)'
+            all_y = u
         elif self.preset_mode.get() == "OnOff":
             # On/Off-läge - visa styrsignal med tydlig on/off-karaktär
-            self.axs[1].step(t, u, where='post', label='On/Off styrsignal', linewidth=2)
-            # Använd endast u-värden för skalning
-            all_y = np.array(u)
+            data['mode'] = 'onoff'
+            data['u_label'] = 'On/Off styrsignal'
+            data['u_ylabel'] = 'Styrsignal (%)'
+            all_y = u
         else:
-            # Automatiskt läge - visa PID-ut och summa
-            self.axs[1].plot(t, u, label='PID-ut (begränsad)')
-            # Summan av P+I+D (utan begränsning)
-            kp = self.parse_float(self.kp_var)
-            ti = self.parse_float(self.ti_var) if self.i_active_var.get() else 0.0
-            td = self.parse_float(self.td_var) if self.d_active_var.get() else 0.0
+            # Automatiskt läge - visa PID-ut, summa och P, I, D-bidrag var för sig
+            data['mode'] = 'pid'
+            data['u_label'] = 'PID-ut (begränsad)'
+            data['u_ylabel'] = 'Styrsignal (%)'
+            fp, fi, fd = self.contribution_factors()
+            i_active, d_active = self.active_components()
             # P-bidrag
-            p_vals = np.array([kp*val if val is not None else np.nan for val in e])
+            p_vals = fp * e
             pid_components = [p_vals]
+            data['p'] = p_vals
             # I-bidrag
-            if self.i_active_var.get():
-                i_vals = np.array([kp/ti*v if (v is not None and ti != 0) else np.nan for v in i])
+            if i_active:
+                i_vals = fi * i if fi is not None else np.full(len(i), np.nan)
                 pid_components.append(i_vals)
+                data['i'] = i_vals
             # D-bidrag
-            if self.d_active_var.get():
-                d_vals = np.array([-kp*td*v if v is not None else np.nan for v in d])
+            if d_active:
+                d_vals = fd * d
                 pid_components.append(d_vals)
-            # Summa
+                data['d'] = d_vals
+            # Summan av P+I+D (utan begränsning)
             min_len = min([len(comp) for comp in pid_components])
             sum_vals = np.nansum([comp[:min_len] for comp in pid_components], axis=0)
-            self.axs[1].plot(t[:min_len], sum_vals, label='Summa (P+I+D)', linestyle='--', color='black', alpha=0.7)
+            data['sum'] = sum_vals
             # Utöka y-axeln så att både u och summagrafen syns
-            all_y = np.concatenate([np.array(u)[:min_len], sum_vals])
-        # Utöka y-axeln så att både u och summagrafen syns
-        umin, umax = np.nanmin(all_y), np.nanmax(all_y)
-        if umin == umax:
-            umin -= 1
-            umax += 1
-        uticks = np.linspace(umin, umax, num=8)
-        for uu in uticks:
-            self.axs[1].axhline(uu, color='gray', linewidth=0.3, alpha=0.5, zorder=0)
-        self.axs[1].set_ylim(umin, umax)
-        if self.manual_mode_var.get():
-            self.axs[1].set_ylabel('Manuell styrsignal (%)')
-            self.axs[1].set_xlabel('Tid')  # Visa x-axel i manuellt läge
-        else:
-            self.axs[1].set_ylabel('Styrsignal (%)')
-        self.axs[1].legend()
-
-        # Nedersta: P, I, D-bidrag var för sig (endast i automatläge)
-        if self.manual_mode_var.get() or self.preset_mode.get() == "OnOff":
-            # Manuellt läge eller On/Off - dölj tredje grafen
-            self.axs[2].set_visible(False)
-            # Aktivera x-axel tick labels på andra grafen när tredje är dold
-            self.axs[1].tick_params(axis='x', labelbottom=True)
-            self.axs[1].set_xlabel('Tid')
-        else:
-            # Automatiskt läge - visa PID-bidrag
-            self.axs[2].set_visible(True)
-            # Dölja x-axel tick labels på andra grafen när tredje är synlig
-            self.axs[1].tick_params(axis='x', labelbottom=False)
-            self.axs[1].set_xlabel('')
-            kp = self.parse_float(self.kp_var)
-            ti = self.parse_float(self.ti_var) if self.i_active_var.get() else 0.0
-            td = self.parse_float(self.td_var) if self.d_active_var.get() else 0.0
-            # P-bidrag
-            p_vals = np.array([kp*val if val is not None else np.nan for val in e])
-            pid_components = [p_vals]
-            # I-bidrag
-            if self.i_active_var.get():
-                i_vals = np.array([kp/ti*v if (v is not None and ti != 0) else np.nan for v in i])
-                pid_components.append(i_vals)
-            # D-bidrag
-            if self.d_active_var.get():
-                d_vals = np.array([-kp*td*v if v is not None else np.nan for v in d])
-                pid_components.append(d_vals)
-                
-            self.axs[2].plot(t, p_vals, label='P-bidrag')
-            idx = 0
-            if self.i_active_var.get():
-                self.axs[2].plot(t, i_vals, label='I-bidrag')
-                idx += 1
-            if self.d_active_var.get():
-                self.axs[2].plot(t, d_vals, label='D-bidrag')
-                idx += 1
-            # Skala och etiketter
+            all_y = np.concatenate([u[:min_len], sum_vals])
+            # Skala för PID-bidragen
             all_vals = np.concatenate([comp[~np.isnan(comp)] if np.any(~np.isnan(comp)) else np.array([0.0]) for comp in pid_components])
             if len(all_vals) == 0:
                 all_vals = np.array([0.0, 1.0])
-            vmin, vmax = np.min(all_vals), np.max(all_vals)
-            if vmin == vmax:
-                vmin -= 1
-                vmax += 1
-            vticks = np.linspace(vmin, vmax, num=8)
-            for vv in vticks:
-                self.axs[2].axhline(vv, color='gray', linewidth=0.3, alpha=0.5, zorder=0)
-            self.axs[2].set_ylim(vmin, vmax)
-            
+            data['v_range'] = (np.min(all_vals), np.max(all_vals))
             # Förbättrad ylabel med enhetsinformation
             if self.process_unit_var.get() == "Procent (%)":
-                self.axs[2].set_ylabel('PID-bidrag (%)')
+                data['v_ylabel'] = 'PID-bidrag (%)'
             else:
-                self.axs[2].set_ylabel(f'PID-bidrag ({self.process_unit_var.get()})')
-            
-            self.axs[2].set_xlabel('Tid')
-            self.axs[2].legend()
-        
+                data['v_ylabel'] = f'PID-bidrag ({self.process_unit_var.get()})'
+        data['u_range'] = (np.nanmin(all_y), np.nanmax(all_y))
+        return data
+
+    def draw_full(self, data):
+        """Full omritning: rensar axlarna och skapar alla linjer på nytt"""
+        with self.profiler.phase('artister'):
+            for ax in self.axs:
+                ax.clear()
+            t = data['t']
+            ymin, ymax = data['y_limits']
+            # Nedsampla långa historiker till grafens bredd i pixlar (M4)
+            n_pixels = int(self.axs[0].bbox.width)
+
+            self.axs[0].plot(*decimate(t, data['sp'], n_pixels), 'k--', label=data['sp_label'])
+            self.axs[0].plot(*decimate(t, data['y'], n_pixels), label='Är-värde')
+
+            # Rita hysteresis-linjer
+            for hyst in (data['hyst_upper'], data['hyst_lower']):
+                if hyst is not None:
+                    value, label = hyst
+                    self.axs[0].plot([t[0], t[-1]], [value, value], 'r:', alpha=0.7, linewidth=1, label=label)
+
+            # Tunna horisontella linjer för varje yticks (skala)
+            yticks = np.linspace(ymin, ymax, num=8)
+            for yy in yticks:
+                self.axs[0].axhline(yy, color='gray', linewidth=0.3, alpha=0.5, zorder=0)
+            self.axs[0].set_ylim(ymin, ymax)
+            self.axs[0].set_ylabel(data['y_label'])
+            self.axs[0].legend()
+
+            if data['mode'] == 'onoff':
+                self.axs[1].step(*decimate(t, data['u'], n_pixels), where='post', label=data['u_label'], linewidth=2)
+            else:
+                self.axs[1].plot(*decimate(t, data['u'], n_pixels), label=data['u_label'])
+            if data['mode'] == 'pid':
+                sum_vals = data['sum']
+                self.axs[1].plot(*decimate(t[:len(sum_vals)], sum_vals, n_pixels), label='Summa (P+I+D)', linestyle='--', color='black', alpha=0.7)
+            # Utöka y-axeln så att både u och summagrafen syns
+            umin, umax = data['u_range']
+            if umin == umax:
+                umin -= 1
+                umax += 1
+            uticks = np.linspace(umin, umax, num=8)
+            for uu in uticks:
+                self.axs[1].axhline(uu, color='gray', linewidth=0.3, alpha=0.5, zorder=0)
+            self.axs[1].set_ylim(umin, umax)
+            self.axs[1].set_ylabel(data['u_ylabel'])
+            if data['mode'] == 'manual':
+                self.axs[1].set_xlabel('Tid')  # Visa x-axel i manuellt läge
+            self.axs[1].legend()
+
+            # Nedersta: P, I, D-bidrag var för sig (endast i automatläge)
+            if data['mode'] != 'pid':
+                # Manuellt läge eller On/Off - dölj tredje grafen
+                self.axs[2].set_visible(False)
+                # Aktivera x-axel tick labels på andra grafen när tredje är dold
+                self.axs[1].tick_params(axis='x', labelbottom=True)
+                self.axs[1].set_xlabel('Tid')
+            else:
+                # Automatiskt läge - visa PID-bidrag
+                self.axs[2].set_visible(True)
+                # Dölja x-axel tick labels på andra grafen när tredje är synlig
+                self.axs[1].tick_params(axis='x', labelbottom=False)
+                self.axs[1].set_xlabel('')
+                self.axs[2].plot(*decimate(t, data['p'], n_pixels), label='P-bidrag')
+                if data['i'] is not None:
+                    self.axs[2].plot(*decimate(t, data['i'], n_pixels), label='I-bidrag')
+                if data['d'] is not None:
+                    self.axs[2].plot(*decimate(t, data['d'], n_pixels), label='D-bidrag')
+                # Skala och etiketter
+                vmin, vmax = data['v_range']
+                if vmin == vmax:
+                    vmin -= 1
+                    vmax += 1
+                vticks = np.linspace(vmin, vmax, num=8)
+                for vv in vticks:
+                    self.axs[2].axhline(vv, color='gray', linewidth=0.3, alpha=0.5, zorder=0)
+                self.axs[2].set_ylim(vmin, vmax)
+                self.axs[2].set_ylabel(data['v_ylabel'])
+                self.axs[2].set_xlabel('Tid')
+                self.axs[2].legend()
+
+            # Rita om och justera layout
+            # Anpassa figur-layouten beroende på om vi visar 2 eller 3 plottar
+            if data['mode'] != 'pid':
+                # Manuellt läge eller On/Off - justera layout för endast 2 plottar
+                self.fig.subplots_adjust(hspace=0.3)
+            else:
+                # Automatiskt läge - normal layout för 3 plottar
+                self.fig.subplots_adjust(hspace=0.4)
+        with self.profiler.phase('tight_layout'):
+            self.fig.tight_layout()
+        with self.profiler.phase('canvas.draw'):
+            self.canvas.draw()
+
+    def update_performance(self):
+        """Beräknar och visar prestandamått under graferna"""
         # --- Prestandamått ---
         # Spara prestandamått i en lista för framtida jämförelser
         if not hasattr(self, 'performance_history'):
             self.performance_history = []
-        perf_text = ""
+        perf_lines = ["", "", "", "", ""]
         try:
-            y_arr = np.array(self.y)
-            sp_arr = np.array(self.sp)
-            t_arr = np.array(self.t)
-            if len(y_arr) > 10:
-                overshoot = np.max(y_arr) - sp_arr[0]
-                overshoot_pct = 100 * overshoot / sp_arr[0] if sp_arr[0] != 0 else 0
-                try:
-                    rise_idx = np.where(y_arr >= 0.9*sp_arr[0])[0][0]
-                    rise_time = t_arr[rise_idx]
-                except IndexError:
-                    rise_time = np.nan
-                try:
-                    within_5 = np.abs(y_arr - sp_arr[0]) <= 0.05*np.abs(sp_arr[0])
-                    for idx in range(len(within_5)):
-                        if np.all(within_5[idx:]):
-                            settling_time = t_arr[idx]
-                            break
-                    else:
-                        settling_time = np.nan
-                except Exception:
-                    settling_time = np.nan
-                steady_state_error = y_arr[-1] - sp_arr[0]
-                perf_text = f"Översläng: {overshoot:.2f} ({overshoot_pct:.1f}%)  "
-                perf_text += f"Stigtid (90%): {rise_time:.1f}  "
-                perf_text += f"Inställningstid (±5%): {settling_time:.1f}  "
-                perf_text += f"Stationärt fel: {steady_state_error:.2f}"
+            if len(self.history) > 10:
+                if self.recording is not None:
+                    # Inspelning - vektoriserat över de visade samplen
+                    m = self.recording.metrics(len(self.history))
+                else:
+                    # Måtten uppdateras inkrementellt (O(1) per sampel) i drain_worker()
+                    if len(self.metrics) != self.history.total:
+                        self.rebuild_metrics()
+                    m = self.metrics.result()
+                perf_lines = [
+                    f"Översläng: {m['overshoot']:.2f} ({m['overshoot_pct']:.1f}%)",
+                    f"Stigtid (90%): {m['rise_time']:.1f}",
+                    f"Inställningstid (±5%): {m['settling_time']:.1f}",
+                    f"Stationärt fel: {m['steady_state_error']:.2f}  RMS-fel: {m['rms_error']:.2f}  Max |fel|: {m['max_abs_error']:.2f}",
+                    f"IAE: {m['iae']:.1f}  ISE: {m['ise']:.1f}  ITAE: {m['itae']:.0f}  Dämpkvot: {m['decay_ratio']:.2f}",
+                ]
                 # Spara till historik (ersätt sista om vi bara uppdaterar plott)
-                if getattr(self, '_just_reset', False):
-                    self.performance_history.append({
-                        'overshoot': overshoot,
-                        'overshoot_pct': overshoot_pct,
-                        'rise_time': rise_time,
-                        'settling_time': settling_time,
-                        'steady_state_error': steady_state_error,
-                        'params': {
-                            'Kp': self.pid.Kp,
-                            'Ti': self.pid.Ti,
-                            'Td': self.pid.Td,
-                            'K': self.process.K,
-                            'T': self.process.T,
-                            'dead_time': self.process.dead_time,
-                            'integrerande': self.process.integrerande
-                        }
-                    })
+                if getattr(self, '_just_reset', False) and self.recording is None:
+                    entry = dict(m)
+                    entry['params'] = {
+                        'Kp': self.pid.Kp,
+                        'Ti': self.pid.Ti,
+                        'Td': self.pid.Td,
+                        'K': self.process.K,
+                        'T': self.process.T,
+                        'dead_time': self.process.dead_time,
+                        'integrerande': self.process.integrerande
+                    }
+                    self.performance_history.append(entry)
                     self._just_reset = False
         except Exception:
-            perf_text = ""
-        # Visa prestandamått under graferna
+            perf_lines = ["", "", "", "", ""]
         # Visa prestandamått på separata rader
-        perf_lines = ["", "", "", ""]
-        if perf_text:
-            parts = perf_text.split("  ")
-            for i, part in enumerate(parts):
-                if i < 4:
-                    perf_lines[i] = part.strip()
         for i, lbl in enumerate(self.perf_labels):
-            lbl.config(text=perf_lines[i])
-        # Rita om och justera layout
-        # Anpassa figur-layouten beroende på om vi visar 2 eller 3 plottar
-        if self.manual_mode_var.get() or self.preset_mode.get() == "OnOff":
-            # Manuellt läge eller On/Off - justera layout för endast 2 plottar
-            self.fig.subplots_adjust(hspace=0.3)
-        else:
-            # Automatiskt läge - normal layout för 3 plottar
-            self.fig.subplots_adjust(hspace=0.4)
-        self.fig.tight_layout()
-        self.canvas.draw()
+            self.set_text(lbl, perf_lines[i])
+
     def reset(self):
         self._just_reset = True
         self.running = False
+        self.close_replay()
+        # Ny körning börjar om från t = 0 - loggen avslutas så att tiden i den är växande
+        self.stop_logging()
         self.current_step = 0
         self.process = Process(K=self.parse_float(self.proc_k_var), T=self.validate_T_value(show_warning=True), dead_time=self.parse_float(self.proc_dead_var), integrerande=self.integrerande_var.get(), normalvarde=self.nv_var.get())
         self.pid = PID(Kp=self.parse_float(self.kp_var), Ti=self.parse_float(self.ti_var), Td=self.parse_float(self.td_var), dt=self.dt)
@@ -2499,29 +2587,30 @@ class PIDSimulatorApp:
             self.setpoint = float(str(self.sp_var.get()).replace(",", "."))
         except Exception:
             self.setpoint = 0.0
-        self.t = [0]
-        self.y = [self.nv_var.get()]  # Starta på normalvärdet
-        self.u = [0]
-        self.e = [0]
-        self.i = [0]
-        self.d = [0]
-        self.sp = [self.setpoint]
-        self.formel_label.config(text="")
-        # Återställ markör och tooltip
-        self.cursor_line = None
+        self.engine = SimulationEngine(self.process, self.pid, setpoint=self.setpoint, dt=self.dt)
+        # Tråden stannar och börjar om med den nya motorn; block från förra körningen kastas
+        self.worker.reset(self.engine)
+        self.reset_history()
+        self.set_text(self.formel_label, "")
+        # Återställ tooltip (markören döljs av omritningen)
+        if self.plot_view is not None:
+            self.plot_view.invalidate()
         if self.tooltip and self.tooltip.winfo_exists():
             self.tooltip.place_forget()
-        self.update_plot()
+        self.request_redraw()
         self.update_percent_status()  # Uppdatera procentstatus efter reset
  
 import sys
 
-def on_closing(root):
+def on_closing(root, app=None):
+    if app is not None:
+        app.worker.stop()
+        app.stop_logging()
     root.destroy()
     sys.exit(0)
 
 if __name__ == "__main__":
     root = tk.Tk()
     app = PIDSimulatorApp(root)
-    root.protocol("WM_DELETE_WINDOW", lambda: on_closing(root))
+    root.protocol("WM_DELETE_WINDOW", lambda: on_closing(root, app))
     root.mainloop()
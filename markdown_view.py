@@ -0,0 +1,104 @@
+"""Enkel markdown-visning för hjälp- och teoriflikarna.
+
+parse_markdown() delar upp texten i block (rubriker, listpunkter, kodrader,
+vanlig text) med formaterade textdelar och cachar resultatet.
+render_markdown() skriver blocken i en enda tk.Text-widget med taggar,
+istället för en eller flera Label-widgets per rad.
+"""
+import re
+from functools import lru_cache
+
+BASE_FONT = "Arial"
+
+# Taggar per blocktyp och textstil (samma utseende som de tidigare etiketterna)
+TAG_STYLES = {
+    'h1': dict(font=(BASE_FONT, 16, "bold"), foreground="blue", spacing1=10, spacing3=5),
+    'h2': dict(font=(BASE_FONT, 14, "bold"), foreground="darkblue", spacing1=8, spacing3=3),
+    'h3': dict(font=(BASE_FONT, 12, "bold"), foreground="darkgreen", spacing1=5, spacing3=2),
+    'h4': dict(font=(BASE_FONT, 10, "bold"), foreground="darkred", spacing1=3, spacing3=1),
+    'code': dict(font=("Courier New", 9), background="#f5f5f5", foreground="darkblue",
+                 lmargin1=20, lmargin2=20),
+    'bullet': dict(lmargin1=20, lmargin2=32),
+    'text': dict(spacing1=1, spacing3=1),
+    'blank': dict(font=(BASE_FONT, 4)),
+    'bold': dict(font=(BASE_FONT, 9, "bold")),
+    'italic': dict(font=(BASE_FONT, 9, "italic")),
+}
+
+
+def read_markdown(path, missing_text):
+    """Läs en markdown-fil och ta bort tecken utanför BMP (kan inte visas av Tk)"""
+    try:
+        with open(path, 'r', encoding='utf-8') as f:
+            return re.sub(r'[^\u0000-\uFFFF]', '', f.read())
+    except FileNotFoundError:
+        return missing_text
+
+
+def parse_spans(text):
+    """Dela en rad i (text, stil)-delar: **fetstil**, *kursiv* och vanlig text (stil None)"""
+    spans = []
+    for i, part in enumerate(text.split('**')):
+        if not part:
+            continue
+        if i % 2 == 1:
+            spans.append((part, 'bold'))
+            continue
+        for j, italic_part in enumerate(part.split('*')):
+            if italic_part:
+                spans.append((italic_part, 'italic' if j % 2 == 1 else None))
+    return tuple(spans)
+
+
+@lru_cache(maxsize=8)
+def parse_markdown(markdown_text):
+    """Tolka markdown till en tupel av (blocktyp, delar) där delar är (text, stil)-par"""
+    blocks = []
+    in_code_block = False
+    for original_line in markdown_text.split('\n'):
+        line = original_line.strip()
+        if line.startswith('```'):
+            in_code_block = not in_code_block
+            if not in_code_block:
+                # Avsluta kodblock med extra mellanrum
+                blocks.append(('blank', ()))
+            continue
+        if in_code_block:
+            # Kodrad - behåll indraget
+            blocks.append(('code', ((original_line, None),)))
+        elif not line:
+            blocks.append(('blank', ()))
+        elif line.startswith('#### '):
+            blocks.append(('h4', ((line[5:], None),)))
+        elif line.startswith('### '):
+            blocks.append(('h3', ((line[4:], None),)))
+        elif line.startswith('## '):
+            blocks.append(('h2', ((line[3:], None),)))
+        elif line.startswith('# '):
+            blocks.append(('h1', ((line[2:], None),)))
+        elif line.startswith('- ') or line.startswith('* '):
+            blocks.append(('bullet', parse_spans(f"• {line[2:]}")))
+        elif '*' in line:
+            blocks.append(('text', parse_spans(line)))
+        else:
+            blocks.append(('text', ((line, None),)))
+    return tuple(blocks)
+
+
+def render_markdown(text_widget, blocks):
+    """Skriv tolkade block i en tk.Text-widget (ett enda insert-anrop) och lås den för redigering"""
+    for tag, style in TAG_STYLES.items():
+        text_widget.tag_configure(tag, **style)
+    # insert(index, text1, taggar1, text2, taggar2, ...)
+    args = []
+    for kind, spans in blocks:
+        for text, style in spans:
+            args.append(text)
+            args.append((kind, style) if style else (kind,))
+        args.append('\n')
+        args.append((kind,))
+    text_widget.configure(state='normal')
+    text_widget.delete('1.0', 'end')
+    if args:
+        text_widget.insert('end', *args)
+    text_widget.configure(state='disabled')
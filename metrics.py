@@ -0,0 +1,213 @@
+"""Prestandamått för stegsvar: översläng, stigtid, inställningstid m.m.
+
+step_metrics() räknar alla mått på en hel historik i O(n) (vektoriserat),
+StepMetrics uppdaterar samma mått i O(1) per nytt sampel. Referensbörvärdet
+är börvärdet i första samplet, som i GUI:ts prestandaruta; felintegralerna
+(IAE, ISE, ITAE) använder börvärdet i varje sampel.
+
+Medel-, RMS- och maxfelet (sp - y i varje sampel) räknas som löpande
+summor, så StepMetrics behöver aldrig hela historiken - den fungerar även
+med en rullande historik i körningar utan slut.
+"""
+import numpy as np
+
+BAND = 0.05  # Inställningstid: inom ±5% av börvärdet
+RISE_LEVEL = 0.9  # Stigtid: första gången PV når 90% av börvärdet
+
+
+def empty_metrics():
+    return {
+        'overshoot': np.nan, 'overshoot_pct': np.nan, 'rise_time': np.nan,
+        'settling_time': np.nan, 'steady_state_error': np.nan,
+        'iae': 0.0, 'ise': 0.0, 'itae': 0.0, 'decay_ratio': np.nan,
+        'mean_error': np.nan, 'rms_error': np.nan, 'max_abs_error': np.nan,
+    }
+
+
+def step_metrics(t, y, sp, band=BAND, rise_level=RISE_LEVEL):
+    """Beräkna prestandamått för en hel historik (arrayer t, y, sp) i O(n)"""
+    t = np.asarray(t, dtype=float)
+    y = np.asarray(y, dtype=float)
+    sp = np.asarray(sp, dtype=float)
+    result = empty_metrics()
+    if len(y) == 0:
+        return result
+    sp0 = sp[0]
+
+    result['overshoot'] = np.max(y) - sp0
+    result['overshoot_pct'] = 100 * result['overshoot'] / sp0 if sp0 != 0 else 0
+    reached = np.flatnonzero(y >= rise_level * sp0)
+    if len(reached):
+        result['rise_time'] = t[reached[0]]
+    # Inställningstid: första sampel efter det sista som ligger utanför bandet
+    outside = np.flatnonzero(np.abs(y - sp0) > band * np.abs(sp0))
+    if len(outside) == 0:
+        result['settling_time'] = t[0]
+    elif outside[-1] + 1 < len(y):
+        result['settling_time'] = t[outside[-1] + 1]
+    result['steady_state_error'] = y[-1] - sp0
+    e = sp - y
+    result['mean_error'] = float(np.mean(e))
+    result['rms_error'] = float(np.sqrt(np.mean(e * e)))
+    result['max_abs_error'] = float(np.max(np.abs(e)))
+
+    # Felintegraler (rektangelregel, ett bidrag per sampel efter det första)
+    if len(y) > 1:
+        abs_e = np.abs(sp[1:] - y[1:])
+        dt = np.diff(t)
+        result['iae'] = float(np.sum(abs_e * dt))
+        result['ise'] = float(np.sum(abs_e * abs_e * dt))
+        result['itae'] = float(np.sum(t[1:] * abs_e * dt))
+
+    # Dämpkvot: andra toppens översläng delat med första toppens
+    if len(y) > 2:
+        mid = y[1:-1]
+        peaks = np.flatnonzero((mid > y[:-2]) & (mid >= y[2:]) & (mid > sp0)) + 1
+        if len(peaks) >= 2:
+            result['decay_ratio'] = (y[peaks[1]] - sp0) / (y[peaks[0]] - sp0)
+    return result
+
+
+class StepMetrics:
+    """Inkrementell variant av step_metrics() - O(1) per nytt sampel"""
+    def __init__(self, band=BAND, rise_level=RISE_LEVEL):
+        self.band = band
+        self.rise_level = rise_level
+        self.n = 0
+        self.sp0 = None
+        self.y_max = -np.inf
+        self.rise_time = np.nan
+        self.settling_time = np.nan
+        self.inside = False  # Om senaste samplet ligger inom bandet
+        self.iae = 0.0
+        self.ise = 0.0
+        self.itae = 0.0
+        self.t_prev = None
+        self.y_prev = None
+        self.y_prev2 = None
+        self.peaks = []  # De två första topparna över börvärdet
+        self.y_last = np.nan
+        self.e_sum = 0.0
+        self.e_square_sum = 0.0
+        self.max_abs_e = 0.0
+
+    def __len__(self):
+        return self.n
+
+    def update(self, t, y, sp):
+        """Lägg till ett sampel"""
+        if self.n == 0:
+            self.sp0 = sp
+        sp0 = self.sp0
+        if y > self.y_max:
+            self.y_max = y
+        if self.rise_time != self.rise_time and y >= self.rise_level * sp0:
+            self.rise_time = t
+        inside = abs(y - sp0) <= self.band * abs(sp0)
+        if not inside:
+            self.settling_time = np.nan
+        elif not self.inside:
+            self.settling_time = t  # Första sampel efter att PV senast var utanför bandet
+        self.inside = inside
+
+        e = sp - y
+        self.e_sum += e
+        self.e_square_sum += e * e
+        if abs(e) > self.max_abs_e:
+            self.max_abs_e = abs(e)
+        if self.t_prev is not None:
+            abs_e = abs(e)
+            dt = t - self.t_prev
+            self.iae += abs_e * dt
+            self.ise += abs_e * abs_e * dt
+            self.itae += t * abs_e * dt
+        if (len(self.peaks) < 2 and self.y_prev2 is not None and self.y_prev > self.y_prev2
+                and self.y_prev >= y and self.y_prev > sp0):
+            self.peaks.append(self.y_prev)
+
+        self.y_prev2 = self.y_prev
+        self.y_prev = y
+        self.t_prev = t
+        self.y_last = y
+        self.n += 1
+
+    def extend(self, t, y, sp):
+        """Lägg till flera sampel (arrayer) - vektoriserat, samma resultat som update() per sampel"""
+        t = np.asarray(t, dtype=float)
+        y = np.asarray(y, dtype=float)
+        sp = np.asarray(sp, dtype=float)
+        if len(y) == 0:
+            return
+        if self.n == 0:
+            self.sp0 = float(sp[0])
+        sp0 = self.sp0
+        # Jämförelserna är falska för NaN, precis som i update()
+        above = y[y > self.y_max]
+        if len(above):
+            self.y_max = float(above.max())
+        if self.rise_time != self.rise_time:
+            reached = np.flatnonzero(y >= self.rise_level * sp0)
+            if len(reached):
+                self.rise_time = float(t[reached[0]])
+        inside = np.abs(y - sp0) <= self.band * abs(sp0)
+        outside = np.flatnonzero(~inside)
+        if not inside[-1]:
+            self.settling_time = np.nan
+        elif len(outside):
+            self.settling_time = float(t[outside[-1] + 1])
+        elif not self.inside:
+            self.settling_time = float(t[0])
+        self.inside = bool(inside[-1])
+
+        # Summorna ackumuleras i samma ordning som i update() (cumsum är sekventiell)
+        e = sp - y
+        self.e_sum = float(np.cumsum(np.concatenate(([self.e_sum], e)))[-1])
+        self.e_square_sum = float(np.cumsum(np.concatenate(([self.e_square_sum], e * e)))[-1])
+        abs_e = np.abs(e)
+        larger = abs_e[abs_e > self.max_abs_e]
+        if len(larger):
+            self.max_abs_e = float(larger.max())
+        if self.t_prev is None:
+            t_from, abs_e = t[:-1], abs_e[1:]
+        else:
+            t_from = np.concatenate(([self.t_prev], t[:-1]))
+        t_to = t[len(t) - len(abs_e):]
+        dt = t_to - t_from
+        self.iae = float(np.cumsum(np.concatenate(([self.iae], abs_e * dt)))[-1])
+        self.ise = float(np.cumsum(np.concatenate(([self.ise], abs_e * abs_e * dt)))[-1])
+        self.itae = float(np.cumsum(np.concatenate(([self.itae], t_to * abs_e * dt)))[-1])
+
+        # Toppar: sampel större än föregående, minst lika stort som nästa och över börvärdet
+        previous = [v for v in (self.y_prev2, self.y_prev) if v is not None]
+        yy = np.concatenate((previous, y))
+        if len(self.peaks) < 2 and len(yy) > 2:
+            mid = yy[1:-1]
+            peaks = np.flatnonzero((mid > yy[:-2]) & (mid >= yy[2:]) & (mid > sp0)) + 1
+            self.peaks.extend(float(v) for v in yy[peaks[:2 - len(self.peaks)]])
+
+        self.y_prev2 = float(yy[-2]) if len(yy) > 1 else None
+        self.y_prev = float(yy[-1])
+        self.t_prev = float(t[-1])
+        self.y_last = float(y[-1])
+        self.n += len(y)
+
+    def result(self):
+        """Aktuella prestandamått som dict (samma nycklar som step_metrics)"""
+        result = empty_metrics()
+        if self.n == 0:
+            return result
+        sp0 = self.sp0
+        result['overshoot'] = self.y_max - sp0
+        result['overshoot_pct'] = 100 * result['overshoot'] / sp0 if sp0 != 0 else 0
+        result['rise_time'] = self.rise_time
+        result['settling_time'] = self.settling_time
+        result['steady_state_error'] = self.y_last - sp0
+        result['iae'] = self.iae
+        result['ise'] = self.ise
+        result['itae'] = self.itae
+        result['mean_error'] = self.e_sum / self.n
+        result['rms_error'] = (self.e_square_sum / self.n) ** 0.5
+        result['max_abs_error'] = self.max_abs_e
+        if len(self.peaks) >= 2:
+            result['decay_ratio'] = (self.peaks[1] - sp0) / (self.peaks[0] - sp0)
+        return result
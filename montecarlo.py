@@ -0,0 +1,124 @@
+"""Monte Carlo-analys av störningskänslighet.
+
+Samma reglerkrets (en SimulationEngine som mall) körs K gånger med olika
+slumpfrön för bruset, eventuellt med en pulsstörning vid ett givet steg.
+Realiseringarna fördelas över en ProcessPoolExecutor och resultatet blir
+percentilband för PV och styrsignal samt fördelningen av prestandamåtten.
+
+    engine = SimulationEngine(Process(K=2, T=15, dead_time=3), PID(Kp=2, Ti=10, Td=1),
+                              noise_std=0.5)
+    result = monte_carlo(engine, n_runs=500, n_steps=2000, seed=1)
+    result.band('y', 95)          # 95:e percentilen av PV per tidssteg
+    result.kpi_summary()['iae']   # {5: ..., 25: ..., 50: ..., 75: ..., 95: ...}
+"""
+import copy
+import os
+from concurrent.futures import ProcessPoolExecutor
+
+import numpy as np
+
+from metrics import empty_metrics, step_metrics
+
+PERCENTILES = (5, 25, 50, 75, 95)
+MIN_PARALLEL_STEPS = 200_000  # Färre steg totalt körs i samma process (poolstart kostar mer)
+
+
+class MonteCarloResult:
+    """
+    Percentilband (formen (antal percentiler, n_steps+1)) för PV ('y') och
+    styrsignal ('u') samt prestandamått per realisering (arrayer med längd K).
+    """
+    def __init__(self, t, percentiles, bands, kpis):
+        self.t = t
+        self.percentiles = tuple(percentiles)
+        self.bands = bands
+        self.kpis = kpis
+
+    @property
+    def n_runs(self):
+        return len(next(iter(self.kpis.values())))
+
+    def band(self, signal, q):
+        """Percentil q (en av self.percentiles) för signalen 'y' eller 'u' per tidssteg"""
+        return self.bands[signal][self.percentiles.index(q)]
+
+    def kpi_summary(self, percentiles=None):
+        """Percentiler för varje prestandamått: {mått: {q: värde}} (NaN ignoreras)"""
+        percentiles = self.percentiles if percentiles is None else tuple(percentiles)
+        summary = {}
+        for name, values in self.kpis.items():
+            finite = values[np.isfinite(values)]
+            if len(finite):
+                summary[name] = dict(zip(percentiles, np.percentile(finite, percentiles).tolist()))
+            else:
+                summary[name] = {q: np.nan for q in percentiles}
+        return summary
+
+
+def run_realization(engine, n_steps, pulse=None):
+    """Kör en realisering. pulse = (startsteg, storlek, antal steg) eller None"""
+    if pulse is None:
+        result = engine.run(n_steps)
+        return result.t, result.y, result.u, result.sp
+    start, magnitude, steps = pulse
+    start = max(0, min(int(start), n_steps))
+    before = engine.run(start)
+    engine.trigger_pulse(magnitude, steps)
+    after = engine.run(n_steps - start)
+    # Första raden i `after` är samma sampel som sista raden i `before`
+    return tuple(np.concatenate((getattr(before, name), getattr(after, name)[1:]))
+                 for name in ('t', 'y', 'u', 'sp'))
+
+
+def run_chunk(template, seeds, n_steps, pulse=None):
+    """Kör en realisering per frö på kopior av mallen (körs i arbetsprocesserna)"""
+    n_runs = len(seeds)
+    y = np.empty((n_runs, n_steps + 1))
+    u = np.empty((n_runs, n_steps + 1))
+    kpis = {name: np.empty(n_runs) for name in empty_metrics()}
+    t = None
+    for r, seed in enumerate(seeds):
+        engine = copy.deepcopy(template)
+        engine.rng = np.random.default_rng(seed)
+        t, y[r], u[r], sp = run_realization(engine, n_steps, pulse)
+        for name, value in step_metrics(t, y[r], sp).items():
+            kpis[name][r] = value
+    return t, y, u, kpis
+
+
+def monte_carlo(template, n_runs=100, n_steps=1000, seed=None, pulse=None, workers=None,
+                percentiles=PERCENTILES):
+    """
+    Kör n_runs realiseringar av mallens reglerkrets från dess nuvarande
+    tillstånd (anropa template.reset() först för att starta från början).
+    Fröna härleds med SeedSequence(seed).spawn, så resultatet beror bara på
+    seed och inte på antalet arbetsprocesser. workers=None använder alla
+    kärnor; workers=1 kör allt i den anropande processen.
+    """
+    n_runs = int(n_runs)
+    n_steps = int(n_steps)
+    if n_runs < 1:
+        raise ValueError("Antal körningar måste vara minst 1")
+    seeds = np.random.SeedSequence(seed).spawn(n_runs)
+    if workers is None:
+        workers = os.cpu_count() or 1
+    workers = max(1, min(int(workers), n_runs))
+
+    if workers == 1 or n_runs * n_steps < MIN_PARALLEL_STEPS:
+        t, y, u, kpis = run_chunk(template, seeds, n_steps, pulse)
+    else:
+        # Några bitar per arbetsprocess jämnar ut lasten utan för mycket överföring
+        chunks = [list(c) for c in np.array_split(np.array(seeds, dtype=object), workers * 4) if len(c)]
+        with ProcessPoolExecutor(max_workers=workers) as pool:
+            parts = list(pool.map(run_chunk, [template] * len(chunks), chunks,
+                                  [n_steps] * len(chunks), [pulse] * len(chunks)))
+        t = parts[0][0]
+        y = np.concatenate([p[1] for p in parts])
+        u = np.concatenate([p[2] for p in parts])
+        kpis = {name: np.concatenate([p[3][name] for p in parts]) for name in parts[0][3]}
+
+    bands = {
+        'y': np.percentile(y, percentiles, axis=0),
+        'u': np.percentile(u, percentiles, axis=0),
+    }
+    return MonteCarloResult(t, percentiles, bands, kpis)
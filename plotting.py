@@ -0,0 +1,347 @@
+"""Inkrementell grafritning med persistenta Line2D-objekt och blitting.
+
+PlotView skapar linjerna i de tre graferna en gång och uppdaterar dem sedan
+med set_data. Axlar, legender och layout ritas bara om när något strukturellt
+ändras (gränser, etiketter, synlighet); annars återställs en cachad bakgrund
+och endast kurvorna ritas och blittas.
+
+Långa historiker nedsamplas med M4 (första, sista, min och max per
+pixelkolumn) innan de lämnas till Matplotlib, så att ritkostnaden begränsas
+av skärmens upplösning istället för antalet sampel.
+"""
+from contextlib import contextmanager
+
+import numpy as np
+
+from profiler import NO_PROFILER
+
+N_GRID_LINES = 8  # Antal tunna horisontella skallinjer per graf (som i hela omritningen)
+
+
+def m4_indices(values, n_buckets):
+    """
+    Index för min/max-bevarande M4-nedsampling: första, sista, minsta och
+    största värdet i varje hink. Returnerar None om ingen nedsampling behövs.
+    """
+    n = len(values)
+    n_buckets = max(1, int(n_buckets))
+    if n <= 4 * n_buckets:
+        return None
+    size = -(-n // n_buckets)  # Sampel per hink (avrundat uppåt)
+    rows = n // size
+    body = np.asarray(values[:rows * size]).reshape(rows, size)
+    missing = np.isnan(body)
+    base = np.arange(rows) * size
+    parts = [
+        base,
+        base + np.where(missing, np.inf, body).argmin(axis=1),
+        base + np.where(missing, -np.inf, body).argmax(axis=1),
+        base + size - 1,
+    ]
+    if rows * size < n:
+        # Ofullständig sista hink
+        tail = np.asarray(values[rows * size:])
+        tail_missing = np.isnan(tail)
+        parts.append(rows * size + np.array([
+            0,
+            np.where(tail_missing, np.inf, tail).argmin(),
+            np.where(tail_missing, -np.inf, tail).argmax(),
+            len(tail) - 1,
+        ]))
+    return np.unique(np.concatenate(parts))
+
+
+def decimate(t, values, n_pixels):
+    """Nedsampla en kurva till högst ~4 punkter per pixelkolumn"""
+    idx = m4_indices(values, n_pixels)
+    if idx is None:
+        return t, values
+    return t[idx], values[idx]
+
+
+def nearest_index(t, x):
+    """Index för samplet närmast x i den monotont växande tidsarrayen t (binärsökning)"""
+    idx = int(np.searchsorted(t, x))
+    if idx >= len(t):
+        return len(t) - 1
+    if idx > 0 and abs(t[idx - 1] - x) <= abs(t[idx] - x):
+        return idx - 1
+    return idx
+
+
+def expand_limits(current, lo, hi, margin=0.05, shrink=0.5):
+    """
+    Returnera axelgränser som rymmer [lo, hi]. Befintliga gränser behålls så
+    länge datat ryms och fyller minst `shrink` av intervallet, så att axeln
+    inte behöver ritas om vid varje nytt sampel.
+    """
+    if not np.isfinite(lo) or not np.isfinite(hi):
+        lo, hi = 0.0, 1.0
+    if lo == hi:
+        lo -= 1
+        hi += 1
+    if current is not None:
+        c_lo, c_hi = current
+        if c_lo <= lo and hi <= c_hi and (hi - lo) >= shrink * (c_hi - c_lo):
+            return current
+    pad = margin * (hi - lo)
+    return (lo - pad, hi + pad)
+
+
+class PlotView:
+    """Persistenta artister för processvärde-, styrsignal- och PID-bidragsgraferna"""
+    x_growth = 1.5  # Faktor som tidsaxeln växer med när kurvan når högerkanten
+    x_min_span = 50.0  # Minsta synliga tidsintervall i "Visa allt"-läget
+
+    def __init__(self, fig, axs, canvas, profiler=NO_PROFILER):
+        self.fig = fig
+        self.axs = axs
+        self.canvas = canvas
+        self.profiler = profiler  # Tid per fas: artister, tight_layout, canvas.draw, blit
+        ax0, ax1, ax2 = axs
+        for ax in axs:
+            ax.clear()
+
+        # Kurvor (animerade - ritas med blitting ovanpå cachad bakgrund)
+        self.sp_line, = ax0.plot([], [], 'k--', animated=True)
+        self.y_line, = ax0.plot([], [], color='C0', label='Är-värde', animated=True)
+        self.u_line, = ax1.plot([], [], color='C0', animated=True)
+        self.sum_line, = ax1.plot([], [], linestyle='--', color='black', alpha=0.7,
+                                  label='Summa (P+I+D)', animated=True)
+        self.p_line, = ax2.plot([], [], color='C0', label='P-bidrag', animated=True)
+        self.i_line, = ax2.plot([], [], color='C1', label='I-bidrag', animated=True)
+        self.d_line, = ax2.plot([], [], color='C2', label='D-bidrag', animated=True)
+        self.curves = [self.sp_line, self.y_line, self.u_line, self.sum_line,
+                       self.p_line, self.i_line, self.d_line]
+
+        # Statiska linjer (ingår i bakgrunden)
+        self.hyst_upper = ax0.axhline(0, color='r', linestyle=':', alpha=0.7, linewidth=1)
+        self.hyst_lower = ax0.axhline(0, color='r', linestyle=':', alpha=0.7, linewidth=1)
+        self.grid_lines = [
+            [ax.axhline(0, color='gray', linewidth=0.3, alpha=0.5, zorder=0) for _ in range(N_GRID_LINES)]
+            for ax in axs
+        ]
+
+        self.x_limits = None
+        self.u_limits = None
+        self.v_limits = None
+        self.structure = None  # Senast ritade struktur; ändring => full omritning
+        self.background = None
+        self.draw_cid = canvas.mpl_connect('draw_event', self.on_draw)
+
+    def detach(self):
+        """Koppla loss från canvas (t.ex. vid byte till full omritning)"""
+        self.canvas.mpl_disconnect(self.draw_cid)
+        self.background = None
+
+    def invalidate(self):
+        """Tvinga full omritning vid nästa update (t.ex. efter återställning)"""
+        self.structure = None
+        self.x_limits = None
+        self.u_limits = None
+        self.v_limits = None
+
+    def on_draw(self, event):
+        """Cacha bakgrunden efter varje full omritning och lägg tillbaka kurvorna"""
+        self.background = self.canvas.copy_from_bbox(self.fig.bbox)
+        self.draw_curves()
+
+    def draw_curves(self):
+        for line in self.curves:
+            if line.get_visible() and line.axes.get_visible():
+                line.axes.draw_artist(line)
+
+    def blit(self):
+        """Rita om endast kurvorna ovanpå den cachade bakgrunden"""
+        if self.background is None:
+            with self.profiler.phase('canvas.draw'):
+                self.canvas.draw()
+            return
+        with self.profiler.phase('blit'):
+            self.canvas.restore_region(self.background)
+            self.draw_curves()
+            self.canvas.blit(self.fig.bbox)
+
+    @contextmanager
+    def static_artists(self):
+        """Gör kurvorna icke-animerade tillfälligt, t.ex. vid savefig"""
+        for line in self.curves:
+            line.set_animated(False)
+        try:
+            yield
+        finally:
+            for line in self.curves:
+                line.set_animated(True)
+
+    def next_x_limits(self, t, window):
+        """Tidsaxelns gränser: fast i fönsterläge, växer i steg i "Visa allt"-läget"""
+        if window is not None:
+            return window
+        if len(t) == 0:
+            return (0.0, self.x_min_span)
+        t0, t1 = float(t[0]), float(t[-1])
+        # Med rullande historik flyttas t0 framåt - gränserna behålls så länge datat ryms
+        if self.x_limits is not None and self.x_limits[0] <= t0 and t1 <= self.x_limits[1]:
+            return self.x_limits
+        return (t0, t0 + max(self.x_min_span, (t1 - t0) * self.x_growth))
+
+    def data_pixels(self, t):
+        """Antal pixelkolumner som datat täcker i x-led (styr nedsamplingen)"""
+        if len(t) < 2:
+            return 1
+        lo, hi = self.x_limits
+        fraction = (t[-1] - t[0]) / (hi - lo) if hi > lo else 1.0
+        return max(1, int(self.axs[0].bbox.width * min(1.0, fraction)))
+
+    def set_line(self, line, t, values, n_pixels):
+        line.set_data(*decimate(t, values, n_pixels))
+
+    def update(self, data):
+        """Uppdatera graferna från ett dict med plotdata (se PIDSimulatorApp.collect_plot_data)"""
+        ax0, ax1, ax2 = self.axs
+        t = data['t']
+        mode = data['mode']
+
+        with self.profiler.phase('artister'):
+            self.x_limits = self.next_x_limits(t, data.get('x_window'))
+            n_pixels = self.data_pixels(t)
+            self.set_line(self.sp_line, t, data['sp'], n_pixels)
+            self.set_line(self.y_line, t, data['y'], n_pixels)
+            self.set_line(self.u_line, t, data['u'], n_pixels)
+            self.u_line.set_drawstyle('steps-post' if mode == 'onoff' else 'default')
+            self.u_line.set_linewidth(2 if mode == 'onoff' else 1.5)
+
+            pid_mode = mode == 'pid'
+            self.sum_line.set_visible(pid_mode)
+            if pid_mode:
+                self.set_line(self.sum_line, t[:len(data['sum'])], data['sum'], n_pixels)
+                self.set_line(self.p_line, t, data['p'], n_pixels)
+                for line, key in ((self.i_line, 'i'), (self.d_line, 'd')):
+                    line.set_visible(data[key] is not None)
+                    if data[key] is not None:
+                        self.set_line(line, t, data[key], n_pixels)
+
+            self.u_limits = expand_limits(self.u_limits, *data['u_range'])
+            if pid_mode:
+                self.v_limits = expand_limits(self.v_limits, *data['v_range'])
+
+            structure = (
+                mode, self.x_limits, tuple(data['y_limits']), self.u_limits,
+                self.v_limits if pid_mode else None,
+                data['y_label'], data['sp_label'], data['u_label'], data['u_ylabel'], data['v_ylabel'],
+                data['hyst_upper'], data['hyst_lower'],
+                data['i'] is not None, data['d'] is not None,
+            )
+        if structure == self.structure:
+            self.blit()
+            return
+        self.structure = structure
+        self.redraw_axes(data)
+
+    def redraw_axes(self, data):
+        """Full omritning av axlar, skallinjer, legender och layout"""
+        with self.profiler.phase('artister'):
+            ax0, ax1, ax2 = self.axs
+            pid_mode = data['mode'] == 'pid'
+            for ax in self.axs:
+                ax.set_xlim(*self.x_limits)
+
+            # Processvärde
+            self.sp_line.set_label(data['sp_label'])
+            for line, hyst in ((self.hyst_upper, data['hyst_upper']), (self.hyst_lower, data['hyst_lower'])):
+                line.set_visible(hyst is not None)
+                if hyst is not None:
+                    value, label = hyst
+                    line.set_ydata([value, value])
+                    line.set_label(label)
+            self.set_grid(0, data['y_limits'])
+            ax0.set_ylabel(data['y_label'])
+            ax0.legend(handles=[l for l in (self.sp_line, self.y_line, self.hyst_upper, self.hyst_lower)
+                                if l.get_visible()])
+
+            # Styrsignal
+            self.u_line.set_label(data['u_label'])
+            self.set_grid(1, self.u_limits)
+            ax1.set_ylabel(data['u_ylabel'])
+            ax1.legend(handles=[l for l in (self.u_line, self.sum_line) if l.get_visible()])
+
+            # PID-bidrag
+            ax2.set_visible(pid_mode)
+            if pid_mode:
+                ax1.tick_params(axis='x', labelbottom=False)
+                ax1.set_xlabel('')
+                self.set_grid(2, self.v_limits)
+                ax2.set_ylabel(data['v_ylabel'])
+                ax2.set_xlabel('Tid')
+                ax2.legend(handles=[l for l in (self.p_line, self.i_line, self.d_line) if l.get_visible()])
+            else:
+                ax1.tick_params(axis='x', labelbottom=True)
+                ax1.set_xlabel('Tid')
+
+            self.fig.subplots_adjust(hspace=0.4 if pid_mode else 0.3)
+        with self.profiler.phase('tight_layout'):
+            self.fig.tight_layout()
+        with self.profiler.phase('canvas.draw'):
+            self.canvas.draw()
+
+    def set_grid(self, index, limits):
+        """Sätt y-gränser och flytta de tunna skallinjerna"""
+        lo, hi = limits
+        for line, yy in zip(self.grid_lines[index], np.linspace(lo, hi, num=N_GRID_LINES)):
+            line.set_ydata([yy, yy])
+        self.axs[index].set_ylim(lo, hi)
+
+
+class Crosshair:
+    """
+    Vertikal markör i alla grafer som flyttas med blitting. Bakgrunden
+    (graferna utan markör) kopieras från canvas första gången markören visas
+    efter en omritning, så att en musrörelse bara kostar en återställning,
+    en linje per graf och en blit.
+    """
+    def __init__(self, fig, axs, canvas):
+        self.fig = fig
+        self.axs = axs
+        self.canvas = canvas
+        self.lines = []
+        self.background = None
+        self.x = None  # Markörens position, None = dold
+        self.draw_cid = canvas.mpl_connect('draw_event', self.on_draw)
+
+    def on_draw(self, event):
+        self.invalidate()
+
+    def invalidate(self):
+        """Graferna har ritats om (fullt eller med blitting) och markören syns inte längre"""
+        self.background = None
+        self.x = None
+
+    def ensure_lines(self, x):
+        # Linjerna försvinner när axlarna rensas (ax.clear) och skapas då på nytt
+        if not self.lines or any(line.axes is None for line in self.lines):
+            self.lines = [ax.axvline(x, color='red', linestyle='--', linewidth=1, zorder=10, animated=True)
+                          for ax in self.axs]
+
+    def show(self, x):
+        """Visa markören vid x (tid)"""
+        if x == self.x:
+            return
+        self.ensure_lines(x)
+        if self.background is None:
+            self.background = self.canvas.copy_from_bbox(self.fig.bbox)
+        else:
+            self.canvas.restore_region(self.background)
+        for line in self.lines:
+            line.set_xdata([x, x])
+            if line.axes.get_visible():
+                line.axes.draw_artist(line)
+        self.canvas.blit(self.fig.bbox)
+        self.x = x
+
+    def hide(self):
+        """Dölj markören (gör inget om den redan är dold)"""
+        if self.x is None:
+            return
+        self.canvas.restore_region(self.background)
+        self.canvas.blit(self.fig.bbox)
+        self.x = None
@@ -0,0 +1,113 @@
+"""Rullande tidsmätning per fas för simuleringen och grafritningen.
+
+PhaseProfiler samlar hur lång tid varje fas tar (t.ex. regulatorberäkning
+i tråden, läsning av Tk-variabler, formeletiketten, Matplotlib-artister,
+tight_layout och canvas.draw) och räknar händelser (steg, bilder) över de
+senaste window sekunderna. Avstängd kostar en mätpunkt bara ett
+attributuppslag och en delad tom kontexthanterare.
+
+    profiler = PhaseProfiler()
+    profiler.enabled = True
+    with profiler.phase('canvas.draw'):
+        canvas.draw()
+    profiler.count('bilder')
+    print(profiler.report())
+"""
+import collections
+import contextlib
+import time
+
+_IDLE = contextlib.nullcontext()  # Delas av alla mätpunkter när profileringen är avstängd
+
+
+class PhaseProfiler:
+    """Tider per fas och händelser per sekund över ett rullande tidsfönster"""
+    def __init__(self, window=2.0):
+        self.enabled = False
+        self.window = window  # Sekunder som medelvärden och takter räknas över
+        self.phases = {}  # Fas -> deque med (tidpunkt, sekunder)
+        self.counters = {}  # Namn -> deque med (tidpunkt, antal)
+        self.started = time.perf_counter()
+
+    def clear(self):
+        self.phases.clear()
+        self.counters.clear()
+        self.started = time.perf_counter()
+
+    def span(self, now):
+        """Tiden som takterna räknas över: fönstret, eller kortare direkt efter clear()"""
+        return max(1e-9, min(self.window, now - self.started))
+
+    def phase(self, name):
+        """Kontexthanterare som mäter tiden för en fas (gör ingenting när profileringen är av)"""
+        if not self.enabled:
+            return _IDLE
+        return self._measure(name)
+
+    @contextlib.contextmanager
+    def _measure(self, name):
+        started = time.perf_counter()
+        try:
+            yield
+        finally:
+            self.add(name, time.perf_counter() - started)
+
+    def add(self, name, seconds, now=None):
+        """Lägg till en uppmätt tid för en fas (t.ex. mätt i simuleringstråden)"""
+        if self.enabled:
+            self._record(self.phases, name, seconds, now)
+
+    def count(self, name, n=1, now=None):
+        """Räkna n händelser (steg, bilder, ...)"""
+        if self.enabled:
+            self._record(self.counters, name, n, now)
+
+    def _record(self, table, name, value, now):
+        now = time.perf_counter() if now is None else now
+        samples = table.get(name)
+        if samples is None:
+            samples = table[name] = collections.deque()
+        samples.append((now, value))
+        while samples[0][0] < now - self.window:
+            samples.popleft()
+
+    def _recent(self, samples, now):
+        return [value for when, value in samples if when >= now - self.window]
+
+    def rate(self, name, now=None):
+        """Händelser per sekund över fönstret"""
+        now = time.perf_counter() if now is None else now
+        values = self._recent(self.counters.get(name, ()), now)
+        return sum(values) / self.span(now)
+
+    def stats(self, now=None):
+        """Fas -> (anrop per sekund, medeltid i s, maxtid i s, andel av väggklockan)"""
+        now = time.perf_counter() if now is None else now
+        span = self.span(now)
+        result = {}
+        for name, samples in self.phases.items():
+            values = self._recent(samples, now)
+            if values:
+                total = sum(values)
+                result[name] = (len(values) / span, total / len(values), max(values), total / span)
+        return result
+
+    def report(self, requested_delay=None, now=None):
+        """Textrader för statusfältet: takter, uppnådd/begärd fördröjning och tid per fas"""
+        now = time.perf_counter() if now is None else now
+        steps = self.rate('steg', now)
+        frames = self.rate('bilder', now)
+        line = f"Steg/s: {steps:.0f}  Bilder/s: {frames:.1f}"
+        if requested_delay is not None:
+            achieved = f"{1000.0 / steps:.3g} ms" if steps > 0 else "-"
+            requested = "max" if requested_delay == 0 else f"{requested_delay * 1000.0:.3g} ms"
+            line += f"  Fördröjning: {achieved} (begärd {requested})"
+        lines = [line]
+        stats = sorted(self.stats(now).items(), key=lambda item: -item[1][3])
+        for name, (calls, mean, peak, share) in stats:
+            lines.append(f"{name:<18} {mean * 1000.0:8.2f} ms  max {peak * 1000.0:8.2f} ms"
+                         f"  {calls:7.1f}/s  {share * 100.0:5.1f}%")
+        return "\n".join(lines)
+
+
+NO_PROFILER = PhaseProfiler()  # Avstängd profilerare för kod som körs utan GUI
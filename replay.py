@@ -0,0 +1,312 @@
+"""Uppspelning av inspelade körningar utan att simulera om dem.
+
+open_recording() läser en logg från DataLogger (.pidlog), data som sparats
+med "Spara data" eller resultat från "python main.py run --out" (.csv,
+.npz, .parquet, .feather). Loggar och okomprimerade .npz-filer
+minnesmappas och Parquet/Feather läses minnesmappat via pyarrow. CSV
+minnesmappas inte: den tolkas block för block direkt in i en förallokerad
+array, så att bara ett block i taget finns som text i minnet - för långa
+körningar är .pidlog eller .npz snabbast.
+
+P-, I- och D-bidragen räknas som fp·e, fi·i och fd·d (Recording.factors).
+I en logg är i och d integralen och derivatan och faktorerna fås ur
+regulatorns inställningar. "Spara data" sparar bidragen själva, så där är
+fi = fd = 1 och Kp skattas som P-bidrag/fel. Kommandoradens resultat har
+varken inställningar eller bidrag; där skattas faktorerna med minsta
+kvadrat ur utsignalen i de sampel där den inte är begränsad.
+
+RecordedHistory har samma läsgränssnitt som History och visar de första n
+samplen, så att graferna, markören och tooltipen fungerar som för en
+levande körning:
+
+    recording = open_recording('session.pidlog')
+    history = RecordedHistory(recording)
+    history.seek(5000)
+"""
+import io
+import itertools
+import os
+import struct
+import zipfile
+
+import numpy as np
+
+from datalogger import open_log
+from history import History
+from metrics import step_metrics
+
+RECORDING_FORMATS = {
+    '.pidlog': 'PID-loggar',
+    '.csv': 'CSV-filer',
+    '.npz': 'NumPy-arkiv',
+    '.parquet': 'Parquet-filer',
+    '.feather': 'Feather-filer',
+}
+# Rubriker i "Spara data" -> historikens signaler
+EXPORT_COLUMNS = {'Tid': 't', 'Processvärde': 'y', 'Börvärde': 'sp', 'Regulatorut': 'u', 'Fel': 'e'}
+CSV_CHUNK_ROWS = 65536  # Rader som tolkas åt gången vid läsning av CSV
+
+
+def pid_factors(kp, ti, td):
+    """Faktorerna (fp, fi, fd) för P-, I- och D-bidragen ur Kp, Ti och Td (fi = None utan I-del)"""
+    return kp, (kp / ti if ti else None), -kp * td
+
+
+class Recording:
+    """
+    En inspelad körning: signalerna i History.fields (arrayer, saknade I/D
+    som NaN), faktorerna (fp, fi, fd) så att P-, I- och D-bidragen är
+    fp·e, fi·i och fd·d (None = bidraget finns inte) och om processvärdet
+    är sparat i procent av mätområdet.
+    """
+    def __init__(self, path, signals, factors, percent=False):
+        self.path = path
+        self.signals = signals
+        self.factors = factors
+        self.percent = percent
+        self.i_active = factors[1] is not None and bool(np.isfinite(signals['i']).any())
+        self.d_active = factors[2] is not None and bool(np.isfinite(signals['d']).any())
+        self._metrics = None  # (n, prestandamått) för senaste anropet
+
+    def __len__(self):
+        return len(self.signals['t'])
+
+    @property
+    def dt(self):
+        """Tidssteget (medianen av de första stegen)"""
+        t = self.signals['t']
+        return float(np.median(np.diff(t[:1000]))) if len(t) > 1 else 1.0
+
+    def metrics(self, n):
+        """Prestandamått för de första n samplen (vektoriserat, cachat per n)"""
+        if self._metrics is None or self._metrics[0] != n:
+            s = self.signals
+            self._metrics = (n, step_metrics(s['t'][:n], s['y'][:n], s['sp'][:n]))
+        return self._metrics[1]
+
+
+class RecordedHistory:
+    """
+    Skrivskyddad historik över en inspelning som visar de första n samplen,
+    med samma läsgränssnitt som History (column, valid, value, last, len,
+    total och t, y, ...)
+    """
+    fields = History.fields
+    optional = History.optional
+    max_length = None  # Inspelningen har redan sin längd
+
+    def __init__(self, recording):
+        self.recording = recording
+        self.signals = recording.signals
+        self.n = len(recording)
+
+    def __len__(self):
+        return self.n
+
+    @property
+    def total(self):
+        return self.n
+
+    def seek(self, n):
+        """Visa de första n samplen (minst ett)"""
+        self.n = max(1, min(int(n), len(self.recording)))
+
+    def column(self, name, start=0, end=None):
+        end = self.n if end is None else min(end, self.n)
+        return self.signals[name][start:max(start, end)]
+
+    def valid(self, name, start=0, end=None):
+        values = self.column(name, start, end)
+        if name not in self.optional:
+            return np.ones(len(values), dtype=bool)
+        return np.isfinite(values)
+
+    def last(self, name):
+        return self.value(name, self.n - 1)
+
+    def value(self, name, k):
+        value = float(self.signals[name][k if k >= 0 else self.n + k])
+        if name in self.optional and value != value:
+            return None
+        return value
+
+    t = property(lambda self: self.column('t'))
+    y = property(lambda self: self.column('y'))
+    u = property(lambda self: self.column('u'))
+    e = property(lambda self: self.column('e'))
+    i = property(lambda self: self.column('i'))
+    d = property(lambda self: self.column('d'))
+    sp = property(lambda self: self.column('sp'))
+
+
+def map_npz(path):
+    """
+    Minnesmappa arrayerna i en .npz-fil. np.savez lagrar dem okomprimerade,
+    så varje .npy-fil i arkivet kan mappas direkt; komprimerade och 0-dim
+    arrayer läses in som vanligt.
+    """
+    arrays = {}
+    with zipfile.ZipFile(path) as archive, open(path, 'rb') as f:
+        for info in archive.infolist():
+            name = info.filename[:-4] if info.filename.endswith('.npy') else info.filename
+            if info.compress_type != zipfile.ZIP_STORED:
+                with archive.open(info) as member:
+                    arrays[name] = np.lib.format.read_array(member, allow_pickle=False)
+                continue
+            # Lokalt filhuvud: 30 byte + filnamn + extrafält, därefter .npy-datat
+            f.seek(info.header_offset + 26)
+            name_length, extra_length = struct.unpack('<HH', f.read(4))
+            f.seek(info.header_offset + 30 + name_length + extra_length)
+            version = np.lib.format.read_magic(f)
+            if version == (1, 0):
+                shape, fortran, dtype = np.lib.format.read_array_header_1_0(f)
+            else:
+                shape, fortran, dtype = np.lib.format.read_array_header_2_0(f)
+            if dtype.hasobject or shape == () or 0 in shape:
+                arrays[name] = np.lib.format.read_array(archive.open(info), allow_pickle=False)
+            else:
+                arrays[name] = np.memmap(path, dtype=dtype, mode='r', offset=f.tell(), shape=shape,
+                                         order='F' if fortran else 'C')
+    return arrays
+
+
+def fill_empty(chunk, separator):
+    """Skriv nan i tomma fält i CSV-rader (bytes)"""
+    chunk = b'\n' + chunk.rstrip(b'\r\n').replace(b'\r\n', b'\n') + b'\n'
+    empty = separator + separator
+    while empty in chunk:
+        # Två varv: ;;; har två tomma fält som överlappar
+        chunk = chunk.replace(empty, separator + b'nan' + separator)
+    chunk = chunk.replace(b'\n' + separator, b'\nnan' + separator)
+    return chunk.replace(separator + b'\n', separator + b'nan\n')
+
+
+def read_csv(path, chunk_rows=CSV_CHUNK_ROWS):
+    """
+    Läs en CSV till kolumner: svensk från "Spara data" (semikolon,
+    decimalkomma, tomma fält = NaN) eller från kommandoraden (komma,
+    decimalpunkt). Raderna räknas först och tolkas sedan chunk_rows åt
+    gången direkt in i en förallokerad array.
+    """
+    with open(path, 'rb') as f:
+        header = f.readline()
+        if header.startswith(b'\xef\xbb\xbf'):
+            header = header[3:]
+        separator = ';' if b';' in header else ','
+        names = header.decode('utf-8').strip().split(separator)
+        body = f.tell()
+        n_rows = 0
+        tail = b'\n'
+        for block in iter(lambda: f.read(1 << 20), b''):
+            n_rows += block.count(b'\n')
+            tail = block[-1:]
+        n_rows += tail != b'\n'  # Sista raden utan radslut
+        data = np.empty((n_rows, len(names)))
+        f.seek(body)
+        row = 0
+        while True:
+            chunk = b''.join(itertools.islice(f, chunk_rows))
+            if not chunk:
+                break
+            # Decimalkomma blir punkt och tomma fält nan, sedan tolkas blocket i C
+            if separator == ';':
+                chunk = chunk.replace(b',', b'.')
+            chunk = fill_empty(chunk, separator.encode())
+            try:
+                values = np.loadtxt(io.BytesIO(chunk), delimiter=separator, ndmin=2, encoding='utf-8')
+            except ValueError as e:
+                raise RuntimeError(f"Kan inte tolka CSV-filen: {e}")
+            if values.shape[1] != len(names):
+                raise RuntimeError(f"CSV-filen har {values.shape[1]} kolumner men {len(names)} rubriker")
+            data[row:row + len(values)] = values
+            row += len(values)
+    return {name: data[:row, k] for k, name in enumerate(names)}
+
+
+def read_arrow(path):
+    """Läs Parquet/Feather minnesmappat via pyarrow"""
+    try:
+        import pyarrow.feather as feather
+        import pyarrow.parquet as pq
+    except ImportError:
+        raise RuntimeError("Parquet och Feather kräver paketet pyarrow (pip install pyarrow)")
+    if path.lower().endswith('.parquet'):
+        table = pq.read_table(path, memory_map=True)
+    else:
+        table = feather.read_table(path, memory_map=True)
+    return {name: table.column(name).to_numpy() for name in table.column_names}
+
+
+def from_export(path, columns):
+    """Gör om kolumnerna från "Spara data" till en Recording"""
+    percent = 'Processvärde (%)' in columns
+    signals = {}
+    for header, name in EXPORT_COLUMNS.items():
+        key = header + ' (%)' if percent and name in ('y', 'sp') else header
+        if key not in columns:
+            raise RuntimeError(f"Kolumnen '{key}' saknas - filen är inte sparad med \"Spara data\" "
+                               "eller \"python main.py run --out\"")
+        signals[name] = np.asarray(columns[key], dtype=float)
+    e = signals['e']
+    p = np.asarray(columns.get('P-bidrag', np.full(len(e), np.nan)), dtype=float)
+    usable = np.isfinite(p) & (e != 0)
+    kp = float(np.median(p[usable] / e[usable])) if usable.any() else 0.0
+    # I- och D-kolumnerna är bidragen själva (fi = fd = 1)
+    nan = np.full(len(e), np.nan)
+    signals['i'] = np.asarray(columns.get('I-bidrag', nan), dtype=float)
+    signals['d'] = np.asarray(columns.get('D-bidrag', nan), dtype=float)
+    return Recording(path, signals, (kp, 1.0, 1.0), percent)
+
+
+def estimate_factors(signals):
+    """
+    Skatta (fp, fi, fd) ur u = fp·e + fi·i + fd·d med minsta kvadrat över
+    de sampel där utsignalen inte är begränsad (exakt för PID-regulatorn).
+    """
+    u, e, i, d = (signals[name] for name in ('u', 'e', 'i', 'd'))
+    rows = np.isfinite(u) & np.isfinite(e)
+    terms = [name for name, values in (('i', i), ('d', d)) if np.any(np.isfinite(values) & (values != 0))]
+    for name in terms:
+        rows &= np.isfinite(signals[name])
+    inside = rows & (u > np.min(u[rows], initial=np.inf)) & (u < np.max(u[rows], initial=-np.inf))
+    if np.count_nonzero(inside) > len(terms):
+        rows = inside
+    if np.count_nonzero(rows) <= len(terms):
+        return 0.0, None, None
+    matrix = np.column_stack([e[rows]] + [signals[name][rows] for name in terms])
+    solution = dict(zip(['e'] + terms, np.linalg.lstsq(matrix, u[rows], rcond=None)[0]))
+    return float(solution['e']), solution.get('i'), solution.get('d')
+
+
+def from_fields(path, columns):
+    """Gör om kolumner med History.fields-namn (t.ex. från "python main.py run --out") till en Recording"""
+    signals = {name: np.asarray(columns[name], dtype=float) for name in History.fields}
+    return Recording(path, signals, estimate_factors(signals))
+
+
+def from_columns(path, columns):
+    """Recording från kolumnerna i en sparad fil, med historikens eller "Spara data"s kolumnnamn"""
+    if all(name in columns for name in History.fields):
+        return from_fields(path, columns)
+    return from_export(path, columns)
+
+
+def open_recording(path):
+    """Öppna en inspelad körning (format efter filändelsen)"""
+    ext = os.path.splitext(path)[1].lower()
+    if ext == '.pidlog':
+        header, data = open_log(path)
+        signals = {name: data[:, k] for k, name in enumerate(header['fields'])}
+        missing = set(History.fields) - set(signals)
+        if missing:
+            raise RuntimeError(f"Loggen saknar kolumnerna {', '.join(sorted(missing))}")
+        meta = header.get('metadata', {})
+        factors = pid_factors(meta.get('Kp', 0.0), meta.get('Ti', 0.0), meta.get('Td', 0.0))
+        return Recording(path, signals, factors)
+    if ext == '.npz':
+        return from_columns(path, map_npz(path))
+    if ext == '.csv':
+        return from_columns(path, read_csv(path))
+    if ext in ('.parquet', '.feather'):
+        return from_columns(path, read_arrow(path))
+    raise RuntimeError(f"Okänt filformat '{ext}' - använd {', '.join(RECORDING_FORMATS)}")
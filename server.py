@@ -0,0 +1,418 @@
+"""Lokal simuleringsserver: många oberoende headless sessioner över HTTP/JSON.
+
+Varje session är en egen SimulationEngine (Process + PID) som byggs med
+samma parametrar som kommandoradens run (kp, ti, td, K, T, dead, dt, sp, nv,
+umin, umax, integrerande, fout, zoh, antiwindup, noise, seed). Servern kör
+på asyncio utan externa paket; stegningen görs i block om högst CHUNK_STEPS
+steg i en trådpool, så en klient som kör långa banor inte blockerar de
+andra. Med --jit (numba) släpper den kompilerade stegloopen GIL och
+sessionerna räknas parallellt.
+
+    python main.py serve --port 8765 --jit
+
+    POST   /sessions                 {"kp": 2, "ti": 10, "K": 2, "T": 15}  -> sessionens tillstånd
+    GET    /sessions                 alla sessioner
+    GET    /sessions/<id>            tillstånd (steg, senaste sampel, parametrar)
+    PATCH  /sessions/<id>            {"sp": 60, "kp": 3}  ändra under körning
+    DELETE /sessions/<id>
+    POST   /sessions/<id>/step       {"steps": 10}  -> de nya samplen
+    POST   /sessions/<id>/run        {"steps": 100000, "signals": false}  -> prestandamått
+    POST   /sessions/<id>/reset      {"seed": 1}
+    GET    /sessions/<id>/stream?steps=100000&chunk=1000   NDJSON, ett block per rad
+
+Signaler skickas som listor per kolumn (t, y, u, e, i, d, sp); NaN och
+oändliga värden blir null.
+"""
+import argparse
+import asyncio
+import itertools
+import json
+import math
+import os
+import re
+from concurrent.futures import ThreadPoolExecutor
+from urllib.parse import parse_qs, urlsplit
+
+import numpy as np
+
+from cli import build_engine, build_parser, json_metrics
+from metrics import StepMetrics
+from simulation import SimulationResult
+
+CHUNK_STEPS = 100_000  # Steg per anrop i trådpoolen
+MAX_STEPS = 10 ** 7  # Per anrop till run utan signaler och per ström
+MAX_SIGNAL_STEPS = 10 ** 6  # Per anrop när signalerna skickas tillbaka
+MAX_BODY = 1 << 20
+REASONS = {200: 'OK', 201: 'Created', 400: 'Bad Request', 404: 'Not Found',
+           405: 'Method Not Allowed', 413: 'Payload Too Large', 500: 'Internal Server Error'}
+# Parametrar som kan ändras under körning -> (objekt, attribut)
+SETTABLE = {
+    'sp': ('engine', 'setpoint'), 'umin': ('engine', 'umin'), 'umax': ('engine', 'umax'),
+    'antiwindup': ('engine', 'antiwindup'), 'noise': ('engine', 'noise_std'),
+    'manual': ('engine', 'manual_output'),
+    'kp': ('controller', 'Kp'), 'ti': ('controller', 'Ti'), 'td': ('controller', 'Td'),
+    'K': ('process', 'K'), 'T': ('process', 'T'), 'dead': ('process', 'dead_time'),
+    'fout': ('process', 'Fout'),
+}
+
+
+class RequestError(Exception):
+    """Fel som blir ett JSON-svar med statuskoden"""
+    def __init__(self, status, message):
+        super().__init__(message)
+        self.status = status
+
+
+def loop_defaults():
+    """Standardparametrarna för en session (samma som "python main.py run")"""
+    defaults = vars(build_parser().parse_args(['run']))
+    for name in ('command', 'func', 'out', 'kpi', 'steps'):
+        defaults.pop(name)
+    return defaults
+
+
+def check_params(params, defaults):
+    """Kontrollera namn och typer för en ny sessions parametrar"""
+    unknown = set(params) - set(defaults)
+    if unknown:
+        raise RequestError(400, f"Okända parametrar: {', '.join(sorted(unknown))}")
+    for name, value in params.items():
+        if isinstance(defaults[name], bool):
+            valid = isinstance(value, bool)
+        elif name == 'seed':
+            valid = value is None or (isinstance(value, int) and not isinstance(value, bool))
+        else:
+            valid = isinstance(value, (int, float)) and not isinstance(value, bool)
+        if not valid:
+            raise RequestError(400, f"Ogiltigt värde för {name}: {value!r}")
+    if params.get('dt', 1.0) <= 0:
+        raise RequestError(400, "dt måste vara större än 0")
+
+
+def json_array(values):
+    """Array -> lista för JSON (NaN och oändliga värden blir None)"""
+    values = np.asarray(values, dtype=float)
+    if np.isfinite(values).all():
+        return values.tolist()
+    return [v if math.isfinite(v) else None for v in values.tolist()]
+
+
+def json_signals(signals, start=0):
+    """Signalerna (namn -> array) från rad start som JSON-vänligt dict"""
+    return {name: json_array(values[start:]) for name, values in signals.items()}
+
+
+def steps_argument(value, limit):
+    if isinstance(value, bool) or not isinstance(value, int) or not 0 <= value <= limit:
+        raise RequestError(400, f"steps måste vara ett heltal mellan 0 och {limit}")
+    return value
+
+
+def run_chunk(engine, n_steps, fields, metrics, first):
+    """Ett jobb i trådpoolen: stega, mata prestandamåtten och plocka ut signalerna i fields"""
+    result = engine.run(n_steps)
+    start = 0 if first else 1  # Varje block börjar med föregående blocks sista rad
+    if metrics is not None:
+        metrics.extend(result.t[start:], result.y[start:], result.sp[start:])
+    return {name: getattr(result, name)[start:] for name in fields}
+
+
+class Session:
+    """En simuleringssession: motor, parametrar och ett lås så att anropen stegar i tur och ordning"""
+    def __init__(self, session_id, params):
+        self.id = session_id
+        self.params = params
+        self.engine = build_engine(argparse.Namespace(**params))
+        self.lock = asyncio.Lock()
+        self.snapshot = None
+        self.capture()
+
+    def capture(self):
+        """
+        Spara tillståndet medan motorn står still (med låset, eller mellan
+        två block i advance). state() läser bara den sparade kopian, så ett
+        anrop under en pågående körning får aldrig värden från olika steg.
+        """
+        engine = self.engine
+        u, e, i, d = engine.last
+        last = {'t': engine.current_step * engine.dt, 'y': engine.process.y, 'u': u, 'e': e,
+                'i': i, 'd': d, 'sp': engine.setpoint}
+        self.snapshot = {'id': self.id, 'step': engine.current_step,
+                         'last': {k: (float(v) if math.isfinite(v) else None) for k, v in last.items()},
+                         'params': dict(self.params)}
+
+    def state(self):
+        """Senast sparade tillståndet (se capture)"""
+        return self.snapshot
+
+    def update(self, changes):
+        """Ändra parametrar under körning (se SETTABLE)"""
+        for name, value in changes.items():
+            if name not in SETTABLE:
+                raise RequestError(400, f"Parametern '{name}' kan inte ändras - använd {', '.join(SETTABLE)}")
+            if name == 'manual':
+                if value is not None and (isinstance(value, bool) or not isinstance(value, (int, float))):
+                    raise RequestError(400, "manual måste vara ett tal (utsignal i %) eller null")
+            elif name == 'antiwindup':
+                if not isinstance(value, bool):
+                    raise RequestError(400, "antiwindup måste vara true eller false")
+            elif isinstance(value, bool) or not isinstance(value, (int, float)):
+                raise RequestError(400, f"{name} måste vara ett tal")
+        for name, value in changes.items():
+            owner, attribute = SETTABLE[name]
+            target = self.engine if owner == 'engine' else getattr(self.engine, owner)
+            setattr(target, attribute, value)
+            self.params[name] = value
+
+
+class SimulationServer:
+    """Håller sessionerna och besvarar HTTP-anrop (ett asyncio-serverobjekt per instans)"""
+    def __init__(self, workers=None):
+        self.sessions = {}
+        self.ids = itertools.count(1)
+        self.executor = ThreadPoolExecutor(max_workers=workers or os.cpu_count() or 1,
+                                           thread_name_prefix='session')
+        self.defaults = loop_defaults()
+        self.routes = [
+            ('GET', r'/sessions', self.list_sessions),
+            ('POST', r'/sessions', self.create_session),
+            ('GET', r'/sessions/(\w+)', self.get_session),
+            ('PATCH', r'/sessions/(\w+)', self.update_session),
+            ('DELETE', r'/sessions/(\w+)', self.delete_session),
+            ('POST', r'/sessions/(\w+)/step', self.step_session),
+            ('POST', r'/sessions/(\w+)/run', self.run_session),
+            ('POST', r'/sessions/(\w+)/reset', self.reset_session),
+            ('GET', r'/sessions/(\w+)/stream', self.stream_session),
+        ]
+
+    async def start(self, host='127.0.0.1', port=8765):
+        """Starta lyssnaren. Returnerar asyncio.Server"""
+        return await asyncio.start_server(self.handle_connection, host, port)
+
+    def close(self):
+        self.executor.shutdown(wait=False, cancel_futures=True)
+
+    # --- Simulering ---
+    async def advance(self, session, n_steps, fields=SimulationResult.fields, metrics=None):
+        """
+        Stega n_steps i trådpoolen i block om CHUNK_STEPS. Returnerar
+        signalerna i fields (namn -> array) med startraden först. Med
+        metrics (StepMetrics) matas varje block in i prestandamåtten i
+        samma jobb, och med tomt fields släpps blocken direkt efteråt.
+        """
+        loop = asyncio.get_running_loop()
+        parts = []
+        remaining = n_steps
+        while True:
+            chunk = min(remaining, CHUNK_STEPS)
+            parts.append(await loop.run_in_executor(self.executor, run_chunk, session.engine, chunk,
+                                                    fields, metrics, not parts))
+            session.capture()
+            remaining -= chunk
+            if remaining <= 0:
+                break
+        if len(parts) == 1:
+            return parts[0]
+        return {name: np.concatenate([part[name] for part in parts]) for name in fields}
+
+    def session(self, session_id):
+        if session_id not in self.sessions:
+            raise RequestError(404, f"Sessionen '{session_id}' finns inte")
+        return self.sessions[session_id]
+
+    # --- Anrop ---
+    async def list_sessions(self, body, query):
+        return 200, {'sessions': [s.state() for s in self.sessions.values()]}
+
+    async def create_session(self, body, query):
+        check_params(body, self.defaults)
+        try:
+            session = Session(str(next(self.ids)), dict(self.defaults, **body))
+        except ValueError as e:
+            raise RequestError(400, f"Ogiltiga parametrar: {e}")
+        self.sessions[session.id] = session
+        return 201, session.state()
+
+    async def get_session(self, body, query, session_id):
+        return 200, self.session(session_id).state()
+
+    async def update_session(self, body, query, session_id):
+        session = self.session(session_id)
+        async with session.lock:
+            try:
+                session.update(body)
+            finally:
+                session.capture()  # Även ändringar före ett ogiltigt värde
+        return 200, session.state()
+
+    async def delete_session(self, body, query, session_id):
+        session = self.session(session_id)
+        async with session.lock:
+            self.sessions.pop(session_id, None)
+        return 200, {'deleted': session_id}
+
+    async def step_session(self, body, query, session_id):
+        session = self.session(session_id)
+        n_steps = steps_argument(body.get('steps', 1), MAX_SIGNAL_STEPS)
+        async with session.lock:
+            result = await self.advance(session, n_steps)
+            state = session.state()
+        return 200, dict(state, signals=json_signals(result, start=1))
+
+    async def run_session(self, body, query, session_id):
+        session = self.session(session_id)
+        signals = bool(body.get('signals', False))
+        n_steps = steps_argument(body.get('steps', 1000), MAX_SIGNAL_STEPS if signals else MAX_STEPS)
+        metrics = StepMetrics()
+        async with session.lock:
+            # Utan signaler räknas prestandamåtten block för block och inget sparas
+            result = await self.advance(session, n_steps, SimulationResult.fields if signals else (), metrics)
+            state = session.state()
+        response = dict(state, metrics=json_metrics(metrics.result()))
+        if signals:
+            response['signals'] = json_signals(result)
+        return 200, response
+
+    async def reset_session(self, body, query, session_id):
+        session = self.session(session_id)
+        seed = body.get('seed', session.params['seed'])
+        if seed is not None and (isinstance(seed, bool) or not isinstance(seed, int)):
+            raise RequestError(400, "seed måste vara ett heltal eller null")
+        async with session.lock:
+            session.engine.reset(seed)
+            session.capture()
+        return 200, session.state()
+
+    async def stream_session(self, body, query, session_id, writer):
+        """Skicka banan som NDJSON (chunked), ett block om chunk steg per rad"""
+        session = self.session(session_id)
+        try:
+            n_steps = int(query.get('steps', ['1000'])[0])
+            chunk = int(query.get('chunk', ['1000'])[0])
+        except ValueError:
+            raise RequestError(400, "steps och chunk måste vara heltal")
+        steps_argument(n_steps, MAX_STEPS)
+        if not 1 <= chunk <= MAX_SIGNAL_STEPS:
+            raise RequestError(400, f"chunk måste vara mellan 1 och {MAX_SIGNAL_STEPS}")
+        writer.write(b'HTTP/1.1 200 OK\r\nContent-Type: application/x-ndjson\r\n'
+                     b'Transfer-Encoding: chunked\r\n\r\n')
+        async with session.lock:
+            remaining = n_steps
+            while remaining > 0:
+                n = min(chunk, remaining)
+                remaining -= n
+                try:
+                    message = {'step': None, 'signals': json_signals(await self.advance(session, n), start=1)}
+                    message['step'] = session.engine.current_step
+                except Exception as e:
+                    # Svarshuvudet är redan skickat - felet blir strömmens sista rad
+                    message = {'error': f"{type(e).__name__}: {e}"}
+                    remaining = 0
+                line = json.dumps(message).encode('utf-8') + b'\n'
+                writer.write(b'%x\r\n%s\r\n' % (len(line), line))
+                await writer.drain()  # Väntar in långsamma klienter
+        writer.write(b'0\r\n\r\n')
+        await writer.drain()
+
+    # --- HTTP ---
+    async def handle_connection(self, reader, writer):
+        """Läs anrop på en anslutning (keep-alive) tills klienten stänger"""
+        try:
+            while True:
+                request = await self.read_request(reader)
+                if request is None:
+                    break
+                method, path, query, body, keep_alive = request
+                await self.dispatch(writer, method, path, query, body, keep_alive)
+                if not keep_alive:
+                    break
+        except (ConnectionError, asyncio.IncompleteReadError):
+            pass
+        except RequestError as e:
+            # Anropet gick inte att tolka - svara och stäng
+            self.respond(writer, e.status, {'error': str(e)}, keep_alive=False)
+        finally:
+            try:
+                await writer.drain()
+                writer.close()
+                await writer.wait_closed()
+            except ConnectionError:
+                pass
+
+    async def read_request(self, reader):
+        """Läs ett HTTP/1.1-anrop. Returnerar (metod, sökväg, query, JSON-kropp, keep-alive) eller None"""
+        line = await reader.readline()
+        if not line.strip():
+            return None
+        try:
+            method, target, version = line.decode('latin-1').split()
+        except ValueError:
+            raise RequestError(400, "Felaktig anropsrad")
+        headers = {}
+        while True:
+            line = await reader.readline()
+            if line in (b'\r\n', b'\n', b''):
+                break
+            name, _, value = line.decode('latin-1').partition(':')
+            headers[name.strip().lower()] = value.strip()
+        try:
+            length = int(headers.get('content-length') or 0)
+        except ValueError:
+            raise RequestError(400, "Ogiltig Content-Length")
+        if length < 0:
+            raise RequestError(400, "Ogiltig Content-Length")
+        if length > MAX_BODY:
+            raise RequestError(413, "För stor kropp")
+        raw = await reader.readexactly(length) if length else b''
+        url = urlsplit(target)
+        connection = headers.get('connection', '').lower()
+        keep_alive = connection != 'close' and (version == 'HTTP/1.1' or connection == 'keep-alive')
+        return method.upper(), url.path.rstrip('/') or '/', parse_qs(url.query), raw, keep_alive
+
+    async def dispatch(self, writer, method, path, query, raw, keep_alive=True):
+        allowed = False
+        for route_method, pattern, handler in self.routes:
+            match = re.fullmatch(pattern, path)
+            if not match:
+                continue
+            allowed = True
+            if route_method != method:
+                continue
+            try:
+                body = json.loads(raw) if raw.strip() else {}
+                if not isinstance(body, dict):
+                    raise RequestError(400, "Kroppen måste vara ett JSON-objekt")
+                if handler == self.stream_session:
+                    await handler(body, query, *match.groups(), writer=writer)
+                    return
+                status, response = await handler(body, query, *match.groups())
+            except json.JSONDecodeError as e:
+                status, response = 400, {'error': f"Ogiltig JSON: {e}"}
+            except RequestError as e:
+                status, response = e.status, {'error': str(e)}
+            except Exception as e:  # Servern ska överleva fel i en enskild session
+                status, response = 500, {'error': f"{type(e).__name__}: {e}"}
+            self.respond(writer, status, response, keep_alive)
+            return
+        if allowed:
+            self.respond(writer, 405, {'error': f"Metoden {method} stöds inte för {path}"}, keep_alive)
+        else:
+            self.respond(writer, 404, {'error': f"Okänd sökväg {path}"}, keep_alive)
+
+    def respond(self, writer, status, payload, keep_alive=True):
+        data = json.dumps(payload, ensure_ascii=False).encode('utf-8')
+        writer.write(f"HTTP/1.1 {status} {REASONS.get(status, '')}\r\n"
+                     f"Content-Type: application/json; charset=utf-8\r\n"
+                     f"Content-Length: {len(data)}\r\n"
+                     f"Connection: {'keep-alive' if keep_alive else 'close'}\r\n\r\n".encode('latin-1') + data)
+
+
+async def serve(host='127.0.0.1', port=8765, workers=None):
+    """Kör servern tills processen avbryts"""
+    server = SimulationServer(workers)
+    listener = await server.start(host, port)
+    try:
+        async with listener:
+            await listener.serve_forever()
+    finally:
+        server.close()
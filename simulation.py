@@ -0,0 +1,362 @@
+"""Simuleringskärna utan GUI: processmodeller, regulatorer och simuleringsmotor.
+
+Modulen importerar varken tkinter eller matplotlib och kan därför användas
+direkt från skript, notebooks och CI.
+"""
+import math
+import os
+
+import numpy as np
+
+# Miljövariabel som slår på den kompilerade stegloopen (kernels.py, kräver numba)
+JIT_VARIABLE = 'PID_SIM_JIT'
+
+# --- Dötid ---
+class DelayLine:
+    """
+    Cirkulär fördröjningsbuffert för dötid. Kostar O(1) per steg oavsett hur
+    lång fördröjningen är och interpolerar linjärt vid bråkdels-fördröjning.
+    """
+    def __init__(self, delay, initial=0.0):
+        self.initial = initial  # Värde som bufferten fylls med innan historik finns
+        self.buffer = []
+        self.pos = 0  # Nästa skrivposition (= äldsta värdet i bufferten)
+        self.set_delay(delay)
+
+    def set_delay(self, delay):
+        """Ändra fördröjningen (i sampel) utan att tappa befintlig historik"""
+        delay = max(0.0, float(delay))
+        self.delay = delay
+        self.whole = int(delay)
+        self.frac = delay - self.whole
+        size = self.whole + 2  # Två sampel behövs för interpolation
+        if size > len(self.buffer):
+            # Lägg bufferten i tidsordning (äldst först) och fyll på med startvärden framför
+            history = self.buffer[self.pos:] + self.buffer[:self.pos]
+            self.buffer = [self.initial] * (size - len(history)) + history
+            self.pos = 0
+
+    def push(self, value):
+        """Skriv in ett nytt värde och returnera värdet fördröjt `delay` sampel"""
+        buf = self.buffer
+        size = len(buf)
+        pos = self.pos
+        buf[pos] = value
+        self.pos = pos + 1 if pos + 1 < size else 0
+        out = buf[(pos - self.whole) % size]
+        if self.frac:
+            out += self.frac * (buf[(pos - self.whole - 1) % size] - out)
+        return out
+
+# --- Processmodeller ---
+class Process:
+    discretizations = ('euler', 'zoh')
+
+    def __init__(self, K=1.0, T=10.0, dead_time=2.0, integrerande=False, Fout=0.0, normalvarde=0.0, 
+                 matområde_min=0.0, matområde_max=100.0, enhetslös_K=False, discretization='euler'):
+        self.K = K  # Processförstärkning - enhetslös om enhetslös_K=True, annars °C/%
+        self.T = T
+        self.dead_time = dead_time
+        self.integrerande = integrerande
+        self.Fout = Fout  # Utflöde (för nivåreglering)
+        self.normalvarde = normalvarde  # Normalvärde (NV) i ingenjörsenheter
+        self.matområde_min = matområde_min  # Mätområde minimum (°C)
+        self.matområde_max = matområde_max  # Mätområde maximum (°C)
+        self.enhetslös_K = enhetslös_K  # True = K är enhetslös (% till %), False = K är °C/%
+        # 'euler' = explicit Euler (stabil endast för dt < 2T), 'zoh' = exakt för styrsignal som hålls konstant under steget
+        if discretization not in self.discretizations:
+            raise ValueError(f"Okänd diskretisering '{discretization}' - använd {', '.join(self.discretizations)}")
+        self.discretization = discretization
+        self._zoh = (None, None, 0.0)  # Cachad (dt, T, a = exp(-dt/T))
+        # Styrsignalen fördröjs dötid + ett sampel (u används först nästa steg)
+        self.u_delay = DelayLine(dead_time + 1)
+        self.y = normalvarde  # Starta på normalvärdet (ingenjörsenheter)
+        self.t = 0
+
+    def reset(self):
+        """Återställ till starttillståndet (PV på normalvärdet, tom dötidsbuffert)"""
+        self.u_delay = DelayLine(self.dead_time + 1)
+        self.y = self.normalvarde
+        self.t = 0
+
+    def to_percent(self, value_eng):
+        """Konvertera från ingenjörsenheter till procent baserat på mätområdet"""
+        if self.matområde_max == self.matområde_min:
+            return 0.0
+        return 100.0 * (value_eng - self.matområde_min) / (self.matområde_max - self.matområde_min)
+    
+    def from_percent(self, value_pct):
+        """Konvertera från procent till ingenjörsenheter baserat på mätområdet"""
+        return self.matområde_min + (self.matområde_max - self.matområde_min) * value_pct / 100.0
+
+    def zoh_factor(self, dt):
+        """a = exp(-dt/T) för ZOH-diskretiseringen, räknas om bara när dt eller T ändras"""
+        cached_dt, cached_T, a = self._zoh
+        if cached_dt != dt or cached_T != self.T:
+            a = math.exp(-dt / self.T)
+            self._zoh = (dt, self.T, a)
+        return a
+
+    def step(self, u, dt):
+        # Följ ändrad dötid eller dt utan att nollställa historiken
+        delay = self.dead_time / dt + 1
+        if delay != self.u_delay.delay:
+            self.u_delay.set_delay(delay)
+        u_delayed = self.u_delay.push(u)
+        
+        # Skydda mot division med noll
+        if self.T <= 0:
+            self.T = 1e-6  # Minimal tidskonstant
+        
+        if self.enhetslös_K:
+            # Enhetslös K: Konvertera y till %, beräkna i %, konvertera tillbaka
+            y_pct = self.to_percent(self.y)
+            nv_pct = self.to_percent(self.normalvarde)
+            
+            if self.integrerande:
+                # Nivåreglering: inflöde (styrsignal) minus utflöde
+                dy_pct = (self.K * u_delayed - self.Fout) * dt / self.T
+            elif self.discretization == 'zoh':
+                # Exakt stegsvar mot jämviktsläget NV + K*u under steget
+                a = self.zoh_factor(dt)
+                dy_pct = (1 - a) * (nv_pct + self.K * u_delayed - y_pct)
+            else:
+                # Normalvärde: y går mot normalvarde om u=0
+                dy_pct = (-(y_pct - nv_pct) + self.K * u_delayed) * dt / self.T
+            
+            # Konvertera tillbaka till ingenjörsenheter
+            new_y_pct = y_pct + dy_pct
+            self.y = self.from_percent(new_y_pct)
+        else:
+            # Original metod: K i °C/%
+            if self.integrerande:
+                # Nivåreglering: inflöde (styrsignal) minus utflöde (Euler är exakt för en ren integrator)
+                self.y += (self.K * u_delayed - self.Fout) * dt / self.T
+            elif self.discretization == 'zoh':
+                # y[k+1] = a*y[k] + (1-a)*(NV + K*u), stabil för alla dt/T
+                a = self.zoh_factor(dt)
+                self.y = a * self.y + (1 - a) * (self.normalvarde + self.K * u_delayed)
+            else:
+                # Normalvärde: y går mot normalvarde om u=0
+                self.y += (-(self.y - self.normalvarde) + self.K * u_delayed) * dt / self.T
+        
+        self.t += dt
+        return self.y
+
+# --- On/Off-regulator ---
+class OnOffController:
+    def __init__(self, hysteresis_type="both", hysteresis_high=2.0, hysteresis_low=2.0):
+        self.hysteresis_type = hysteresis_type  # "upper", "lower", "both"
+        self.hysteresis_high = hysteresis_high  # Hysteresis över börvärdet
+        self.hysteresis_low = hysteresis_low    # Hysteresis under börvärdet
+        self.output = 0.0  # Aktuell utsignal (0 eller 100)
+
+    def reset(self):
+        """Slå av utsignalen"""
+        self.output = 0.0
+        
+    def step(self, setpoint, pv, umin=0.0, umax=100.0):
+        """On/Off reglering med konfigurerbar hysteresis"""
+        if self.hysteresis_type == "upper":
+            # Endast hysteresis över börvärdet
+            if pv < setpoint:
+                self.output = umax  # Slå på
+            elif pv > setpoint + self.hysteresis_high:
+                self.output = umin  # Slå av
+        elif self.hysteresis_type == "lower":
+            # Endast hysteresis under börvärdet
+            if pv > setpoint:
+                self.output = umin  # Slå av
+            elif pv < setpoint - self.hysteresis_low:
+                self.output = umax  # Slå på
+        else:  # "both"
+            # Hysteresis både över och under börvärdet
+            if pv < setpoint - self.hysteresis_low:
+                self.output = umax  # Slå på
+            elif pv > setpoint + self.hysteresis_high:
+                self.output = umin  # Slå av
+        
+        # Begränsa utsignal
+        self.output = max(umin, min(umax, self.output))
+        return self.output
+
+# --- PID-regulator ---
+class PID:
+    def __init__(self, Kp=1.0, Ti=10.0, Td=0.0, dt=1.0):
+        self.Kp = Kp
+        self.Ti = Ti
+        self.Td = Td
+        self.dt = dt
+        self.integral = 0.0
+        self.prev_error = 0.0
+        self.prev_pv = 0.0
+
+    def reset(self):
+        """Nollställ integral och derivatans minne"""
+        self.integral = 0.0
+        self.prev_error = 0.0
+        self.prev_pv = 0.0
+
+    def step(self, setpoint, pv, umin=0.0, umax=100.0, antiwindup=False):
+        error = setpoint - pv
+        # Beräkna preliminär integral
+        integral_candidate = self.integral + error * self.dt
+        derivative = (pv - self.prev_pv) / self.dt
+        
+        # Hantera integral term - om Ti är 0 eller mycket liten, inaktivera I-verkan
+        if self.Ti > 0.001:  # Undvik division med noll
+            i_term = (1/self.Ti) * integral_candidate
+        else:
+            i_term = 0.0
+            
+        u_unclamped = self.Kp * (error + i_term - self.Td*derivative)
+        # Begränsa utsignal
+        u = max(umin, min(umax, u_unclamped))
+        # Anti-windup: endast integrera om utsignalen inte är mättad, eller om antiwindup är av
+        if antiwindup:
+            # Integrera bara om inte mättad, eller om felet "hjälper" att komma in i området
+            if (u == umin and error > 0) or (u == umax and error < 0) or (umin < u < umax):
+                self.integral = integral_candidate
+        else:
+            self.integral = integral_candidate
+        self.prev_error = error
+        self.prev_pv = pv
+        return u, error, self.integral, derivative
+
+# --- Simuleringsmotor ---
+class SimulationResult:
+    """
+    Resultat från en headless körning. Varje signal är en NumPy-array med ett
+    värde per steg, startvärdet inkluderat (samma uppställning som GUI-historiken).
+    """
+    fields = ('t', 'y', 'u', 'e', 'i', 'd', 'sp')
+
+    def __init__(self, t, y, u, e, i, d, sp):
+        self.t = t
+        self.y = y
+        self.u = u
+        self.e = e
+        self.i = i
+        self.d = d
+        self.sp = sp
+
+    def __len__(self):
+        return len(self.t)
+
+    def as_dict(self):
+        """Returnera signalerna som dict (namn -> array)"""
+        return {name: getattr(self, name) for name in self.fields}
+
+
+class SimulationEngine:
+    """
+    Driver en Process och en regulator (PID eller OnOffController) utan GUI.
+    Beräkningsordningen är densamma som i GUI:ts simulering:
+    störning dras, regulatorn räknar på PV före steget, processen stegas och
+    störningen läggs på processvärdet.
+    """
+    # run() använder kernels.run_engine när numba finns. Avstängt som standard: numba tar
+    # märkbar tid att importera och korta körningar (t.ex. kommandoradens) blir långsammare
+    use_kernel = os.environ.get(JIT_VARIABLE) == '1'
+
+    def __init__(self, process, controller, setpoint=50.0, dt=1.0, umin=0.0, umax=100.0,
+                 antiwindup=True, manual_output=None, noise_std=0.0, seed=None):
+        self.process = process
+        self.controller = controller  # PID eller OnOffController
+        self.setpoint = setpoint  # Börvärde i fysiska enheter
+        self.dt = dt
+        self.umin = umin
+        self.umax = umax
+        self.antiwindup = antiwindup
+        self.manual_output = manual_output  # None = automatiskt läge, annars utsignal i %
+        self.noise_std = noise_std
+        self.rng = np.random.default_rng(seed)
+        self.pulse_magnitude = 0.0
+        self.pulse_steps_left = 0
+        self.current_step = 0
+        # Senaste (utsignal, fel, integral, derivata) - används som startrad i run()
+        self.last = (0.0, 0.0, 0.0, 0.0)
+
+    def reset(self, seed=None):
+        """Återställ process, regulator och störningar till starttillståndet"""
+        self.process.reset()
+        self.controller.reset()
+        self.rng = np.random.default_rng(seed)
+        self.pulse_steps_left = 0
+        self.current_step = 0
+        self.last = (0.0, 0.0, 0.0, 0.0)
+
+    def trigger_pulse(self, magnitude, steps):
+        """Starta en pulsstörning som adderas till processvärdet under `steps` steg"""
+        self.pulse_magnitude = magnitude
+        self.pulse_steps_left = int(steps)
+
+    def cancel_pulse(self):
+        """Avbryt pågående pulsstörning"""
+        self.pulse_steps_left = 0
+
+    def disturbance(self):
+        """Dra brus och eventuell pulsstörning för ett steg"""
+        noise = self.rng.normal(0, self.noise_std) if self.noise_std > 0 else 0.0
+        pulse = 0.0
+        if self.pulse_steps_left > 0:
+            pulse = self.pulse_magnitude
+            self.pulse_steps_left -= 1
+        return noise + pulse
+
+    def step(self):
+        """Simulera ett steg. Returnerar (utsignal, fel, integral, derivata) som PID.step"""
+        disturbance = self.disturbance()
+        setpoint = self.setpoint
+        pv = self.process.y
+
+        if self.manual_output is not None:
+            # Manuellt läge - begränsa till 0-100%, ingen I/D-beräkning
+            ctrl = max(0.0, min(100.0, self.manual_output))
+            err, integ, deriv = setpoint - pv, 0.0, 0.0
+        elif isinstance(self.controller, OnOffController):
+            ctrl = self.controller.step(setpoint, pv, umin=self.umin, umax=self.umax)
+            err, integ, deriv = setpoint - pv, 0.0, 0.0
+        else:
+            try:
+                ctrl, err, integ, deriv = self.controller.step(
+                    setpoint, pv, umin=self.umin, umax=self.umax, antiwindup=self.antiwindup
+                )
+            except ZeroDivisionError:
+                ctrl, err, integ, deriv = 0.0, 0.0, 0.0, 0.0
+
+        self.process.step(ctrl, self.dt)
+        self.process.y += disturbance
+        self.current_step += 1
+        self.last = (ctrl, err, integ, deriv)
+        return self.last
+
+    def run(self, n_steps):
+        """Kör n_steps steg och returnera ett SimulationResult med n_steps+1 rader"""
+        if self.use_kernel:
+            # Hela banan i den kompilerade kärnan när numba finns (samma resultat)
+            from kernels import NUMBA, run_engine, supports
+            if NUMBA and supports(self):
+                return run_engine(self, n_steps)
+        n = int(n_steps)
+        t = np.empty(n + 1)
+        y = np.empty(n + 1)
+        u = np.empty(n + 1)
+        e = np.empty(n + 1)
+        i = np.empty(n + 1)
+        d = np.empty(n + 1)
+        sp = np.empty(n + 1)
+
+        t[0] = self.current_step * self.dt
+        y[0] = self.process.y
+        u[0], e[0], i[0], d[0] = self.last
+        sp[0] = self.setpoint
+
+        step = self.step
+        process = self.process
+        for k in range(1, n + 1):
+            u[k], e[k], i[k], d[k] = step()
+            y[k] = process.y
+            sp[k] = self.setpoint
+        t[1:] = (np.arange(1, n + 1) + (self.current_step - n)) * self.dt
+        return SimulationResult(t, y, u, e, i, d, sp)
@@ -0,0 +1,199 @@
+"""Vektoriserad simulering av många PID + Process-slingor samtidigt.
+
+Varje parameter kan vara ett skalärt värde eller en array; alla broadcastas
+mot varandra och varje element blir ett eget scenario. Beräkningarna följer
+exakt PID.step och Process.step i simulation.py (samma begränsning, samma
+villkorliga anti-windup, självreglerande/integrerande, enhetslös K och
+Euler- eller ZOH-diskretisering), men
+stegar alla scenarier i en och samma NumPy-operation.
+
+Exempel - 100x100 inställningsrutnät för Kp och Ti:
+
+    Kp = np.linspace(0.5, 5, 100)[:, None]
+    Ti = np.linspace(2, 50, 100)[None, :]
+    result = BatchSimulation(Kp=Kp, Ti=Ti, Td=1.0, K=2.0, T=15.0, dead_time=3.0,
+                             normalvarde=23.0).run(2000)
+    result.iae  # array med formen (100, 100)
+"""
+import numpy as np
+
+from simulation import Process
+
+
+class BatchResult:
+    """
+    Resultat från BatchSimulation.run(). Inspelade signaler har formen
+    (n_steps+1,) + scenarioformen, IAE/ISE/ITAE har scenarioformen.
+    """
+    def __init__(self, t, signals, iae, ise, itae):
+        self.t = t
+        self.signals = signals
+        self.iae = iae  # Integral av |BV - PV|
+        self.ise = ise  # Integral av (BV - PV)²
+        self.itae = itae  # Integral av t·|BV - PV|
+
+    def __getattr__(self, name):
+        # Gör inspelade signaler åtkomliga som attribut (result.y, result.u, ...)
+        signals = self.__dict__.get('signals', {})
+        if name in signals:
+            return signals[name]
+        raise AttributeError(name)
+
+
+class BatchSimulation:
+    """
+    Stegar ett rutnät av PID + Process-scenarier som NumPy-arrayer.
+    dt är gemensamt för alla scenarier; övriga parametrar broadcastas.
+    """
+    signal_names = ('y', 'u', 'e', 'i', 'd', 'sp')
+
+    def __init__(self, Kp=1.0, Ti=10.0, Td=0.0, K=1.0, T=10.0, dead_time=2.0, setpoint=50.0,
+                 dt=1.0, umin=0.0, umax=100.0, antiwindup=True, integrerande=False, Fout=0.0,
+                 normalvarde=0.0, matområde_min=0.0, matområde_max=100.0, enhetslös_K=False,
+                 discretization='euler'):
+        params = np.broadcast_arrays(
+            *(np.asarray(v, dtype=float) for v in (
+                Kp, Ti, Td, K, T, dead_time, setpoint, umin, umax, antiwindup,
+                integrerande, Fout, normalvarde, matområde_min, matområde_max, enhetslös_K))
+        )
+        self.shape = params[0].shape
+        (self.Kp, self.Ti, self.Td, self.K, T, dead_time, self.setpoint, self.umin, self.umax,
+         antiwindup, integrerande, self.Fout, self.normalvarde, self.matområde_min,
+         self.matområde_max, enhetslös_K) = (p.ravel().copy() for p in params)
+        self.dt = float(dt)
+        if discretization not in Process.discretizations:
+            raise ValueError(f"Okänd diskretisering '{discretization}' - använd {', '.join(Process.discretizations)}")
+        self.zoh = discretization == 'zoh'
+        self.n = self.Kp.size
+        self.antiwindup = antiwindup != 0
+        self.integrerande = integrerande != 0
+        self.enhetslös_K = enhetslös_K != 0
+        # Skydda mot division med noll som i Process.step
+        self.T = np.where(T <= 0, 1e-6, T)
+        # ZOH-faktor a = exp(-dt/T), gemensam för hela körningen
+        self.a = np.exp(-self.dt / self.T) if self.zoh else None
+        # I-del inaktiv när Ti är 0 eller mycket liten, som i PID.step
+        i_on = self.Ti > 0.001
+        self.inv_Ti = np.where(i_on, 1 / np.where(i_on, self.Ti, 1.0), 0.0)
+        self.span = self.matområde_max - self.matområde_min
+
+        # PID-tillstånd
+        self.integral = np.zeros(self.n)
+        self.prev_pv = np.zeros(self.n)
+        # Processtillstånd (startar på normalvärdet)
+        self.y = self.normalvarde.copy()
+        self.current_step = 0
+
+        # Dötidsbuffert: en gemensam skrivposition, individuell fördröjning per scenario
+        delay = np.maximum(0.0, dead_time / self.dt + 1)
+        self.delay_whole = delay.astype(int)
+        self.delay_frac = delay - self.delay_whole
+        self.delay_interp = bool(np.any(self.delay_frac))
+        size = int(self.delay_whole.max(initial=0)) + 2
+        self.delay_buffer = np.zeros((self.n, size))
+        self.delay_pos = 0
+        self.rows = np.arange(self.n)
+
+    def to_percent(self, value_eng):
+        """Vektoriserad Process.to_percent"""
+        with np.errstate(divide='ignore', invalid='ignore'):
+            pct = 100.0 * (value_eng - self.matområde_min) / self.span
+        return np.where(self.span == 0, 0.0, pct)
+
+    def from_percent(self, value_pct):
+        """Vektoriserad Process.from_percent"""
+        return self.matområde_min + self.span * value_pct / 100.0
+
+    def delayed(self, u):
+        """Skriv in u i dötidsbufferten och returnera fördröjd styrsignal per scenario"""
+        buf = self.delay_buffer
+        size = buf.shape[1]
+        pos = self.delay_pos
+        buf[:, pos] = u
+        self.delay_pos = pos + 1 if pos + 1 < size else 0
+        out = buf[self.rows, (pos - self.delay_whole) % size]
+        if self.delay_interp:
+            older = buf[self.rows, (pos - self.delay_whole - 1) % size]
+            out = out + self.delay_frac * (older - out)
+        return out
+
+    def step(self):
+        """Stega alla scenarier ett steg. Returnerar (u, e, integral, derivata)"""
+        dt = self.dt
+        pv = self.y
+        # --- PID.step ---
+        error = self.setpoint - pv
+        integral_candidate = self.integral + error * dt
+        derivative = (pv - self.prev_pv) / dt
+        i_term = self.inv_Ti * integral_candidate
+        u_unclamped = self.Kp * (error + i_term - self.Td * derivative)
+        u = np.maximum(self.umin, np.minimum(self.umax, u_unclamped))
+        # Anti-windup: integrera bara om inte mättad, eller om felet hjälper att komma in i området
+        accept = (((u == self.umin) & (error > 0)) | ((u == self.umax) & (error < 0))
+                  | ((self.umin < u) & (u < self.umax)) | ~self.antiwindup)
+        self.integral = np.where(accept, integral_candidate, self.integral)
+        self.prev_pv = pv
+
+        # --- Process.step ---
+        u_delayed = self.delayed(u)
+        inflow = self.K * u_delayed
+        if self.enhetslös_K.all():
+            y_new = self.step_percent(inflow)
+        else:
+            if self.zoh:
+                self_regulating = self.a * pv + (1 - self.a) * (self.normalvarde + inflow)
+            else:
+                self_regulating = pv + (-(pv - self.normalvarde) + inflow) * dt / self.T
+            y_new = np.where(self.integrerande, pv + (inflow - self.Fout) * dt / self.T, self_regulating)
+            if self.enhetslös_K.any():
+                y_new = np.where(self.enhetslös_K, self.step_percent(inflow), y_new)
+        self.y = y_new
+        self.current_step += 1
+        return u, error, self.integral, derivative
+
+    def step_percent(self, inflow):
+        """Processteg med enhetslös K: räkna i procent av mätområdet"""
+        y_pct = self.to_percent(self.y)
+        nv_pct = self.to_percent(self.normalvarde)
+        if self.zoh:
+            self_regulating = (1 - self.a) * (nv_pct + inflow - y_pct)
+        else:
+            self_regulating = (-(y_pct - nv_pct) + inflow) * self.dt / self.T
+        dy_pct = np.where(self.integrerande, (inflow - self.Fout) * self.dt / self.T, self_regulating)
+        return self.from_percent(y_pct + dy_pct)
+
+    def run(self, n_steps, record=('y', 'u')):
+        """
+        Kör n_steps steg för alla scenarier. `record` anger vilka signaler
+        (y, u, e, i, d, sp) som sparas per steg; IAE/ISE/ITAE beräknas alltid.
+        """
+        n = int(n_steps)
+        unknown = set(record) - set(self.signal_names)
+        if unknown:
+            raise ValueError(f"Okända signaler: {', '.join(sorted(unknown))}")
+        signals = {name: np.empty((n + 1, self.n)) for name in record}
+        start = self.current_step
+        initial = {'y': self.y, 'u': 0.0, 'e': 0.0, 'i': self.integral, 'd': 0.0, 'sp': self.setpoint}
+        for name in record:
+            signals[name][0] = initial[name]
+
+        iae = np.zeros(self.n)
+        ise = np.zeros(self.n)
+        itae = np.zeros(self.n)
+        dt = self.dt
+        for k in range(1, n + 1):
+            u, e, integ, deriv = self.step()
+            # Felintegraler på PV efter steget, som i metrics.step_metrics
+            abs_e = np.abs(self.setpoint - self.y)
+            iae += abs_e * dt
+            ise += abs_e * abs_e * dt
+            itae += (start + k) * dt * abs_e * dt
+            if record:
+                values = {'y': self.y, 'u': u, 'e': e, 'i': integ, 'd': deriv, 'sp': self.setpoint}
+                for name in record:
+                    signals[name][k] = values[name]
+
+        t = (np.arange(n + 1) + start) * dt
+        shape = self.shape
+        signals = {name: arr.reshape((n + 1,) + shape) for name, arr in signals.items()}
+        return BatchResult(t, signals, iae.reshape(shape), ise.reshape(shape), itae.reshape(shape))
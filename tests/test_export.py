@@ -0,0 +1,41 @@
+"""Svensk CSV från export.py jämförd med den tidigare radvisa formateringen"""
+import os
+import sys
+
+import numpy as np
+
+sys.path.insert(0, os.path.join(os.path.dirname(__file__), '..'))
+
+from export import format_block  # noqa: E402
+
+
+def old_format(value, n_decimals):
+    """Formateringen i den tidigare exportloopen: f"{x:.2f}".replace('.', ',')"""
+    return f"{value:.{n_decimals}f}".replace('.', ',')
+
+
+def check(columns, decimals):
+    expected = ''.join(';'.join(old_format(v, n) for v, n in zip(row, decimals)) + '\r\n'
+                       for row in zip(*columns))
+    assert format_block(columns, decimals).decode('utf-8') == expected
+
+
+def test_random_values_with_three_decimals():
+    rng = np.random.default_rng(1)
+    values = np.round(rng.uniform(-200, 200, 200000), 3)
+    check([values, values, values], (1, 2, 0))
+
+
+def test_ties_and_signs():
+    values = np.array([128.95, 2.675, -0.005, 0.125, 0.375, 1289.5, -1289.5, -0.004, -0.0, 0.0, 1.005, 0.5, 1.5, 2.5, -2.5])
+    check([values, values, values], (1, 2, 0))
+
+
+def test_large_finite_values_are_written():
+    values = np.array([1.0, 3e17, -1e300, 12.345])
+    check([values, values], (2, 1))
+
+
+def test_missing_values_are_empty():
+    block = format_block([np.array([np.nan, np.inf, 1.0])], (2,)).decode('utf-8')
+    assert block == '\r\n\r\n1,00\r\n'
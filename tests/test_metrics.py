@@ -0,0 +1,57 @@
+"""StepMetrics.extend i block jämförd med update() sampel för sampel"""
+import os
+import sys
+
+import numpy as np
+
+sys.path.insert(0, os.path.join(os.path.dirname(__file__), '..'))
+
+from metrics import StepMetrics  # noqa: E402
+
+
+def step_response(n, seed):
+    rng = np.random.default_rng(seed)
+    t = np.arange(n) * 0.1
+    y = 50.0 * (1 - np.exp(-t / 8.0) * np.cos(t / 2.0)) + rng.normal(0, 0.2, n)
+    sp = np.full(n, 50.0)
+    sp[n // 2:] = 60.0
+    return t, y, sp
+
+
+def same(a, b):
+    assert a.keys() == b.keys()
+    for key in a:
+        assert a[key] == b[key] or (np.isnan(a[key]) and np.isnan(b[key])), key
+
+
+def check_chunks(t, y, sp, sizes):
+    reference = StepMetrics()
+    chunked = StepMetrics()
+    start = 0
+    for size in sizes:
+        stop = min(start + size, len(y))
+        for k in range(start, stop):
+            reference.update(float(t[k]), float(y[k]), float(sp[k]))
+        chunked.extend(t[start:stop], y[start:stop], sp[start:stop])
+        same(reference.result(), chunked.result())
+        start = stop
+    assert len(chunked) == len(reference)
+
+
+def test_chunked_extend_matches_update():
+    t, y, sp = step_response(5000, 1)
+    check_chunks(t, y, sp, [1, 1, 1, 2, 3, 0, 7, 100, 1, 999, 1500, 2385])
+
+
+def test_random_chunk_sizes():
+    rng = np.random.default_rng(2)
+    for seed in range(5):
+        t, y, sp = step_response(3000, seed)
+        check_chunks(t, y, sp, rng.integers(0, 50, 200))
+
+
+def test_non_finite_samples():
+    t, y, sp = step_response(400, 3)
+    y[[5, 90, 91, 250]] = np.nan
+    y[300] = np.inf
+    check_chunks(t, y, sp, [3, 88, 2, 1, 200, 106])
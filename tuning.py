@@ -0,0 +1,137 @@
+"""Automatisk PID-inställning över den headless simuleringsslingan.
+
+Tuner kör ett stegsvar per parameterpunkt med SimulationEngine (utan GUI)
+och minimerar en konfigurerbar kostnad med Nelder-Mead från scipy.
+Parametrarna optimeras logaritmiskt så att Kp, Ti och Td alltid är
+positiva, och redan beräknade punkter hämtas ur en cache.
+
+    engine = SimulationEngine(Process(K=2, T=15, dead_time=3), PID(Kp=1, Ti=10, Td=0))
+    tuner = Tuner(engine, n_steps=500, cost=TuningCost('itae', overshoot_limit=10))
+    result = tuner.tune()
+    result.params  # {'Kp': ..., 'Ti': ..., 'Td': ...}
+"""
+import copy
+
+import numpy as np
+
+from metrics import step_metrics
+from simulation import PID
+
+PARAMETERS = ('Kp', 'Ti', 'Td')
+
+
+class TuningCost:
+    """
+    Kostnad för ett stegsvar: kriteriet (ITAE, IAE eller ISE), multiplicerat
+    med (1 + overshoot_penalty · antal procentenheter översläng över
+    overshoot_limit), plus effort_weight · styrinsatsen (total variation i u).
+    """
+    criteria = ('itae', 'iae', 'ise')
+
+    def __init__(self, criterion='itae', overshoot_limit=None, overshoot_penalty=1.0, effort_weight=0.0):
+        if criterion not in self.criteria:
+            raise ValueError(f"Okänt kriterium '{criterion}' - använd {', '.join(self.criteria)}")
+        self.criterion = criterion
+        self.overshoot_limit = overshoot_limit  # Högsta tillåtna översläng i % (None = ingen gräns)
+        self.overshoot_penalty = overshoot_penalty
+        self.effort_weight = effort_weight
+
+    def __call__(self, metrics, u):
+        cost = metrics[self.criterion]
+        if self.overshoot_limit is not None:
+            excess = metrics['overshoot_pct'] - self.overshoot_limit
+            if excess > 0:
+                cost *= 1 + self.overshoot_penalty * excess
+        if self.effort_weight:
+            cost += self.effort_weight * float(np.sum(np.abs(np.diff(u))))
+        return cost
+
+
+class TuningResult:
+    """Bästa parametrar, deras kostnad och prestandamått samt optimeringsstatistik"""
+    def __init__(self, params, cost, metrics, evaluations, iterations, success, message):
+        self.params = params
+        self.cost = cost
+        self.metrics = metrics
+        self.evaluations = evaluations  # Antal simuleringar (cacheträffar räknas inte)
+        self.iterations = iterations
+        self.success = success
+        self.message = message
+
+    def as_dict(self):
+        return dict(self.__dict__)
+
+
+class Tuner:
+    """
+    Optimerar valda PID-parametrar (tune) för mallens reglerkrets. Mallen
+    kopieras och återställs; brus och pulsstörningar stängs av så att
+    kostnaden är deterministisk.
+    """
+    def __init__(self, template, n_steps=500, cost=None, tune=PARAMETERS):
+        if not isinstance(template.controller, PID):
+            raise ValueError("Autotrimning kräver en PID-regulator")
+        unknown = set(tune) - set(PARAMETERS)
+        if unknown or not tune:
+            raise ValueError(f"Okända parametrar: {', '.join(sorted(unknown))}" if unknown
+                             else "Ange minst en parameter att trimma")
+        self.template = copy.deepcopy(template)
+        self.template.reset()
+        self.template.noise_std = 0.0
+        self.template.cancel_pulse()
+        self.n_steps = int(n_steps)
+        self.cost = cost if cost is not None else TuningCost()
+        self.tune_names = tuple(name for name in PARAMETERS if name in tune)
+        self.cache = {}  # (Kp, Ti, Td) avrundade till 6 värdesiffror -> (kostnad, prestandamått)
+        self.evaluations = 0
+
+    def evaluate(self, Kp, Ti, Td):
+        """Kostnad och prestandamått för en parameterpunkt (cachad)"""
+        key = tuple(float(f"{v:.6g}") for v in (Kp, Ti, Td))
+        if key in self.cache:
+            return self.cache[key]
+        engine = copy.deepcopy(self.template)
+        pid = engine.controller
+        pid.Kp, pid.Ti, pid.Td = key
+        with np.errstate(all='ignore'):
+            result = engine.run(self.n_steps)
+            metrics = step_metrics(result.t, result.y, result.sp)
+            cost = float(self.cost(metrics, result.u))
+        if not np.isfinite(cost):
+            cost = np.inf  # Instabil krets
+        self.cache[key] = (cost, metrics)
+        self.evaluations += 1
+        return self.cache[key]
+
+    def tune(self, x0=None, max_evaluations=400, tolerance=1e-3):
+        """
+        Minimera kostnaden med Nelder-Mead med start i x0 (dict med Kp/Ti/Td,
+        standard är mallens värden). tolerance är relativ, både för
+        parametrarna och för kostnaden.
+        """
+        from scipy.optimize import minimize  # scipy laddas först när den behövs
+
+        pid = self.template.controller
+        base = {'Kp': pid.Kp, 'Ti': pid.Ti, 'Td': pid.Td}
+        base.update(x0 or {})
+        # Startvärden måste vara positiva för den logaritmiska skalan
+        ti_start = base['Ti'] if base['Ti'] > 0 else max(self.template.process.T, 1.0)
+        fallback = {'Kp': 1.0, 'Ti': ti_start, 'Td': 0.25 * ti_start}
+        z0 = np.log([base[name] if base[name] > 0 else fallback[name] for name in self.tune_names])
+
+        def params_of(z):
+            params = dict(base)
+            params.update(zip(self.tune_names, np.exp(z).tolist()))
+            return params
+
+        def objective(z):
+            return self.evaluate(**params_of(z))[0]
+
+        cost0 = objective(z0)
+        fatol = tolerance * abs(cost0) if np.isfinite(cost0) else tolerance
+        res = minimize(objective, z0, method='Nelder-Mead',
+                       options={'maxfev': max_evaluations, 'xatol': tolerance, 'fatol': fatol})
+        params = {name: float(f"{v:.6g}") for name, v in params_of(res.x).items()}
+        cost, metrics = self.evaluate(**params)
+        return TuningResult(params, cost, metrics, self.evaluations, int(res.nit),
+                            bool(res.success), str(res.message))
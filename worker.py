@@ -0,0 +1,232 @@
+"""Simuleringsloopen i en egen tråd.
+
+SimulationWorker stegar en SimulationEngine i en bakgrundstråd och lägger
+resultatet som block (Batch) i en kö som GUI:t tömmer med sin egen timer,
+så att gränssnittet är följsamt oavsett simuleringstakt. Kör, paus, enstaka
+steg och återställning skickas som kommandon till tråden och utförs mellan
+två block i den ordning de skickades.
+
+Blockkön är en collections.deque (append och popleft är trådsäkra utan
+lås). Hinner GUI:t inte tömma den väntar tråden istället för att kön växer.
+Motorn får bara ändras av andra trådar medan worker.lock hålls - tråden
+håller låset medan den räknar ett block.
+
+    worker = SimulationWorker(engine)
+    worker.run(interval=0.0)        # 0 = så fort som möjligt
+    for batch in worker.drain():    # från GUI:ts timer
+        history.extend(batch.rows)
+    worker.pause()
+    worker.stop()
+"""
+import collections
+import queue
+import threading
+import time
+
+import numpy as np
+
+from history import History
+
+AUTOPAUSE_WINDOW = 20  # Steg som ärvärdet ska ha legat stilla för automatisk paus
+
+
+class Batch:
+    """
+    Ett block sampel från tråden: rader i History.fields-ordning (saknade
+    I/D som NaN), stegnumret efter blocket, senaste stegets (PV före steget,
+    utsignal, fel, integral, derivata) och en eventuell stopphändelse
+    ('unstable', 'done' eller 'autopause') med PV när den inträffade.
+    sequence är antalet kommandon tråden tagit emot när blocket räknades och
+    elapsed tiden (s) som stegningen tog.
+    """
+    def __init__(self, generation, sequence, rows, step, last, event=None, pv=None, elapsed=0.0):
+        self.generation = generation
+        self.sequence = sequence
+        self.rows = rows
+        self.step = step
+        self.last = last
+        self.event = event
+        self.pv = pv
+        self.elapsed = elapsed
+
+
+class SimulationWorker:
+    """Kör en SimulationEngine i en bakgrundstråd och levererar sampel i block"""
+    def __init__(self, engine, batch_time=0.005, max_batches=64):
+        self.engine = engine
+        self.lock = threading.RLock()
+        self.commands = queue.Queue()
+        self.batches = collections.deque()
+        self.batch_time = batch_time  # Beräkningstid per block i maxläge (s)
+        self.max_batches = max_batches  # Fler ohämtade block än så - tråden väntar
+        self.batch_steps = 10  # Steg per block i maxläge (anpassas efter beräkningstiden)
+        # Inställningar (ändras med configure)
+        self.interval = 0.3  # Sekunder per steg, 0 = så fort som möjligt
+        self.max_steps = None  # Stoppa efter så många steg (None = oändligt)
+        self.pv_limits = None  # (min, max) för PV innan simuleringen räknas som instabil
+        self.autopause = False
+        self.record_i = True  # Spara I-/D-värden (annars NaN)
+        self.record_d = True
+        # Trådens tillstånd
+        self.running = False
+        self.step_count = 0
+        self.recent = collections.deque(maxlen=AUTOPAUSE_WINDOW)  # Senaste (PV, börvärde)
+        self.generation = 0  # Ökas vid återställning; äldre block kastas i drain()
+        self._generation = 0  # Generationen som tråden räknar på
+        self.requested = 0  # Skickade kommandon (GUI-tråden)
+        self.received = 0  # Mottagna kommandon (tråden)
+        self.handled = 0  # Utförda kommandon (tråden)
+        self.thread = threading.Thread(target=self._loop, name='simulering', daemon=True)
+        self.thread.start()
+
+    @property
+    def busy(self):
+        """Om tråden kör eller har kommandon kvar att utföra"""
+        return self.running or self.handled < self.requested
+
+    def configure(self, **settings):
+        """Ändra inställningar (interval, max_steps, pv_limits, autopause, record_i, record_d)"""
+        with self.lock:
+            for name, value in settings.items():
+                if not hasattr(self, name):
+                    raise AttributeError(f"Okänd inställning '{name}'")
+                setattr(self, name, value)
+
+    def _send(self, command, *args):
+        self.requested += 1
+        self.commands.put((command, args))
+
+    def run(self, interval=None):
+        """Kör kontinuerligt (första steget direkt, utan automatisk paus)"""
+        self._send('run', interval)
+
+    def pause(self):
+        self._send('pause')
+
+    def step(self):
+        """Pausa och räkna ett enda steg"""
+        self._send('step')
+
+    def reset(self, engine):
+        """Pausa och börja om med en ny motor från steg 0. Ej hämtade block kastas"""
+        self.generation += 1
+        self._send('reset', engine, self.generation)
+
+    def stop(self, timeout=1.0):
+        """Avsluta tråden"""
+        self.commands.put(('stop', ()))
+        self.thread.join(timeout)
+
+    def drain(self):
+        """Hämta alla färdiga block för aktuell generation (anropas från GUI-tråden)"""
+        batches = []
+        while self.batches:
+            batch = self.batches.popleft()
+            if batch.generation == self.generation:
+                batches.append(batch)
+        return batches
+
+    def _loop(self):
+        next_step = time.perf_counter()
+        while True:
+            if not self.running:
+                timeout = None  # Vänta på nästa kommando
+            elif len(self.batches) >= self.max_batches:
+                timeout = 0.005  # GUI:t ligger efter
+            else:
+                timeout = max(0.0, next_step - time.perf_counter())
+            try:
+                command, args = self.commands.get(timeout=timeout) if timeout != 0 else self.commands.get_nowait()
+            except queue.Empty:
+                command = None
+            if command == 'stop':
+                return
+            if command is not None:
+                self.received += 1
+                self._handle(command, args)
+                next_step = time.perf_counter() + self.interval
+                self.handled += 1
+                continue
+            if not self.running or len(self.batches) >= self.max_batches:
+                continue
+            if self.interval > 0:
+                next_step += self.interval
+                # Släpa inte efter med en skur av steg om en enstaka väntan blev lång
+                next_step = max(next_step, time.perf_counter())
+                self._step_block(1)
+            else:
+                started = time.perf_counter()
+                done = self._step_block(self.batch_steps)
+                elapsed = time.perf_counter() - started
+                if done and elapsed > 0:
+                    self.batch_steps = int(min(100000, max(1, self.batch_time * done / elapsed)))
+                next_step = time.perf_counter()
+
+    def _handle(self, command, args):
+        if command == 'run':
+            if args[0] is not None:
+                self.interval = args[0]
+            self.running = True
+            self._step_block(1, ignore_autopause=True)
+        elif command == 'pause':
+            self.running = False
+        elif command == 'step':
+            self.running = False
+            self._step_block(1, ignore_autopause=True)
+        elif command == 'reset':
+            with self.lock:
+                self.engine, self._generation = args
+                self.running = False
+                self.step_count = 0
+                self.recent.clear()
+
+    def _check(self, pv, ignore_autopause):
+        """Stoppvillkor före ett steg. Returnerar händelsen eller None"""
+        if self.pv_limits is not None and (pv < self.pv_limits[0] or pv > self.pv_limits[1]):
+            return 'unstable'
+        if self.max_steps is not None and self.step_count >= self.max_steps:
+            return 'done'
+        if self.autopause and not ignore_autopause and self.step_count >= AUTOPAUSE_WINDOW:
+            # Automatisk paus om ärvärdet varit inom ±5% av börvärdet eller stabilt
+            y, sp = np.array(self.recent).T
+            within_5 = np.abs(y - sp) <= 0.05 * np.abs(sp)
+            sp_ref = np.abs(sp[0]) if np.abs(sp[0]) > 0 else 1.0
+            stable = (np.max(y) - np.min(y)) < max(0.01 * sp_ref, 0.5)
+            if np.all(within_5) or stable:
+                return 'autopause'
+        return None
+
+    def _step_block(self, n_steps, ignore_autopause=False):
+        """Räkna upp till n_steps steg och lägg blocket i kön. Returnerar antal steg"""
+        rows = []
+        last = None
+        event = None
+        nan = float('nan')
+        started = time.perf_counter()
+        with self.lock:
+            engine = self.engine
+            process = engine.process
+            record_i = self.record_i
+            record_d = self.record_d
+            for _ in range(n_steps):
+                pv = process.y
+                event = self._check(pv, ignore_autopause)
+                if event is not None:
+                    break
+                ctrl, err, integ, deriv = engine.step()
+                self.step_count += 1
+                y = process.y
+                sp = engine.setpoint
+                rows.append((self.step_count * engine.dt, y, ctrl, err,
+                             integ if record_i else nan, deriv if record_d else nan, sp))
+                self.recent.append((y, sp))
+                last = (pv, ctrl, err, integ, deriv)
+            pv = process.y
+        elapsed = time.perf_counter() - started
+        if rows or event is not None:
+            rows = np.array(rows, dtype=float).reshape(-1, len(History.fields))
+            self.batches.append(Batch(self._generation, self.received, rows, self.step_count, last, event, pv, elapsed))
+        if event is not None:
+            # Först efter blocket ligger i kön - GUI:t slutar hämta när tråden inte längre är upptagen
+            self.running = False
+        return len(rows)